@@ -7,5 +7,8 @@ set -e  # Exit immediately if a command exits with a non-zero status
 python manage.py makemigrations api --noinput
 python manage.py migrate api --noinput
 
+# Collect static files for WhiteNoise (the ASGI server does not serve them itself)
+python manage.py collectstatic --noinput
+
 # Execute the command passed as arguments (CMD in Dockerfile)
 exec "$@"
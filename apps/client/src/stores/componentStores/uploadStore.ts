@@ -320,7 +320,7 @@ export const useUploadStore = defineStore('uploadStore', () => {
                 try {
                     const processResponse = await loonAxios.process(
                         fieldValue,
-                        'live_cyte',
+                        currentWorkflowConfig.value.code,
                         fileType,
                         fileToUpload.file.name,
                         locationIndex.toString(),
@@ -29,6 +29,8 @@ export interface ExperimentMetadata {
     // can precompute min/max for each column across experiments
     locationMetadataList: LocationMetadata[];
     compositeTabularDataFilename?: string;
+    // one row per track: duration, displacement, speed, mass growth, division time
+    trackSummaryFilename?: string;
     // how the segmentation files are saved
     // split by cell (default), split by frame
     segmentationGrouping?: SegmentationGroupingOptions;
@@ -1,4 +1,4 @@
-import { ref, computed } from 'vue';
+import { ref, computed, watch } from 'vue';
 import { defineStore } from 'pinia';
 import {
     useCellMetaData,
@@ -9,6 +9,17 @@ import { useDatasetSelectionStore } from '@/stores/dataStores/datasetSelectionUn
 import type { Feature, FeatureCollection } from 'geojson';
 import { LRUCache } from 'lru-cache';
 import { useConfigStore } from '../misc/configStore';
+import { unpackSegmentations } from '@/util/segmentationDecoding';
+
+/**
+ * Level of detail of the cell segmentations, listed in the segmentations folder's lod.json.
+ * Cells of a level are simplified to within `tolerance` image pixels of the full outline.
+ */
+export interface SegmentationLevel {
+    level: number;
+    tolerance: number;
+    folder: string;
+}
 
 /**
  * Custom store for managing segmentations.
@@ -27,18 +38,24 @@ export const useSegmentationStore = defineStore('segmentationStore', () => {
             max: filesGroupedByFrame.value ? 500 : 25_000,
             // each item is small (1-2 KB)
             fetchMethod: async (jsonUrl, staleValue, { signal }) => {
-                return (await fetch(jsonUrl, { signal }).then((res) =>
+                const data = (await fetch(jsonUrl, { signal }).then((res) =>
                     res.json()
                 )) as Feature | FeatureCollection;
+                // Cells may be stored with packed coordinates
+                return unpackSegmentations(data);
             },
         })
     );
     /**
      * Get segmentations for a specific frame.
      * @param frame - The frame number, not the index, so the this is 1-based.
+     * @param level - Level of detail to fetch, see levelForZoom. 0 is full resolution.
      * @returns An array of GeoJson features representing the segmentations.
      */
-    async function getFrameSegmentations(frame: number): Promise<Feature[]> {
+    async function getFrameSegmentations(
+        frame: number,
+        level = 0
+    ): Promise<Feature[]> {
         if (filesGroupedByFrame.value) {
             const featureCollection = (await cache.value.fetch(
                 `${segmentationFolderUrl.value}/${frame}.json`
@@ -47,7 +64,7 @@ export const useSegmentationStore = defineStore('segmentationStore', () => {
         }
         const cells = cellMetaData.frameMap.get(frame);
         if (!cells) return [];
-        const promises = cells.map((cell) => getCellSegmentation(cell));
+        const promises = cells.map((cell) => getCellSegmentation(cell, level));
         return (await Promise.all(promises)).filter(
             (x) => x != null
         ) as Feature[];
@@ -66,6 +83,49 @@ export const useSegmentationStore = defineStore('segmentationStore', () => {
         return url;
     });
 
+    // Levels of detail of the current location. Only cell files have levels, and datasets
+    // without a lod.json only have the full resolution.
+    const levels = ref<SegmentationLevel[]>([]);
+    watch(
+        [segmentationFolderUrl, filesGroupedByFrame],
+        async ([folderUrl, groupedByFrame]) => {
+            levels.value = [];
+            if (folderUrl === '' || groupedByFrame) return;
+            try {
+                const response = await fetch(`${folderUrl}/lod.json`);
+                if (!response.ok) return;
+                const index = (await response.json()) as {
+                    levels: SegmentationLevel[];
+                };
+                if (folderUrl !== segmentationFolderUrl.value) return;
+                levels.value = index.levels;
+            } catch (error) {
+                console.warn('No segmentation levels of detail', error);
+            }
+        },
+        { immediate: true }
+    );
+
+    /**
+     * Coarsest level whose simplification is still under a screen pixel at this zoom.
+     * @param zoom - Orthographic view zoom, 2^zoom screen pixels per image pixel.
+     * @returns The level to pass to getFrameSegmentations.
+     */
+    function levelForZoom(zoom: number): number {
+        const imagePixelsPerScreenPixel = 2 ** -zoom;
+        let best = 0;
+        for (const { level, tolerance } of levels.value) {
+            if (tolerance <= imagePixelsPerScreenPixel) best = level;
+        }
+        return best;
+    }
+
+    function cellsFolderUrl(level: number): string {
+        const folder =
+            levels.value.find((l) => l.level === level)?.folder ?? 'cells';
+        return `${segmentationFolderUrl.value}/${folder}`;
+    }
+
     // Based on the frame, the id, and the location, return the feature (segmentation)
     async function getCellLocationSegmentation(frame: string, trackId: string, location: string): Promise<Feature | undefined> {
         const locationSegmentationUrl = configStore.getFileUrl(datasetSelectionStore.getLocationMetadata(location)?.segmentationsFolder || '');
@@ -85,10 +145,12 @@ export const useSegmentationStore = defineStore('segmentationStore', () => {
     /**
      * Get segmentations for a specific cell.
      * @param cell - The cell object.
+     * @param level - Level of detail to fetch. 0 is full resolution.
      * @returns A GeoJson feature representing the segmentation.
      */
     async function getCellSegmentation(
-        cell: Cell
+        cell: Cell,
+        level = 0
     ): Promise<Feature | undefined> {
         const frame = cellMetaData.getFrame(cell);
         const id = cell.trackId;
@@ -101,7 +163,7 @@ export const useSegmentationStore = defineStore('segmentationStore', () => {
             );
         }
         return (await cache.value.fetch(
-            `${segmentationFolderUrl.value}/cells/${frame}-${id}.json`
+            `${cellsFolderUrl(level)}/${frame}-${id}.json`
         )) as Feature;
     }
 
@@ -116,6 +178,7 @@ export const useSegmentationStore = defineStore('segmentationStore', () => {
 
     return {
         getFrameSegmentations,
+        levelForZoom,
         getCellLocationSegmentation,
         getCellSegmentation,
         getCellSegmentations,
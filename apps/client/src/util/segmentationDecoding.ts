@@ -0,0 +1,59 @@
+import type { Feature, FeatureCollection, Position } from 'geojson';
+
+// Outline written by the server's "packed" segmentation encoding
+// (see apps/server/api/processing_callbacks/encoding.py): unsigned integer offsets from
+// `origin`, the minimum x and y of the ring itself (not the feature's bbox, which a simplified
+// level of detail keeps from the full outline), interleaved x, y and base64 encoded. The ring
+// is not closed.
+interface PackedPolygon {
+    type: 'Polygon';
+    origin: [number, number];
+    dtype: 'uint8' | 'uint16';
+    coordinates: string;
+}
+
+type MaybePackedFeature = Feature & { packed?: PackedPolygon };
+
+/**
+ * Replaces packed outlines with GeoJSON polygons, in place. Plain GeoJSON is returned as is.
+ * @param data - A cell feature or a frame's feature collection as fetched.
+ * @returns The same object, with every feature holding a GeoJSON geometry.
+ */
+export function unpackSegmentations(
+    data: Feature | FeatureCollection
+): Feature | FeatureCollection {
+    if (data.type === 'FeatureCollection') {
+        data.features.forEach(unpackFeature);
+    } else {
+        unpackFeature(data);
+    }
+    return data;
+}
+
+function unpackFeature(feature: MaybePackedFeature): void {
+    const packed = feature.packed;
+    if (packed == null) return;
+    const offsets = decodeOffsets(packed);
+    const [originX, originY] = packed.origin;
+    // A truncated payload (odd number of values) drops its incomplete last vertex.
+    const vertexCount = Math.floor(offsets.length / 2);
+    const ring: Position[] = new Array(vertexCount + 1);
+    for (let i = 0; i < vertexCount; i++) {
+        ring[i] = [originX + offsets[2 * i], originY + offsets[2 * i + 1]];
+    }
+    ring[vertexCount] = ring[0]; // close the loop
+    feature.geometry = { type: 'Polygon', coordinates: [ring] };
+    delete feature.packed;
+}
+
+function decodeOffsets(packed: PackedPolygon): Uint8Array | Uint16Array {
+    const binary = atob(packed.coordinates);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    if (packed.dtype === 'uint8') return bytes;
+    // uint16 offsets are little-endian, like every platform browsers run on. An odd trailing
+    // byte cannot form a value and is ignored.
+    return new Uint16Array(bytes.buffer, 0, Math.floor(bytes.length / 2));
+}
@@ -35,21 +35,38 @@ Outputs:
 - A metadata.parquet file with metadata for Loon
 - A segmentations folder with geojson files for each frame
 
+Usage:
+- python convert_trackmate.py
+    Opens the user interface.
+- python convert_trackmate.py batch <input_folder> <output_folder> [--jobs N] [--roi-workers N]
+    Headless batch conversion, for machines without a display. Converts every location
+    sub-folder in parallel and prints progress as one JSON object per line.
+
 """
 
 import os
-import tkinter as tk
-from tkinter import filedialog, messagebox
+import argparse
 import fnmatch
+import itertools
 from matlab_to_all import QUIET_MODE
 import util_common as util
 from roifile import ImagejRoi
 from geojson import Feature, Polygon, FeatureCollection, dumps
 from typing import Union, List
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import json
 import re
 import sys
 import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# util's console output functions, restored in worker processes (see init_worker).
+UTIL_MSG = util.msg
+UTIL_MSG_HEADER = util.msg_header
 
 
 QUIET_MODE = False
@@ -66,19 +83,24 @@ location = "location"
 # New track ID column
 loon_track = "loon_track"
 
-def main(csv_filename, roi_folder, output_folder, metadata_csv=None, metadata_parquet=None, segmentations_folder=None):
-    # load csv into df
-    df = pd.read_csv(csv_filename)
-
-    # delete extra rows with metadata
-    df = df.drop([0, 1, 2])
-    # df = df.infer_objects() # this made everything an object, but I would've expected this to work
-
-    # reload and clean up temporary file.
-    temp_csv = os.path.join(output_folder, "temp.csv")
-    df.to_csv(temp_csv, index=False)
-    df = pd.read_csv(temp_csv)
-    os.remove(temp_csv)  # Clean up the temporary file
+# TrackMate spot tables have three more header rows (name, short name, units) under the
+# column names.
+TRACKMATE_HEADER_ROWS = 3
+
+# Types of the columns TrackMate always exports that are always integers (or text), so they
+# are parsed once with the right type. The other columns are inferred: an explicit float type
+# would write integer-valued columns such as TRACK_ID, POSITION_Z or RADIUS as "0.0" instead
+# of "0".
+TRACKMATE_DTYPES = {
+    "LABEL": "string",
+    "ID": "int64",
+    "FRAME": "int64",
+    "VISIBILITY": "int64",
+}
+
+def main(csv_filename, roi_folder, output_folder, metadata_csv=None, metadata_parquet=None, segmentations_folder=None, workers=None):
+    # load csv into df, skipping the extra rows with metadata
+    df = read_trackmate_csv(csv_filename)
 
     # sort by frame
     # convert frame to int
@@ -125,28 +147,42 @@ def main(csv_filename, roi_folder, output_folder, metadata_csv=None, metadata_pa
     df = infer_parent_from_id(df, output_csv_filename)
 
     geojson_output_folder = segmentations_folder if segmentations_folder else os.path.join(output_folder, "segmentations")
-    roi_to_geojson(df, roi_folder, geojson_output_folder)
+    roi_to_geojson(df, roi_folder, geojson_output_folder, workers)
 
     parquet_path = metadata_parquet if metadata_parquet else os.path.join(output_folder, "metadata.parquet")
     df.to_parquet(parquet_path, index=False)
 
     return
 
+# Reads a TrackMate spot table in a single pass: the extra header rows are skipped while
+# parsing and the known columns get explicit types.
+# engine="pyarrow" parses with Arrow's multithreaded reader; engine="c" uses pandas, and can
+# parse in chunks of `chunksize` rows to bound the parser's memory.
+def read_trackmate_csv(csv_filename, engine="pyarrow", chunksize=None):
+    if engine == "pyarrow" and chunksize is None:
+        table = pa_csv.read_csv(
+            csv_filename,
+            read_options=pa_csv.ReadOptions(skip_rows_after_names=TRACKMATE_HEADER_ROWS),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={name: pa.type_for_alias(dtype) for name, dtype in TRACKMATE_DTYPES.items()}
+            ),
+        )
+        return table.to_pandas()
+
+    reader = pd.read_csv(
+        csv_filename,
+        skiprows=range(1, TRACKMATE_HEADER_ROWS + 1),
+        dtype=TRACKMATE_DTYPES,
+        chunksize=chunksize,
+    )
+    if chunksize is None:
+        return reader
+    return pd.concat(reader, ignore_index=True)
+
 # Given a dataframe with a track label column, create a parent column by infering parent values from labels.
 def infer_parent_from_id(df, output_csv):
     # Add a new column 'parent' based on the 'LABEL' column
-    def calculate_parent(child_label):
-        if isinstance(child_label, str):
-            if "." not in child_label:
-                return child_label
-            parent = child_label[:-1].rstrip(".")
-            # check if parent exists in the LABEL column
-            if parent not in df[label].values:
-                # If parent does not exist, return the original label
-                return child_label
-        return parent
-
-    df["parent"] = df[label].apply(calculate_parent)
+    df["parent"] = infer_parents(df[label])
     # Reorder columns so 'parent' is the second column
     cols = list(df.columns)
     cols.insert(1, cols.pop(cols.index("parent")))
@@ -157,14 +193,27 @@ def infer_parent_from_id(df, output_csv):
     df.to_csv(output_csv, index=False)
     return df
 
+# Given a series of labels, return the parent of each one. A branch label drops its last
+# character (and the '.' before it): "Track_1.ab" -> "Track_1.a", "Track_1.a" -> "Track_1".
+# Labels without a branch, or whose parent is not in the table, are their own parent.
+# Vectorized string operations plus a hash-set lookup keep this linear in the number of rows.
+def infer_parents(labels: pd.Series) -> pd.Series:
+    known_labels = set(labels.dropna())
+    candidates = labels.str[:-1].str.rstrip(".")
+    is_branch = labels.str.contains(".", regex=False).fillna(False).astype(bool)
+    parent_exists = candidates.isin(known_labels)
+    return labels.where(~(is_branch & parent_exists), candidates)
 
 ######################
 
 # Given a folder of ROI files and a dataframe, outputs a folder of GeoJson files
-def roi_to_geojson(df, roi_folder, output_folder):
+def roi_to_geojson(df, roi_folder, output_folder, workers=None):
     util.ensure_directory_exists(output_folder)
     util.msg_header("Finding ROI files", QUIET_MODE)
 
+    # Frames of every track, looked up once per ROI file instead of filtering df each time.
+    frame_index = build_frame_index(df)
+
     pattern = "Track_*.roi"
     filename_list = []
     # Recursively searches for roi files matching 'pattern'
@@ -174,10 +223,10 @@ def roi_to_geojson(df, roi_folder, output_folder):
             filename_list.append((path, name))
 
     # Sort the ROI filenames by folder, frame number, and track ID.
-    filename_list.sort(key=lambda f: (f[0], parse_frame(f[1], df), parse_id(f[1])))
+    filename_list.sort(key=lambda f: (f[0], parse_frame(f[1], frame_index), parse_id(f[1])))
 
     # Log the number of files found
-    filename_stats = get_filename_stats(filename_list, df)
+    filename_stats = get_filename_stats(filename_list, frame_index)
     # Only print high-level status
     util.msg(
         "        ████████████████████ 100.00%, {} of {} files. {} of {} frames.".format(
@@ -188,18 +237,16 @@ def roi_to_geojson(df, roi_folder, output_folder):
     )
 
 
-    feature_list = []
-    last_frame = -1
-    last_path = ""
-    file_count = 0
-    folder_count = 0
-
-    # For each ROI file ... 
-    for path, name in filename_list:
+    # Split the work into (folder, frame) units so frames can be converted in parallel.
+    work_units = partition_roi_files(filename_list, frame_index)
 
-        # 
-        frame = parse_frame(name, df)
+    last_path = None
+    folder_count = 0
+    feature_list = []
 
+    # Units come back in submission order, so frames are still exported in order and the
+    # chunks of a large frame are merged back into one FeatureCollection.
+    for i, (path, frame, features) in enumerate(convert_roi_units(roi_folder, output_folder, work_units, workers)):
         # Check if we're in a new folder; if so, update folder count and print a header.
         if path != last_path:
             folder_count += 1
@@ -211,22 +258,57 @@ def roi_to_geojson(df, roi_folder, output_folder):
                 ),
                 QUIET_MODE,
             )
-            file_count = 0
-        file_count += 1
-
-        # When a new frame is encountered, export the collected features for the previous frame.
-        if last_frame != frame and last_frame != -1:
-            export(
-                feature_list,
-                os.path.join(output_folder, last_path, "frames"),
-                str(last_frame),
-            )
+        last_path = path
+
+        feature_list.extend(features)
+        # Export the frame's FeatureCollection once its last unit has been merged.
+        next_unit = work_units[i + 1] if i + 1 < len(work_units) else None
+        if next_unit is None or next_unit[:2] != (path, frame):
+            export(feature_list, os.path.join(output_folder, path, "frames"), str(frame))
             feature_list = []
 
-        # Update the last processed frame and folder path trackers.
-        last_frame = frame
-        last_path = path
+    # Finalize the output by returning carriage and printing the completion message.
+    util.return_carriage(QUIET_MODE)
+    util.return_carriage(QUIET_MODE)
+    util.msg_header("Done 🥂", QUIET_MODE)
+    return
 
+
+# Groups the sorted ROI files into (path, frame, names) units, one per frame, splitting
+# frames with more than max_files files into several consecutive units.
+def partition_roi_files(filename_list: List, frame_index: dict, max_files: int = 500) -> List:
+    work_units = []
+    for (path, frame), files in itertools.groupby(filename_list, key=lambda f: (f[0], parse_frame(f[1], frame_index))):
+        names = [name for _, name in files]
+        for start in range(0, len(names), max_files):
+            work_units.append((path, frame, names[start:start + max_files]))
+    return work_units
+
+
+# Yields (path, frame, features) for each unit, in order. Runs in a process pool unless
+# only one worker is requested.
+def convert_roi_units(roi_folder, output_folder, work_units: List, workers: int = None):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(work_units) <= 1:
+        for unit in work_units:
+            yield convert_roi_unit(roi_folder, output_folder, unit)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(
+            convert_roi_unit,
+            itertools.repeat(roi_folder),
+            itertools.repeat(output_folder),
+            work_units,
+        )
+
+
+# Worker: reads and converts one unit of ROI files, writes their cell files in one batch and
+# returns the features for the parent to merge into the frame's FeatureCollection.
+def convert_roi_unit(roi_folder, output_folder, unit):
+    path, frame, names = unit
+    features = []
+    cells = []
+    for name in names:
         # Construct the full path to the ROI file and parse its cell ID.
         filename = os.path.join(roi_folder, path, name)
         cell_id = parse_id(name)
@@ -241,32 +323,23 @@ def roi_to_geojson(df, roi_folder, output_folder):
             properties={"id": cell_id, "frame": frame},
             bbox=[roi.left, roi.bottom, roi.right, roi.top],
         )
-        # Export the individual cell feature into the corresponding folder.
         # Export in format frame-cell_id
         # Example: 26-73_Track_965.b.json
-        export(
-            feature,
-            os.path.join(output_folder, last_path, "cells"),
-            "{}-{}".format(str(frame), cell_id),
-        )
-        feature_list.append(feature)
-    # Export any remaining features for the last processed frame.
-    export(
-        feature_list, os.path.join(output_folder, last_path, "frames"), str(last_frame)
-    )
+        cells.append(("{}-{}".format(str(frame), cell_id), feature_to_json(feature)))
+        features.append(feature)
 
-    # Finalize the output by returning carriage and printing the completion message.
-    util.return_carriage(QUIET_MODE)
-    util.return_carriage(QUIET_MODE)
-    util.msg_header("Done 🥂", QUIET_MODE)
-    return
+    # Export the individual cell features into the corresponding folder.
+    cells_folder = os.path.join(output_folder, path, "cells")
+    for cell_name, data in cells:
+        util.export_file(data, cells_folder, cell_name, OVERWRITE)
+    return path, frame, features
 
 
 # Returns the count and frames of filenames.
-def get_filename_stats(filename_list: List, df) -> dict:
+def get_filename_stats(filename_list: List, frame_index: dict) -> dict:
     filename_stats = {}
     for path, name in filename_list:
-        frame = parse_frame(name, df)
+        frame = parse_frame(name, frame_index)
         if path not in filename_stats:
             filename_stats[path] = {"count": 0, "frames": 0}
         filename_stats[path]["count"] += 1
@@ -293,8 +366,17 @@ def export(data: Union[Feature, List], full_path: str, name: str):
     util.export_file(data, full_path, name, OVERWRITE)
     return
 
-# Given a filename and df, extract unique frame number.
-def parse_frame(filename: str, df) -> int:
+# Given a df, map each track label to its frames in ascending order.
+# Built with a single sort and groupby, so looking up a ROI file's frame is O(1).
+def build_frame_index(df) -> dict:
+    track_frames = df[[inputLabel, frame]].sort_values(by=[inputLabel, frame], kind="mergesort")
+    return {
+        track_id: frames.to_numpy()
+        for track_id, frames in track_frames.groupby(inputLabel, sort=False)[frame]
+    }
+
+# Given a filename and the frame index, extract unique frame number.
+def parse_frame(filename: str, frame_index: dict) -> int:
     # Remove file extension from filename
     name_base = os.path.splitext(filename)[0]
     # Get the track ID and cell index from the name_base
@@ -302,11 +384,8 @@ def parse_frame(filename: str, df) -> int:
         name_base = name_base + "-0" 
     track_id, cell_index = name_base.split("-")
 
-    # Find the track based on track id, sort by frame
-    track = df.loc[df[inputLabel] == track_id]
-    track = track.sort_values(by=[frame])
     # Find the nth (cell_index) frame for this track
-    track_frame = track.iloc[int(cell_index)][frame]
+    track_frame = frame_index[track_id][int(cell_index)]
     
     return int(track_frame)
 
@@ -324,8 +403,160 @@ def parse_id(filename: str) -> int:
     return final_cell_id
 
 
+######################
+
+# Returns (name, csv_file, roi_folder) for every location sub-folder of input_folder.
+# Each sub-folder needs a CSV file and a folder with 'roi' in its name.
+def find_locations(input_folder):
+    locations = []
+    skipped = []
+    for sub in sorted(os.listdir(input_folder)):
+        sub_path = os.path.join(input_folder, sub)
+        if not os.path.isdir(sub_path):
+            continue
+        # Find CSV file and ROI folder in sub_path
+        csv_files = [f for f in os.listdir(sub_path) if f.lower().endswith('.csv')]
+        roi_folders = [f for f in os.listdir(sub_path) if os.path.isdir(os.path.join(sub_path, f)) and 'roi' in f.lower()]
+        if not csv_files or not roi_folders:
+            skipped.append(sub)
+            continue
+        locations.append((sub, os.path.join(sub_path, csv_files[0]), os.path.join(sub_path, roi_folders[0])))
+    return locations, skipped
+
+# Worker: converts one location. Runs in its own process during batch conversion.
+def convert_location(sub, csv_file, roi_folder, output_folder, roi_workers=None, quiet=True):
+    global QUIET_MODE
+    QUIET_MODE = quiet
+    # Create output folder for this location
+    out_location_folder = os.path.join(output_folder, sub)
+    os.makedirs(out_location_folder, exist_ok=True)
+    out_metadata_csv = os.path.join(out_location_folder, "metadata.csv")
+    out_segmentations = os.path.join(out_location_folder, "segmentations")
+    # Parquet goes to temp file to save memory and then combined later
+    out_metadata_parquet = os.path.join(output_folder, f"_tmp_{sub}.parquet")
+
+    start = time.perf_counter()
+    main(csv_file, roi_folder, out_location_folder, out_metadata_csv, out_metadata_parquet, out_segmentations, roi_workers)
+    return out_metadata_parquet, time.perf_counter() - start
+
+# Combines the per-location parquet files into the master metadata.parquet.
+# Row groups are streamed one at a time into a single writer, so memory stays flat no matter
+# how many locations there are. Columns missing from a location are written as nulls, and
+# types that differ between locations are widened (e.g. int64 and double -> double).
+def merge_parquet_files(parquet_paths, master_parquet):
+    schema = pa.unify_schemas(
+        [pq.read_schema(p).remove_metadata() for p in parquet_paths],
+        promote_options="permissive",
+    )
+    with pq.ParquetWriter(master_parquet, schema) as writer:
+        for p in parquet_paths:
+            parquet_file = pq.ParquetFile(p)
+            for i in range(parquet_file.num_row_groups):
+                writer.write_table(conform_to_schema(parquet_file.read_row_group(i), schema))
+    # Remove temp parquet files
+    for p in parquet_paths:
+        try:
+            os.remove(p)
+        except Exception:
+            pass
+    return master_parquet
+
+# Returns the table with schema's columns, in schema's order and types.
+def conform_to_schema(table, schema):
+    columns = []
+    for field in schema:
+        if field.name in table.column_names:
+            columns.append(table.column(field.name).cast(field.type))
+        else:
+            columns.append(pa.nulls(table.num_rows, field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+# Worker process initializer. Forked workers inherit the parent's sys.stdout/sys.stderr and
+# util.msg, which may write to a user interface living in the parent; workers write to the
+# plain console instead and only report progress through batch_convert's report().
+def init_worker():
+    sys.stdout = sys.__stdout__
+    sys.stderr = sys.__stderr__
+    util.msg = UTIL_MSG
+    util.msg_header = UTIL_MSG_HEADER
+
+# Converts every location in input_folder, `jobs` locations at a time in worker processes.
+# Progress is passed to report() as dicts with an "event" key:
+#   start, skipped, location_done, location_failed, merged, done
+def batch_convert(input_folder, output_folder, jobs=None, roi_workers=None, report=print):
+    locations, skipped = find_locations(input_folder)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(locations) or 1))
+    # Share the cores between locations so the ROI pools do not oversubscribe the machine.
+    roi_workers = roi_workers or max(1, (os.cpu_count() or 1) // jobs)
+    report({"event": "start", "total": len(locations), "jobs": jobs, "roi_workers": roi_workers})
+    for sub in skipped:
+        report({"event": "skipped", "location": sub, "reason": "missing CSV or ROI folder"})
+
+    parquet_paths = {}
+    failed = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as executor:
+        futures = {
+            executor.submit(convert_location, sub, csv_file, roi_folder, output_folder, roi_workers): sub
+            for sub, csv_file, roi_folder in locations
+        }
+        for completed, future in enumerate(as_completed(futures), start=1):
+            sub = futures[future]
+            progress = {"location": sub, "completed": completed, "total": len(locations)}
+            try:
+                parquet_paths[sub], seconds = future.result()
+                report({"event": "location_done", "seconds": round(seconds, 3), **progress})
+            except Exception as e:
+                failed.append(sub)
+                report({"event": "location_failed", "error": f"{type(e).__name__}: {e}", **progress})
+
+    master_parquet = None
+    if parquet_paths:
+        # Keep the master file in location order, whatever order the workers finished in.
+        ordered_paths = [parquet_paths[sub] for sub, _, _ in locations if sub in parquet_paths]
+        master_parquet = merge_parquet_files(ordered_paths, os.path.join(output_folder, "metadata.parquet"))
+        report({"event": "merged", "files": len(ordered_paths), "path": master_parquet})
+    report({"event": "done", "succeeded": len(parquet_paths), "failed": failed, "skipped": skipped})
+    return master_parquet, failed
+
+# Text of a batch progress event for people (the user interface), or None for events they do not need to see.
+def format_progress(event):
+    if event["event"] == "start":
+        return f"Converting {event['total']} locations, {event['jobs']} at a time...\n"
+    elif event["event"] == "skipped":
+        return f"Skipping '{event['location']}': {event['reason']}\n"
+    elif event["event"] == "location_done":
+        return f"Done: {event['location']} [{event['completed']}/{event['total']}]\n"
+    elif event["event"] == "location_failed":
+        return f"Error in '{event['location']}': {event['error']}\n"
+    elif event["event"] == "merged":
+        return f"✅ Combined {event['files']} files → {event['path']}"
+    return None
+
+# Prints batch progress events as JSON lines, for scripts and cluster jobs.
+def print_json_progress(event):
+    print(json.dumps({"time": time.time(), **event}), flush=True)
+
+def run_cli(argv):
+    parser = argparse.ArgumentParser(description="Convert TrackMate outputs into Loon data.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    batch = subparsers.add_parser("batch", help="Convert every location sub-folder of an input folder, without the user interface.")
+    batch.add_argument("input_folder")
+    batch.add_argument("output_folder")
+    batch.add_argument("--jobs", type=int, default=None, help="Locations converted in parallel (default: number of CPUs).")
+    batch.add_argument("--roi-workers", type=int, default=None, help="ROI conversion processes per location (default: CPUs / jobs).")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_folder, exist_ok=True)
+    _, failed = batch_convert(args.input_folder, args.output_folder, args.jobs, args.roi_workers, report=print_json_progress)
+    return 1 if failed else 0
+
+
 ######################
 def run_gui():
+    # Imported here so batch conversion runs on machines without Tk or a display.
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+
     root = tk.Tk()
     root.title("Convert Trackmate Data to Loon Data")
     root.geometry("900x600")
@@ -399,78 +630,33 @@ def run_gui():
         y_scroll.pack(side=tk.RIGHT, fill=tk.Y)
         x_scroll.pack(fill=tk.X)
 
-    # Redirect stdout (console output) to the text box
-    class StdoutRedirector:
-        def __init__(self, widget):
-            self.widget = widget
-        def write(self, s):
-            self.widget.config(state=tk.NORMAL)
-            self.widget.insert(tk.END, s)
-            self.widget.see(tk.END)
-            self.widget.config(state=tk.DISABLED)
-        def flush(self):
-            pass
-    # Utility messages go to the GUI output box
-    def gui_msg(*args, **kwargs):
-        msg = args[0] if args else ""
-        print(msg)
-    # Print a header message in the GUI output box
-    def gui_msg_header(*args, **kwargs):
-        msg = args[0] if args else ""
-        print(msg)
-    util.msg = gui_msg
-    util.msg_header = gui_msg_header
+    # Appends text to the output box. Tk widgets may only be used from the main loop's
+    # thread, so the conversion thread schedules this with root.after.
+    def append_output(text):
+        text_box.config(state=tk.NORMAL)
+        text_box.insert(tk.END, text + "\n")
+        text_box.see(tk.END)
+        text_box.config(state=tk.DISABLED)
+
+    def show(text):
+        root.after(0, append_output, text)
+
+    # Progress comes only through batch_convert's report(); the workers run in other
+    # processes and never touch the window.
+    def gui_report(event):
+        text = format_progress(event)
+        if text is not None:
+            show(text)
 
     # Function to run batch conversion in a separate thread
     def run_batch_conversion_thread(input_folder, output_folder):
         try:
-            # From the input, get each location (subfolder) and process each one
-            subfolders = [f for f in os.listdir(input_folder) if os.path.isdir(os.path.join(input_folder, f))]
-            parquet_paths = []
-            # For this location ...
-            for sub in subfolders:
-                sub_path = os.path.join(input_folder, sub)
-                # Find CSV file and ROI folder in sub_path
-                csv_files = [f for f in os.listdir(sub_path) if f.lower().endswith('.csv')]
-                roi_folders = [f for f in os.listdir(sub_path) if os.path.isdir(os.path.join(sub_path, f)) and 'roi' in f.lower()]
-                if not csv_files or not roi_folders:
-                    print(f"Skipping '{sub}': missing CSV or ROI folder\n")
-                    continue
-                csv_file = os.path.join(sub_path, csv_files[0])
-                roi_folder = os.path.join(sub_path, roi_folders[0])
-                # Create output folder for this location
-                out_location_folder = os.path.join(output_folder, sub)
-                os.makedirs(out_location_folder, exist_ok=True)
-                out_metadata_csv = os.path.join(out_location_folder, "metadata.csv")
-                out_segmentations = os.path.join(out_location_folder, "segmentations")
-                # Parquet goes to temp file to save memory and then combined later
-                out_metadata_parquet = os.path.join(output_folder, f"_tmp_{sub}.parquet")
-
-                # Finally, process the CSV and ROI files for this location
-                print(f"Processing '{sub}'...\n")
-                try:
-                    main(csv_file, roi_folder, out_location_folder, out_metadata_csv, out_metadata_parquet, out_segmentations)
-                    parquet_paths.append(out_metadata_parquet)
-                    print(f"Done: {sub}\n")
-                except Exception as e:
-                    print(f"Error in '{sub}': {e}\n")
-            # Combine all temp parquet files into master metadata.parquet
-            if parquet_paths:
-                dfs = [pd.read_parquet(p) for p in parquet_paths]
-                combined = pd.concat(dfs, ignore_index=True)
-                master_parquet = os.path.join(output_folder, "metadata.parquet")
-                combined.to_parquet(master_parquet)
-                print(f"✅ Combined {len(parquet_paths)} files → {master_parquet}")
-                # Remove temp parquet files
-                for p in parquet_paths:
-                    try:
-                        os.remove(p)
-                    except Exception:
-                        pass
-            print("\nBatch conversion complete!\n")
+            # From the input, get each location (subfolder) and process them in parallel
+            batch_convert(input_folder, output_folder, report=gui_report)
+            show("\nBatch conversion complete!\n")
             root.after(0, lambda: messagebox.showinfo("Success", "Batch conversion complete!"))
         except Exception as e:
-            print(f"An error occurred:\n{e}\n")
+            show(f"An error occurred:\n{e}\n")
             error_message = f"An error occurred:\n{e}"
             root.after(0, lambda msg=error_message: messagebox.showerror("Error", msg))
 
@@ -484,8 +670,6 @@ def run_gui():
             return
         # Show and initialize the console output box
         show_output_box()
-        sys.stdout = StdoutRedirector(text_box)
-        sys.stderr = StdoutRedirector(text_box)
         text_box.config(state=tk.NORMAL)
         text_box.delete(1.0, tk.END)
         text_box.config(state=tk.DISABLED)
@@ -498,4 +682,6 @@ def run_gui():
 
 ######################
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     run_gui()
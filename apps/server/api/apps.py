@@ -5,3 +5,6 @@ class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
 
+    def ready(self):
+        # Register model signal handlers (cache invalidation).
+        from . import signals  # noqa: F401
@@ -0,0 +1,190 @@
+from django.core.files.storage import FileSystemStorage, default_storage  # type: ignore
+from ..processing_callbacks.encoding import GEOJSON, PACKED
+from ..processing_callbacks.roi_to_geojson import roi_to_geojson, roi_to_geojson_batch_callback
+from ..tasks import (
+    LiveCyteSegmentationsTask,
+    LiveCyteCellImagesTask,
+    LiveCyteMetadataTask,
+)
+from ..views import create_composite_tabular_data_file
+from ..models import LoonUpload
+from . import synthetic
+import datetime
+import io
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+'''
+Ingestion benchmark suite. Runs the ingest hot paths against synthetic LiveCyte data on
+local filesystem storage and reports throughput and peak (Python heap) memory.
+
+Each benchmark is timed `repeats` times (median and min reported), then run once more
+under tracemalloc for the peak memory, so tracing overhead does not skew throughput.
+'''
+
+EXPERIMENT_NAME = "benchmark"
+
+
+class Benchmark:
+    def __init__(self, name, run, items, input_bytes, reset=None):
+        self.name = name
+        self.run = run
+        self.items = items
+        self.input_bytes = input_bytes
+        self.reset = reset
+
+    def measure(self, repeats):
+        seconds = []
+        for _ in range(repeats):
+            if self.reset:
+                self.reset()
+            start = time.perf_counter()
+            self.run()
+            seconds.append(time.perf_counter() - start)
+
+        if self.reset:
+            self.reset()
+        tracemalloc.start()
+        self.run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        median = statistics.median(seconds)
+        return {
+            "name": self.name,
+            "repeats": repeats,
+            "seconds_median": median,
+            "seconds_min": min(seconds),
+            "items": self.items,
+            "items_per_second": self.items / median if median else None,
+            "input_bytes": self.input_bytes,
+            "megabytes_per_second": self.input_bytes / 1024 ** 2 / median if median else None,
+            "peak_memory_bytes": peak_memory,
+        }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _task(task_class, blob_name, file_name, location=0):
+    return task_class(
+        file_name=file_name,
+        location=location,
+        experiment_name=EXPERIMENT_NAME,
+        blob=LoonUpload(blob=blob_name).blob,
+        record_id=0,
+    )
+
+
+def _build_benchmarks(storage_root, cells, frames, locations, image_bytes, vertices):
+    def clear_experiment():
+        shutil.rmtree(os.path.join(storage_root, EXPERIMENT_NAME), ignore_errors=True)
+
+    roi_zip = synthetic.make_roi_zip(cells, frames, vertices=vertices)
+    image_zip = synthetic.make_image_zip(frames, image_bytes=image_bytes)
+    metadata_csv = synthetic.make_metadata_csv(cells, frames)
+    default_storage.save("temp/rois.zip", io.BytesIO(roi_zip))
+    default_storage.save("temp/images.zip", io.BytesIO(image_zip))
+    default_storage.save("temp/metadata.csv", io.BytesIO(metadata_csv))
+
+    # Location tables as they look after the metadata task dropped the title row.
+    tabular_bytes = metadata_csv.split(b"\n", 1)[1]
+    experiment_settings = []
+    for location in range(locations):
+        tabular_name = f"tabular/location_{location}.csv"
+        default_storage.save(tabular_name, io.BytesIO(tabular_bytes))
+        experiment_settings.append({"id": str(location), "tabularDataFilename": tabular_name})
+    location_tags = {f"location_{i}": {"condition": f"c{i % 2}"} for i in range(locations)}
+
+    with zipfile.ZipFile(io.BytesIO(roi_zip)) as zip_ref:
+        roi_members = [(name.split("/")[-1], zip_ref.read(name)) for name in zip_ref.namelist()]
+
+    def run_roi_to_geojson(encoding=GEOJSON):
+        for file_name, file_contents in roi_members:
+            roi_to_geojson(file_contents, file_name, encoding=encoding)
+
+    def run_roi_to_geojson_batch(batch_size=256):
+        convert = roi_to_geojson_batch_callback()
+        members = [(file_contents, file_name) for file_name, file_contents in roi_members]
+        for start in range(0, len(members), batch_size):
+            convert(members[start:start + batch_size])
+
+    rois = cells * frames
+    return [
+        Benchmark("roi_to_geojson", run_roi_to_geojson, rois,
+                  sum(len(contents) for _, contents in roi_members)),
+        Benchmark("roi_to_geojson[packed]", lambda: run_roi_to_geojson(PACKED), rois,
+                  sum(len(contents) for _, contents in roi_members)),
+        Benchmark("roi_to_geojson[batch]", run_roi_to_geojson_batch, rois,
+                  sum(len(contents) for _, contents in roi_members)),
+        Benchmark(
+            "process_zip_file[segmentations]",
+            lambda: _task(LiveCyteSegmentationsTask, "temp/rois.zip", "rois.zip").execute(),
+            rois, len(roi_zip), reset=clear_experiment
+        ),
+        Benchmark(
+            "process_zip_file[cell_images]",
+            lambda: _task(LiveCyteCellImagesTask, "temp/images.zip", "images.zip").execute(),
+            frames + 1, len(image_zip), reset=clear_experiment
+        ),
+        Benchmark(
+            "process_csv_file[metadata]",
+            lambda: _task(LiveCyteMetadataTask, "temp/metadata.csv", "metadata.csv").execute(),
+            rois, len(metadata_csv), reset=clear_experiment
+        ),
+        Benchmark(
+            "create_composite_tabular_data_file",
+            lambda: create_composite_tabular_data_file(
+                EXPERIMENT_NAME, experiment_settings, location_tags
+            ),
+            rois * locations, len(tabular_bytes) * locations, reset=clear_experiment
+        ),
+    ]
+
+
+def run_suite(cells=100, frames=20, locations=4, image_bytes=1024 ** 2, vertices=64,
+              repeats=3, only=None):
+    params = {
+        "cells": cells, "frames": frames, "locations": locations,
+        "image_bytes": image_bytes, "vertices": vertices, "repeats": repeats,
+    }
+    storage_root = tempfile.mkdtemp(prefix="loon-benchmark-")
+
+    # Point default_storage at a scratch directory for the duration of the run.
+    previous_storage = default_storage._wrapped
+    default_storage._wrapped = FileSystemStorage(location=storage_root)
+    try:
+        benchmarks = _build_benchmarks(storage_root, cells, frames, locations, image_bytes,
+                                       vertices)
+        results = [
+            benchmark.measure(repeats) for benchmark in benchmarks
+            if not only or benchmark.name.split("[")[0] in only or benchmark.name in only
+        ]
+    finally:
+        default_storage._wrapped = previous_storage
+        shutil.rmtree(storage_root, ignore_errors=True)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": params,
+        },
+        "results": results,
+    }
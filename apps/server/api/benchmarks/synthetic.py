@@ -0,0 +1,74 @@
+from roifile import ImagejRoi  # type: ignore
+import numpy as np
+import io
+import zipfile
+
+'''
+Synthetic LiveCyte-style inputs for the ingestion benchmarks. Everything is generated
+from a seeded RNG so that runs on different commits see byte-identical inputs.
+'''
+
+METADATA_COLUMNS = [
+    "Frame", "Tracking ID", "Lineage ID", "Parent ID", "Time (h)",
+    "Position X", "Position Y", "Dry Mass (pg)", "Area", "Perimeter"
+]
+
+
+def _cell_polygon(rng, center_x, center_y, vertices):
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    radii = rng.uniform(8, 14) * (1 + 0.15 * rng.standard_normal(vertices))
+    xs = np.round(center_x + radii * np.cos(angles))
+    ys = np.round(center_y + radii * np.sin(angles))
+    return np.stack([xs, ys], axis=1).astype(np.int32)
+
+
+# ROI zip with one <frame>-<cell id>.roi polygon per cell per frame, like LiveCyte exports.
+def make_roi_zip(cells: int, frames: int, vertices: int = 64, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(50, 2000, size=(cells, 2))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for frame in range(1, frames + 1):
+            centers += rng.normal(0, 2, size=centers.shape)
+            for cell_id in range(1, cells + 1):
+                x, y = centers[cell_id - 1]
+                roi = ImagejRoi.frompoints(_cell_polygon(rng, x, y, vertices))
+                zip_file.writestr(f"rois/{frame}-{cell_id}.roi", roi.tobytes())
+    return buffer.getvalue()
+
+
+# Image zip with one incompressible blob per frame plus the OME companion file.
+def make_image_zip(frames: int, image_bytes: int = 1024 ** 2, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zip_file:
+        for frame in range(1, frames + 1):
+            zip_file.writestr(f"images/image_{frame}.ome.tiff", rng.bytes(image_bytes))
+        zip_file.writestr("images/images.companion.ome", b"<OME></OME>")
+    return buffer.getvalue()
+
+
+# Metadata CSV with one row per cell per frame, preceded by the title row LiveCyte adds.
+def make_metadata_csv(cells: int, frames: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    rows = cells * frames
+    frame = np.repeat(np.arange(1, frames + 1), cells)
+    cell_id = np.tile(np.arange(1, cells + 1), frames)
+    columns = [
+        frame,
+        cell_id,
+        cell_id,
+        np.zeros(rows, dtype=np.int64),
+        np.round(frame * 0.25, 2),
+        np.round(rng.uniform(0, 2000, rows), 3),
+        np.round(rng.uniform(0, 2000, rows), 3),
+        np.round(rng.uniform(50, 400, rows), 3),
+        np.round(rng.uniform(100, 600, rows), 3),
+        np.round(rng.uniform(40, 120, rows), 3),
+    ]
+    text = io.StringIO()
+    text.write("Synthetic LiveCyte export\n")
+    text.write(",".join(METADATA_COLUMNS) + "\n")
+    for row in zip(*[column.tolist() for column in columns]):
+        text.write(",".join(str(value) for value in row) + "\n")
+    return text.getvalue().encode('utf-8')
@@ -0,0 +1,78 @@
+from django.core.cache import caches  # type: ignore
+from django.conf import settings  # type: ignore
+import hashlib
+import logging
+
+logger = logging.getLogger()
+
+EXPERIMENT_JSON_KEY = "experiment_json:{pk}"
+PRESIGNED_URL_KEY = "presigned_url:{bucket}:{name}:{max_age}"
+
+
+# Returns the shared (Redis) cache, or the local-memory cache if Redis is not configured.
+def _primary_cache():
+    return caches['default']
+
+
+def _fallback_cache():
+    return caches['local']
+
+
+# Runs the cache operation against the shared cache and falls back to the local-memory
+# cache when the shared cache cannot be reached (e.g. Redis is down).
+def _cache_call(method, *args, **kwargs):
+    try:
+        return getattr(_primary_cache(), method)(*args, **kwargs)
+    except Exception as e:
+        logger.warning(f"Shared cache unavailable ({e}), using local-memory cache.")
+        return getattr(_fallback_cache(), method)(*args, **kwargs)
+
+
+def cache_get(key):
+    return _cache_call('get', key)
+
+
+def cache_set(key, value, timeout=None):
+    _cache_call('set', key, value, timeout)
+
+
+def cache_delete(key):
+    _cache_call('delete', key)
+    # Make sure a stale copy written during an outage does not outlive the shared entry.
+    _fallback_cache().delete(key)
+
+
+def experiment_json_key(pk) -> str:
+    return EXPERIMENT_JSON_KEY.format(pk=pk)
+
+
+# Experiment JSON only goes to the shared cache: a per-process copy would not see the
+# invalidations of other processes. Returns None when caching is off or Redis is unreachable.
+def get_experiment_json(pk):
+    if not settings.EXPERIMENT_JSON_CACHE_ENABLED:
+        return None
+    try:
+        return _primary_cache().get(experiment_json_key(pk))
+    except Exception as e:
+        logger.warning(f"Shared cache unavailable ({e}), not caching experiment JSON.")
+        return None
+
+
+def set_experiment_json(pk, data):
+    if not settings.EXPERIMENT_JSON_CACHE_ENABLED:
+        return
+    try:
+        _primary_cache().set(experiment_json_key(pk), data, settings.EXPERIMENT_JSON_CACHE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Shared cache unavailable ({e}), not caching experiment JSON.")
+
+
+def invalidate_experiment_json(pk):
+    cache_delete(experiment_json_key(pk))
+
+
+def presigned_url_key(bucket: str, name: str, max_age=None) -> str:
+    max_age_seconds = int(max_age.total_seconds()) if max_age is not None else ""
+    # Object names can contain spaces and be arbitrarily long, so hash them into the key.
+    name_hash = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    return PRESIGNED_URL_KEY.format(bucket=bucket, name=name_hash, max_age=max_age_seconds)
@@ -0,0 +1,128 @@
+from collections import defaultdict
+from django.conf import settings  # type: ignore
+from django.core.files.storage import FileSystemStorage, default_storage  # type: ignore
+from django.utils import timezone  # type: ignore
+from minio.deleteobjects import DeleteObject  # type: ignore
+from minio_storage.storage import MinioStorage  # type: ignore
+from .models import IngestQueueEntry
+from .metrics import STORAGE_USAGE_BYTES, STORAGE_USAGE_OBJECTS, TEMP_UPLOADS_EXPIRED
+import datetime
+import logging
+import os
+
+'''
+Storage lifecycle. Temp uploads (temp/<uuid>/<file>) are deleted by the ingest task once it
+succeeds. Anything left behind (failed or abandoned uploads) is expired after
+TEMP_UPLOAD_TTL_HOURS by a periodic job, which also reports storage usage per experiment.
+Both jobs are scheduled in CELERY_BEAT_SCHEDULE.
+'''
+
+logger = logging.getLogger()
+
+TEMP_PREFIX = 'temp/'
+# S3 multi-object delete accepts at most 1000 keys per request.
+DELETE_BATCH_SIZE = 1000
+
+
+# Whether list_objects supports the storage backend.
+def can_list(storage=default_storage) -> bool:
+    return isinstance(storage, (MinioStorage, FileSystemStorage))
+
+
+# Yields (name, size, last_modified) for every object under the prefix.
+def list_objects(prefix='', storage=default_storage):
+    if isinstance(storage, MinioStorage):
+        for obj in storage.client.list_objects(storage.bucket_name, prefix=prefix,
+                                               recursive=True):
+            yield obj.object_name, obj.size, obj.last_modified
+    elif isinstance(storage, FileSystemStorage):
+        root = storage.path('')
+        for directory, _, files in os.walk(storage.path(prefix) if prefix else root):
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                stat = os.stat(path)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                modified = datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc)
+                yield name, stat.st_size, modified
+    else:
+        raise NotImplementedError(f"Cannot list {type(storage).__name__}")
+
+
+# Directories are implicit on MinIO; on disk, drop the temp/<uuid>/ directory once empty.
+def _remove_empty_parent(storage, name):
+    try:
+        os.rmdir(os.path.dirname(storage.path(name)))
+    except OSError:
+        pass
+
+
+# Deletes the objects in batches. Returns the number deleted.
+def delete_objects(names, storage=default_storage) -> int:
+    names = list(names)
+    deleted = 0
+    for start in range(0, len(names), DELETE_BATCH_SIZE):
+        batch = names[start:start + DELETE_BATCH_SIZE]
+        if isinstance(storage, MinioStorage):
+            # remove_objects is lazy -- iterating it sends the request and yields failures.
+            errors = list(storage.client.remove_objects(
+                storage.bucket_name, (DeleteObject(name) for name in batch)
+            ))
+            for error in errors:
+                logger.error(f"Failed to delete {error.name}: {error.message}")
+            deleted += len(batch) - len(errors)
+        else:
+            for name in batch:
+                storage.delete(name)
+                if isinstance(storage, FileSystemStorage):
+                    _remove_empty_parent(storage, name)
+            deleted += len(batch)
+    return deleted
+
+
+# Deletes temp uploads older than the TTL that are not waiting on or being ingested.
+def expire_temp_uploads(storage=default_storage) -> int:
+    if not can_list(storage):
+        logger.warning(f"Cannot list {type(storage).__name__}, not expiring temp uploads")
+        return 0
+    cutoff = timezone.now() - datetime.timedelta(hours=settings.TEMP_UPLOAD_TTL_HOURS)
+    in_use = set(
+        IngestQueueEntry.objects.filter(
+            status__in=[IngestQueueEntry.Status.WAITING, IngestQueueEntry.Status.DISPATCHED,
+                        IngestQueueEntry.Status.DEFERRED]
+        ).values_list('upload__blob', flat=True)
+    )
+    expired = [
+        name for name, _, modified in list_objects(TEMP_PREFIX, storage)
+        if modified < cutoff and name not in in_use
+    ]
+    deleted = delete_objects(expired, storage)
+    TEMP_UPLOADS_EXPIRED.inc(deleted)
+    logger.info(f"Expired {deleted} temp uploads older than {cutoff.isoformat()}")
+    return deleted
+
+
+# Sums object sizes by top-level prefix (experiment name, or 'temp'). Root-level files such
+# as aa_index.json and <experiment>.json are counted under their experiment.
+def storage_usage(storage=default_storage) -> dict:
+    usage = defaultdict(lambda: {"bytes": 0, "objects": 0})
+    for name, size, _ in list_objects('', storage):
+        if '/' in name:
+            key = name.split('/')[0]
+        else:
+            key = name[:-5] if name.endswith('.json') else name
+        usage[key]["bytes"] += size
+        usage[key]["objects"] += 1
+    return dict(usage)
+
+
+def report_storage_usage(storage=default_storage) -> dict:
+    if not can_list(storage):
+        logger.warning(f"Cannot list {type(storage).__name__}, not reporting storage usage")
+        return {}
+    usage = storage_usage(storage)
+    for experiment_name, experiment_usage in usage.items():
+        STORAGE_USAGE_BYTES.labels(experiment_name).set(experiment_usage["bytes"])
+        STORAGE_USAGE_OBJECTS.labels(experiment_name).set(experiment_usage["objects"])
+        logger.info(f"Storage usage {experiment_name}: {experiment_usage['bytes']} bytes in "
+                    f"{experiment_usage['objects']} objects")
+    return usage
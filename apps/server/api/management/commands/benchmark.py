@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand  # type: ignore
+from api.benchmarks.suite import run_suite
+import json
+import os
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the ingest hot paths on synthetic LiveCyte data and saves the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cells", type=int, default=100, help="Cells per frame")
+        parser.add_argument("--frames", type=int, default=20, help="Frames per location")
+        parser.add_argument("--locations", type=int, default=4,
+                            help="Locations merged into the composite table")
+        parser.add_argument("--image-bytes", type=int, default=1024 ** 2,
+                            help="Size of each synthetic image")
+        parser.add_argument("--vertices", type=int, default=64, help="Vertices per ROI polygon")
+        parser.add_argument("--repeats", type=int, default=3)
+        parser.add_argument("--only", nargs="*", help="Only run the named benchmarks")
+        parser.add_argument("--output", default="benchmark_results",
+                            help="Directory (or .json file) to write results to")
+
+    def handle(self, *args, **options):
+        report = run_suite(
+            cells=options["cells"],
+            frames=options["frames"],
+            locations=options["locations"],
+            image_bytes=options["image_bytes"],
+            vertices=options["vertices"],
+            repeats=options["repeats"],
+            only=options["only"],
+        )
+
+        for result in report["results"]:
+            self.stdout.write(
+                f"{result['name']:<40} {result['seconds_median']:>9.3f}s "
+                f"{result['items_per_second']:>12.1f} items/s "
+                f"{result['megabytes_per_second']:>9.2f} MB/s "
+                f"{result['peak_memory_bytes'] / 1024 ** 2:>9.1f} MB peak"
+            )
+
+        output = options["output"]
+        if not output.endswith(".json"):
+            os.makedirs(output, exist_ok=True)
+            commit = (report["meta"]["commit"] or "nocommit")[:10]
+            timestamp = report["meta"]["timestamp"][:19].replace(":", "-")
+            output = os.path.join(output, f"{timestamp}_{commit}.json")
+        with open(output, "w") as results_file:
+            json.dump(report, results_file, indent=4)
+        self.stdout.write(self.style.SUCCESS(f"Saved results to {output}"))
@@ -1,12 +1,16 @@
+from django.conf import settings  # type: ignore
 from django.core.management.base import BaseCommand
-import time
-from api.tasks import processing_monitor
+from prometheus_client import start_http_server  # type: ignore
+from api.monitor import processing_monitor
 
 
 class Command(BaseCommand):
-    help = "Runs a background task"
+    help = "Monitors the ingest queues, exports their metrics and requeues stuck tasks"
 
     def handle(self, *args, **kwargs):
+        start_http_server(settings.METRICS_MONITOR_PORT)
+        self.stdout.write(self.style.SUCCESS(
+            f"Processing monitor started, metrics on port {settings.METRICS_MONITOR_PORT}"
+        ))
         while True:
-            self.stdout.write(self.style.SUCCESS("Starting background task..."))
             processing_monitor()
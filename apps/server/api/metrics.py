@@ -0,0 +1,123 @@
+from prometheus_client import (  # type: ignore
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    CONTENT_TYPE_LATEST,
+    generate_latest,
+    multiprocess,
+)
+import os
+
+'''
+Prometheus metrics for the ingestion and serving hot paths.
+
+The web process exposes them on /metrics. Celery workers are started with
+PROMETHEUS_MULTIPROC_DIR set (see celery_app.py), so every pool process writes its samples
+to that directory and the worker-side exporter serves the aggregate.
+'''
+
+# Buckets from 1ms up to 1 hour, ingest tasks can take a long time.
+SECONDS_BUCKETS = (.001, .005, .01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+BYTES_BUCKETS = tuple(1024 ** 2 * 4 ** i for i in range(10))  # 1 MiB .. 256 GiB
+FILES_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+ZIP_READ_SECONDS = Histogram(
+    'loon_zip_read_seconds', 'Time to read one member from an uploaded zip.',
+    buckets=SECONDS_BUCKETS
+)
+CALLBACK_SECONDS = Histogram(
+    'loon_callback_seconds', 'Time spent in a processing callback for one file.',
+    ['callback'], buckets=SECONDS_BUCKETS
+)
+STORAGE_SAVE_SECONDS = Histogram(
+    'loon_storage_save_seconds', 'Latency of one default_storage.save call.',
+    buckets=SECONDS_BUCKETS
+)
+STORAGE_BYTES_WRITTEN = Counter(
+    'loon_storage_bytes_written', 'Bytes written to storage by ingest tasks.',
+    ['file_type']
+)
+STORAGE_PROMOTIONS = Counter(
+    'loon_storage_promotions', 'Uploads placed without rewriting them, by strategy.',
+    ['strategy']
+)
+TEMP_UPLOADS_EXPIRED = Counter(
+    'loon_temp_uploads_expired', 'Orphaned temp uploads deleted after their TTL.'
+)
+# Set by the periodic storage usage report; keep the most recent value across processes.
+STORAGE_USAGE_BYTES = Gauge(
+    'loon_storage_usage_bytes', 'Bytes stored per experiment (and for temp uploads).',
+    ['experiment'], multiprocess_mode='mostrecent'
+)
+STORAGE_USAGE_OBJECTS = Gauge(
+    'loon_storage_usage_objects', 'Objects stored per experiment (and for temp uploads).',
+    ['experiment'], multiprocess_mode='mostrecent'
+)
+TASK_SECONDS = Histogram(
+    'loon_task_seconds', 'Duration of an ingest task.',
+    ['file_type'], buckets=SECONDS_BUCKETS
+)
+TASK_BYTES = Histogram(
+    'loon_task_bytes', 'Bytes written to storage per ingest task.',
+    ['file_type'], buckets=BYTES_BUCKETS
+)
+TASK_FILES = Histogram(
+    'loon_task_files', 'Files written to storage per ingest task.',
+    ['file_type'], buckets=FILES_BUCKETS
+)
+TASKS_TOTAL = Counter(
+    'loon_tasks', 'Ingest tasks run, by outcome.',
+    ['file_type', 'status']
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    'loon_queue_wait_seconds', 'Time from upload submission until its task started.',
+    ['queue'], buckets=SECONDS_BUCKETS
+)
+VIEW_SECONDS = Histogram(
+    'loon_view_seconds', 'Latency of API views.',
+    ['view', 'method', 'status'], buckets=SECONDS_BUCKETS
+)
+
+# Sampled by the processing monitor (api/monitor.py).
+QUEUE_DEPTH = Gauge(
+    'loon_queue_depth', 'Messages waiting in the broker queue.',
+    ['queue'], multiprocess_mode='mostrecent'
+)
+QUEUE_ACTIVE_TASKS = Gauge(
+    'loon_queue_active_tasks', 'Tasks currently executing on workers.',
+    ['queue'], multiprocess_mode='mostrecent'
+)
+QUEUE_RESERVED_TASKS = Gauge(
+    'loon_queue_reserved_tasks', 'Tasks prefetched by workers but not yet started.',
+    ['queue'], multiprocess_mode='mostrecent'
+)
+SCHEDULER_BACKLOG = Gauge(
+    'loon_scheduler_backlog', 'Uploads waiting in the ingest scheduler.',
+    ['queue'], multiprocess_mode='mostrecent'
+)
+SCHEDULER_OLDEST_WAIT_SECONDS = Gauge(
+    'loon_scheduler_oldest_wait_seconds', 'Age of the oldest upload waiting in the scheduler.',
+    ['queue'], multiprocess_mode='mostrecent'
+)
+STUCK_TASKS = Counter(
+    'loon_stuck_tasks', 'Dispatched tasks found stuck or lost by the monitor.',
+    ['queue']
+)
+REQUEUED_TASKS = Counter(
+    'loon_requeued_tasks', 'Stuck or lost tasks put back in the ingest scheduler.',
+    ['queue']
+)
+
+
+def metrics_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
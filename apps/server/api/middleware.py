@@ -0,0 +1,36 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction  # type: ignore
+from .metrics import VIEW_SECONDS
+import time
+
+
+# Records the latency of every request, labelled by URL name, method and status code.
+# Works for both the sync and async request paths.
+class ViewMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, start)
+        return response
+
+    def observe(self, request, response, start):
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unmatched'
+        VIEW_SECONDS.labels(view, request.method, response.status_code).observe(
+            time.perf_counter() - start
+        )
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_location_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestQueueEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('experiment_name', models.CharField(db_index=True, max_length=255)),
+                ('queue', models.CharField(max_length=30)),
+                ('task_id', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('dispatched', 'Dispatched'), ('finished', 'Finished')], db_index=True, default='waiting', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('upload', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='queue_entry', to='api.loonupload')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_ingestqueueentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestqueueentry',
+            name='profile',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:36
+
+from django.db import migrations, models
+
+
+def copy_task_ids(apps, schema_editor):
+    IngestQueueEntry = apps.get_model('api', 'IngestQueueEntry')
+    IngestQueueEntry.objects.update(attempt_task_id=models.F('task_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_ingestqueueentry_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestqueueentry',
+            name='attempt_task_id',
+            field=models.CharField(db_index=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='ingestqueueentry',
+            name='requeues',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(copy_task_ids, migrations.RunPython.noop),
+    ]
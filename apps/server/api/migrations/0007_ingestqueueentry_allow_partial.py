@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_ingestqueueentry_requeues'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestqueueentry',
+            name='allow_partial',
+            field=models.BooleanField(default=False),
+        ),
+    ]
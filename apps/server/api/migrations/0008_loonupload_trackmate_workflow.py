@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_ingestqueueentry_allow_partial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loonupload',
+            name='workflow_code',
+            field=models.CharField(choices=[('live_cyte', 'Live Cyte'), ('trackmate', 'Trackmate')], max_length=30),
+        ),
+    ]
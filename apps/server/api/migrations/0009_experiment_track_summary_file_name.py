@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_loonupload_trackmate_workflow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experiment',
+            name='track_summary_file_name',
+            field=models.CharField(default='', max_length=255),
+        ),
+    ]
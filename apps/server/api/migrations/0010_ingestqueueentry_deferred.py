@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_experiment_track_summary_file_name'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingestqueueentry',
+            name='status',
+            field=models.CharField(choices=[('waiting', 'Waiting'), ('dispatched', 'Dispatched'), ('deferred', 'Deferred'), ('finished', 'Finished')], db_index=True, default='waiting', max_length=20),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models  # type: ignore
 from s3_file_field import S3FileField  # type: ignore
+from .cache import get_experiment_json, set_experiment_json
 import uuid
 
 
@@ -11,6 +12,7 @@ class LoonUpload(models.Model):
 
     class WorkflowType(models.TextChoices):
         LIVE_CYTE = 'live_cyte'
+        TRACKMATE = 'trackmate'
 
     class FileType(models.TextChoices):
         SEGMENTATIONS = 'segmentations'
@@ -25,16 +27,61 @@ class LoonUpload(models.Model):
     blob = S3FileField(upload_to=upload_path)
 
 
+# Ingest queue entry for a LoonUpload. api/scheduler.py decides, per experiment, when each
+# upload's task is handed to Celery.
+class IngestQueueEntry(models.Model):
+
+    class Status(models.TextChoices):
+        WAITING = 'waiting'
+        DISPATCHED = 'dispatched'
+        # Dispatched, but waiting for a Celery retry (e.g. for another upload's output). Does
+        # not hold a worker slot or count towards the bytes in flight until it runs again.
+        DEFERRED = 'deferred'
+        FINISHED = 'finished'
+
+    upload = models.OneToOneField(LoonUpload, related_name='queue_entry', on_delete=models.CASCADE)
+    experiment_name = models.CharField(max_length=255, db_index=True)
+    queue = models.CharField(max_length=30)
+    task_id = models.CharField(max_length=255, unique=True)
+    # Celery id of the current attempt. Same as task_id unless the monitor requeued the task
+    # (api/monitor.py); clients keep polling task_id.
+    attempt_task_id = models.CharField(max_length=255, db_index=True, default='')
+    requeues = models.IntegerField(default=0)
+    size = models.BigIntegerField(default=0)
+    profile = models.BooleanField(default=False)
+    allow_partial = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.WAITING,
+                              db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.experiment_name}_{self.upload_id}_{self.status}"
+
+
 # Experiment Model. Contains all information regarding a specific experiment.
 class Experiment(models.Model):
 
+    # Serialized experiment is cached when a shared cache is configured (api/cache.py);
+    # api/signals.py invalidates it on Experiment/Location changes.
     def to_json(self):
+        if self.pk is None:
+            return self._build_json()
+        data = get_experiment_json(self.pk)
+        if data is None:
+            data = self._build_json()
+            set_experiment_json(self.pk, data)
+        return data
+
+    def _build_json(self):
         locations = self.locations.all()
         location_data = [location.to_json() for location in locations]
         data = {
             "name": self.name,
             "headers": self.headers.split("|"),
             "compositeTabularDataFilename": self.composite_tabular_data_file_name,
+            "trackSummaryFilename": self.track_summary_file_name,
             "headerTransforms": {
                 "time": self.header_time,
                 "frame": self.header_frame,
@@ -59,6 +106,8 @@ class Experiment(models.Model):
     header_y = models.CharField(max_length=255)
     number_of_locations = models.IntegerField()
     composite_tabular_data_file_name = models.CharField(max_length=255, default='')
+    # Per-track summary written at finalization (see api/views.py summarize_tracks).
+    track_summary_file_name = models.CharField(max_length=255, default='')
 
 
 class Location(models.Model):
@@ -0,0 +1,195 @@
+from celery.result import AsyncResult  # type: ignore
+from collections import Counter
+from django.conf import settings  # type: ignore
+from django.utils import timezone  # type: ignore
+from celery_app import app
+from .models import IngestQueueEntry
+from .scheduler import schedule, task_finished
+from .metrics import (
+    QUEUE_DEPTH,
+    QUEUE_ACTIVE_TASKS,
+    QUEUE_RESERVED_TASKS,
+    SCHEDULER_BACKLOG,
+    SCHEDULER_OLDEST_WAIT_SECONDS,
+    STUCK_TASKS,
+    REQUEUED_TASKS,
+)
+import datetime
+import logging
+import time
+import uuid
+
+'''
+Processing monitor, run by `manage.py processing_monitor`. Every sample it:
+
+- Records broker queue depths, tasks active/reserved on workers, and the ingest scheduler's
+  backlog and oldest waiting upload per queue (see metrics.py), so workers can be scaled
+  on the actual backlog.
+- Requeues dispatched tasks that are stuck: running or PENDING for longer than
+  STUCK_TASK_DEADLINE, or STARTED but missing from the replies of the worker consuming their
+  queue (the worker died). The stuck attempt is revoked and the upload goes back to the
+  scheduler under a new attempt id, since workers drop any message whose id they have
+  revoked. Tasks still running on a pool that cannot terminate them are only reported. A
+  task is requeued at most MAX_TASK_REQUEUES times; after that it is marked as failed.
+- Releases scheduler slots of tasks that finished without the task_postrun signal firing.
+'''
+
+logger = logging.getLogger()
+
+
+def _queue_depth(connection, queue_name: str) -> int:
+    try:
+        with connection.channel() as channel:
+            return channel.queue_declare(queue=queue_name, passive=True).message_count
+    except Exception:
+        # The queue does not exist until something has been published to it.
+        return 0
+
+
+# Flattens a control.inspect() reply to {task_id: task}. None means no worker replied.
+# scheduled() replies wrap each task in a "request".
+def _tasks_by_id(reply):
+    if reply is None:
+        return None
+    return {
+        task.get('request', task)['id']: task.get('request', task)
+        for tasks in reply.values() for task in tasks
+    }
+
+
+# Queues consumed by the workers that replied to active(). Only for those queues does a task
+# missing from the replies mean that no worker has it: a busy worker may miss the timeout.
+def _replied_queues(active_reply, active_queues_reply) -> set:
+    if not active_reply or not active_queues_reply:
+        return set()
+    return {
+        queue['name']
+        for worker, queues in active_queues_reply.items() if worker in active_reply
+        for queue in queues
+    }
+
+
+def _queue_of(task) -> str:
+    return task.get('delivery_info', {}).get('routing_key') or settings.CELERY_TASK_DEFAULT_QUEUE
+
+
+def _requeue(entry: IngestQueueEntry, reason: str):
+    STUCK_TASKS.labels(entry.queue).inc()
+    app.control.revoke(entry.attempt_task_id, terminate=True)
+
+    if entry.requeues >= settings.MAX_TASK_REQUEUES:
+        logger.error(f"Task {entry.task_id} {reason}, giving up after {entry.requeues} requeues")
+        app.backend.mark_as_failure(
+            entry.attempt_task_id,
+            RuntimeError(f"Task {reason} and was requeued {entry.requeues} times"),
+        )
+        task_finished(entry.attempt_task_id)
+        return
+
+    logger.warning(f"Task {entry.task_id} {reason}, requeueing")
+    REQUEUED_TASKS.labels(entry.queue).inc()
+    IngestQueueEntry.objects.filter(pk=entry.pk).update(
+        status=IngestQueueEntry.Status.WAITING,
+        attempt_task_id=str(uuid.uuid4()),
+        dispatched_at=None,
+        requeues=entry.requeues + 1,
+    )
+
+
+# known: every task the replying workers have (active, reserved or scheduled).
+def check_dispatched_tasks(active, now, known=None, replied_queues=frozenset()):
+    deadline = datetime.timedelta(seconds=settings.STUCK_TASK_DEADLINE)
+    grace = datetime.timedelta(seconds=settings.LOST_TASK_GRACE_PERIOD)
+    active = active or {}
+    known = known if known is not None else active
+    requeued = False
+
+    for entry in IngestQueueEntry.objects.filter(status__in=[IngestQueueEntry.Status.DISPATCHED,
+                                                             IngestQueueEntry.Status.DEFERRED]):
+        state = AsyncResult(entry.attempt_task_id).state
+        if state in ('SUCCESS', 'FAILURE', 'REVOKED'):
+            task_finished(entry.attempt_task_id)
+            continue
+        if state not in ('STARTED', 'PENDING', 'RETRY'):
+            continue
+
+        waited = now - entry.dispatched_at
+        running_task = active.get(entry.attempt_task_id)
+        if running_task is not None and running_task.get('time_start'):
+            started = datetime.datetime.fromtimestamp(
+                running_task['time_start'], tz=datetime.timezone.utc
+            )
+            if now - started > deadline:
+                requeued |= _requeue_running(entry, f"has been running for more than {deadline}")
+        elif entry.queue in replied_queues:
+            # The queue's worker replied without it. A PENDING task may still be in the broker
+            # queue, so it gets the full deadline; a retry waits on the worker (scheduled).
+            if entry.attempt_task_id not in known and \
+                    waited > (deadline if state == 'PENDING' else grace):
+                _requeue(entry, "is no longer on any worker")
+                requeued = True
+        elif waited > deadline:
+            _requeue(entry, f"has been {state} for more than {deadline}")
+            requeued = True
+
+    if requeued:
+        schedule()
+
+
+# Requeues a task that is still running. Only prefork workers can terminate it; on other pools
+# the revoke is ignored and requeueing would run the upload twice, so it is only reported.
+def _requeue_running(entry: IngestQueueEntry, reason: str) -> bool:
+    pool = settings.LOON_WORKER_QUEUES.get(entry.queue, {}).get('pool', 'prefork')
+    if pool != 'prefork':
+        STUCK_TASKS.labels(entry.queue).inc()
+        logger.error(f"Task {entry.task_id} {reason} on a {pool} worker, not requeueing")
+        return False
+    _requeue(entry, reason)
+    return True
+
+
+def record_queue_metrics(active, reserved, now):
+    with app.connection_for_read() as connection:
+        for queue_name in settings.LOON_WORKER_QUEUES:
+            QUEUE_DEPTH.labels(queue_name).set(_queue_depth(connection, queue_name))
+
+    active_per_queue = Counter(_queue_of(task) for task in (active or {}).values())
+    reserved_per_queue = Counter(_queue_of(task) for task in (reserved or {}).values())
+    waiting = IngestQueueEntry.objects.filter(status=IngestQueueEntry.Status.WAITING)
+    backlog_per_queue = Counter(waiting.values_list('queue', flat=True))
+    oldest_per_queue = {}
+    for queue_name, created_at in waiting.order_by('-created_at').values_list('queue',
+                                                                              'created_at'):
+        oldest_per_queue[queue_name] = created_at
+
+    for queue_name in settings.LOON_WORKER_QUEUES:
+        QUEUE_ACTIVE_TASKS.labels(queue_name).set(active_per_queue[queue_name])
+        QUEUE_RESERVED_TASKS.labels(queue_name).set(reserved_per_queue[queue_name])
+        SCHEDULER_BACKLOG.labels(queue_name).set(backlog_per_queue[queue_name])
+        oldest = oldest_per_queue.get(queue_name)
+        SCHEDULER_OLDEST_WAIT_SECONDS.labels(queue_name).set(
+            (now - oldest).total_seconds() if oldest else 0
+        )
+
+
+# Takes one sample and then waits for the next one.
+def processing_monitor():
+    # A failed sample (e.g. the broker is unreachable) is logged; the next one runs as usual.
+    try:
+        now = timezone.now()
+        inspect = app.control.inspect(timeout=settings.MONITOR_INSPECT_TIMEOUT)
+        active_reply = inspect.active()
+        active = _tasks_by_id(active_reply)
+        reserved = _tasks_by_id(inspect.reserved())
+        scheduled = _tasks_by_id(inspect.scheduled())
+        replied_queues = _replied_queues(active_reply, inspect.active_queues())
+        if active is None:
+            logger.warning("No Celery workers replied to inspect")
+        known = {**(scheduled or {}), **(reserved or {}), **(active or {})}
+
+        record_queue_metrics(active, reserved, now)
+        check_dispatched_tasks(active, now, known, replied_queues)
+    except Exception as e:
+        logger.error(f"Processing monitor sample failed: {e}")
+
+    time.sleep(settings.MONITOR_INTERVAL)
@@ -0,0 +1,135 @@
+import cProfile
+import queue
+import threading
+
+'''
+Pipelined ingestion. A pipeline is a source followed by stages, each running in its own
+thread(s) with a bounded queue in front of it:
+
+    source (read zip members) -> transform (callback) -> sink (save to storage)
+
+so reading from and writing to storage overlap with the CPU work in between, and the bounded
+queues keep at most a few items per stage in memory. A stage returns the item for the next
+stage, or None to drop it; the last stage's return value is discarded.
+
+If any stage (or the source) raises, the pipeline stops and run() re-raises that error.
+
+Before Python 3.12 cProfile only sees the thread it was enabled in, so a profiled task passes
+a list as `profilers`: each pipeline thread then runs under its own profiler, added to the
+list for the caller to merge. From 3.12 on the caller's profiler already sees every thread.
+'''
+
+# Marks the end of a stage's input.
+_DONE = object()
+# How often blocked threads check whether the pipeline was stopped.
+_POLL_SECONDS = 0.1
+
+
+class Stage:
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = workers
+
+
+class Pipeline:
+    def __init__(self, source, stages, queue_size=8, profilers=None):
+        self.source = source
+        self.profilers = profilers
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._stop = threading.Event()
+        self._errors = []
+        self._lock = threading.Lock()
+        self._running = [stage.workers for stage in stages]
+
+    def _fail(self, error):
+        with self._lock:
+            self._errors.append(error)
+        self._stop.set()
+
+    def _put(self, index, item):
+        while not self._stop.is_set():
+            try:
+                self.queues[index].put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, index):
+        while not self._stop.is_set():
+            try:
+                return self.queues[index].get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    # Signals the next stage once every worker of stage `index` has finished.
+    def _finish(self, index):
+        with self._lock:
+            self._running[index] -= 1
+            last = self._running[index] == 0
+        if last and index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1].workers):
+                self._put(index + 1, _DONE)
+
+    def _feed(self):
+        try:
+            for item in self.source:
+                if self._stop.is_set():
+                    break
+                self._put(0, item)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.stages[0].workers):
+                self._put(0, _DONE)
+
+    def _work(self, index):
+        stage = self.stages[index]
+        try:
+            while True:
+                item = self._get(index)
+                if item is _DONE:
+                    break
+                result = stage.func(item)
+                if result is not None and index + 1 < len(self.stages):
+                    self._put(index + 1, result)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._finish(index)
+
+    def _profiled(self, target, *args):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+: only one profiler may be active, and it covers this thread.
+            return target(*args)
+        with self._lock:
+            self.profilers.append(profiler)
+        try:
+            target(*args)
+        finally:
+            profiler.disable()
+
+    def _thread(self, target, args=(), **kwargs):
+        if self.profilers is not None:
+            target, args = self._profiled, (target, *args)
+        return threading.Thread(target=target, args=args, daemon=True, **kwargs)
+
+    def run(self):
+        threads = [self._thread(self._feed, name="pipeline-source")]
+        for index, stage in enumerate(self.stages):
+            threads += [
+                self._thread(self._work, args=(index,),
+                             name=f"pipeline-{stage.name}-{worker}")
+                for worker in range(stage.workers)
+            ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
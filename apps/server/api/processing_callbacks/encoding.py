@@ -0,0 +1,75 @@
+import base64
+import json
+import numpy as np
+from geojson import Feature, Polygon, dumps
+
+'''
+Description: Serializes cell segmentations.
+
+-- Encodings:
+"geojson" writes a plain GeoJSON Feature with the closed outline as a list of coordinates.
+
+"packed" writes the same Feature without a geometry, and a `packed` member holding the outline
+as unsigned integer offsets from `origin`, interleaved x, y and base64 encoded. origin is the
+minimum x and y of the ring itself, not the Feature's bbox (levels of detail keep the bbox of
+the full outline):
+
+    {"type": "Feature", "geometry": null, "bbox": [...], "properties": {...},
+     "packed": {"type": "Polygon", "origin": [x, y], "dtype": "uint8", "coordinates": "..."}}
+
+dtype is "uint8" when the outline fits in 256 pixels and "uint16" (little-endian) otherwise.
+The ring is not closed; readers repeat the first vertex. Outlines with subpixel coordinates
+or larger than 65536 pixels are written as plain GeoJSON, so the encoding is lossless.
+'''
+
+GEOJSON = "geojson"
+PACKED = "packed"
+ENCODINGS = (GEOJSON, PACKED)
+
+_DTYPES = {"uint8": np.dtype("u1"), "uint16": np.dtype("<u2")}
+
+
+# Serializes one cell outline (an open ring of vertices) with its properties and bbox.
+def encode_feature(ring: np.ndarray, properties: dict, bbox: list, encoding=GEOJSON) -> bytes:
+    if encoding == PACKED:
+        packed = pack_ring(ring)
+        if packed is not None:
+            feature = {"type": "Feature", "geometry": None, "bbox": bbox,
+                       "properties": properties, "packed": packed}
+            return json.dumps(feature, separators=(",", ":")).encode("utf-8")
+    elif encoding != GEOJSON:
+        raise ValueError(f"Unknown segmentation encoding {encoding}")
+
+    coords = np.asarray(ring).tolist()
+    coords.append(coords[0])  # add beginning to end to close loop
+    feature = Feature(geometry=Polygon([coords]), properties=properties, bbox=bbox)
+    return dumps(feature).encode("utf-8")
+
+
+# Packed form of an open ring, or None when it cannot be stored exactly.
+def pack_ring(ring: np.ndarray):
+    ring = np.asarray(ring)
+    if len(ring) == 0 or not np.array_equal(ring, np.round(ring)):
+        return None
+    ring = ring.astype(np.int64)
+    origin = ring.min(axis=0)
+    offsets = ring - origin
+    extent = int(offsets.max())
+    if extent < 2 ** 8:
+        dtype = "uint8"
+    elif extent < 2 ** 16:
+        dtype = "uint16"
+    else:
+        return None
+    return {
+        "type": "Polygon",
+        "origin": origin.tolist(),
+        "dtype": dtype,
+        "coordinates": base64.b64encode(offsets.astype(_DTYPES[dtype]).tobytes()).decode("ascii"),
+    }
+
+
+# Open ring of a packed outline, as an (n, 2) array of absolute coordinates.
+def unpack_ring(packed: dict) -> np.ndarray:
+    offsets = np.frombuffer(base64.b64decode(packed["coordinates"]), dtype=_DTYPES[packed["dtype"]])
+    return offsets.reshape(-1, 2).astype(np.int64) + np.asarray(packed["origin"], dtype=np.int64)
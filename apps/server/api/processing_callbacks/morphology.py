@@ -0,0 +1,125 @@
+import numpy as np
+
+'''
+Description: Shape features of cell outlines, computed for many outlines at once.
+
+Outlines are open rings (first vertex not repeated), ring i being coords[bounds[i]:bounds[i + 1]],
+in image pixels. Every feature is computed with array operations over all rings together:
+
+- area, perimeter and centroid: shoelace sums over the edges
+- eccentricity: of the ellipse with the same second moments as the polygon (0 for a circle)
+- solidity: area over the area of the convex hull
+
+Segmentation ingest writes them to a features table per location (MORPHOLOGY_TABLE_NAME in the
+segmentations folder) that create_composite_tabular_data_file joins by frame and id.
+'''
+
+MORPHOLOGY_TABLE_NAME = "features.parquet"
+# Columns of the features table besides frame and id.
+AREA = "area_px"
+PERIMETER = "perimeter_px"
+CENTROID_X = "centroid_x_px"
+CENTROID_Y = "centroid_y_px"
+ECCENTRICITY = "eccentricity"
+SOLIDITY = "solidity"
+FEATURE_COLUMNS = [AREA, PERIMETER, CENTROID_X, CENTROID_Y, ECCENTRICITY, SOLIDITY]
+
+
+def morphology_features(coords: np.ndarray, bounds: np.ndarray) -> dict:
+    counts = np.diff(bounds)
+    ring_count = len(counts)
+    ring_of_point = np.repeat(np.arange(ring_count), counts)
+    # Relative to each ring's first vertex, so the moment sums do not lose precision.
+    origins = np.zeros((ring_count, 2))
+    nonempty = counts > 0
+    origins[nonempty] = coords[bounds[:-1][nonempty]]
+    points = coords.astype(np.float64) - origins[ring_of_point]
+    x, y = points[:, 0], points[:, 1]
+    following = np.arange(len(points)) + 1
+    following[bounds[1:][nonempty] - 1] = bounds[:-1][nonempty]
+    next_x, next_y = x[following], y[following]
+
+    def ring_sum(values):
+        return np.bincount(ring_of_point, weights=values, minlength=ring_count)
+
+    cross = x * next_y - next_x * y
+    signed_area = ring_sum(cross) / 2
+    perimeter = ring_sum(np.hypot(next_x - x, next_y - y))
+    area = np.abs(signed_area)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Degenerate rings (no area) use the mean of their vertices.
+        has_area = area > 0
+        mean_x = ring_sum(x) / np.maximum(counts, 1)
+        mean_y = ring_sum(y) / np.maximum(counts, 1)
+        centroid_x = np.where(has_area, ring_sum((x + next_x) * cross) / (6 * signed_area), mean_x)
+        centroid_y = np.where(has_area, ring_sum((y + next_y) * cross) / (6 * signed_area), mean_y)
+
+        # Central second moments, normalized by the area.
+        xx = ring_sum((x * x + x * next_x + next_x * next_x) * cross) / (12 * signed_area)
+        yy = ring_sum((y * y + y * next_y + next_y * next_y) * cross) / (12 * signed_area)
+        xy = ring_sum((x * next_y + 2 * x * y + 2 * next_x * next_y + next_x * y) * cross) \
+            / (24 * signed_area)
+        mu20 = xx - centroid_x ** 2
+        mu02 = yy - centroid_y ** 2
+        mu11 = xy - centroid_x * centroid_y
+        spread = np.sqrt(((mu20 - mu02) / 2) ** 2 + mu11 ** 2)
+        major = (mu20 + mu02) / 2 + spread
+        minor = (mu20 + mu02) / 2 - spread
+        eccentricity = np.where(has_area & (major > 0),
+                                np.sqrt(np.clip(1 - minor / major, 0, 1)), 0.0)
+
+        solidity = np.where(has_area, area / convex_hull_areas(points, bounds), 0.0)
+
+    return {
+        AREA: area,
+        PERIMETER: perimeter,
+        CENTROID_X: centroid_x + origins[:, 0],
+        CENTROID_Y: centroid_y + origins[:, 1],
+        ECCENTRICITY: eccentricity,
+        SOLIDITY: np.clip(solidity, 0, 1),
+    }
+
+
+# Area of the convex hull of each ring, as the area under its upper hull minus the area under
+# its lower hull. Only the highest and lowest point of each x can be on those.
+def convex_hull_areas(points: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    ring_count = len(bounds) - 1
+    ring = np.repeat(np.arange(ring_count), np.diff(bounds))
+    if len(ring) == 0:
+        return np.zeros(ring_count)
+    order = np.lexsort((points[:, 0], ring))
+    ring, x, y = ring[order], points[order, 0], points[order, 1]
+    columns = np.flatnonzero(np.r_[True, (ring[1:] != ring[:-1]) | (x[1:] != x[:-1])])
+    ring, x = ring[columns], x[columns]
+    upper = _area_under_upper_hull(ring, x, np.maximum.reduceat(y, columns), ring_count)
+    lower = -_area_under_upper_hull(ring, x, -np.minimum.reduceat(y, columns), ring_count)
+    return upper - lower
+
+
+# Integral of the upper hull of points sorted by ring then x, one point per x: vertices on or
+# below the segment between their neighbors are removed until none are left, and what remains
+# is the upper hull.
+def _area_under_upper_hull(ring, x, y, ring_count):
+    alive = np.ones(len(ring), dtype=bool)
+    while True:
+        index = np.flatnonzero(alive)
+        r, px, py = ring[index], x[index], y[index]
+        middle = np.flatnonzero((r[1:-1] == r[:-2]) & (r[1:-1] == r[2:])) + 1
+        turn = (px[middle] - px[middle - 1]) * (py[middle + 1] - py[middle - 1]) - \
+            (py[middle] - py[middle - 1]) * (px[middle + 1] - px[middle - 1])
+        removable = np.zeros(len(index), dtype=bool)
+        removable[middle] = turn >= 0
+        if not removable.any():
+            break
+        # Only remove every other vertex of a run, so each removal keeps both its neighbors.
+        run_start = removable & ~np.r_[False, removable[:-1]]
+        run_offset = np.arange(len(index)) - np.maximum.accumulate(
+            np.where(run_start, np.arange(len(index)), 0))
+        alive[index[removable & (run_offset % 2 == 0)]] = False
+
+    index = np.flatnonzero(alive)
+    r, px, py = ring[index], x[index], y[index]
+    same_ring = r[1:] == r[:-1]
+    trapezoids = (px[1:] - px[:-1]) * (py[1:] + py[:-1]) / 2
+    return np.bincount(r[1:][same_ring], weights=trapezoids[same_ring], minlength=ring_count)
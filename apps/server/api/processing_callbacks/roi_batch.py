@@ -0,0 +1,296 @@
+import base64
+import json
+import numpy as np
+from roifile import ImagejRoi
+from typing import Callable, List, Optional, Tuple
+from .encoding import GEOJSON, PACKED, encode_feature
+from .morphology import morphology_features
+from .simplify import level_of_detail_outputs, lod_folder, simplify_rings
+
+'''
+Description: Converts many ImageJ ROIs at once.
+
+The ROIs of a batch are joined into one buffer and their 64 byte headers are read as a single
+structured array; the integer coordinates of every polygon are then gathered with one
+vectorized index and the features are serialized from those arrays, instead of building an
+ImagejRoi, a Feature and a Polygon for every cell.
+
+Only the outlines segmentation tools write (polygon, freehand and traced ROIs with integer
+coordinates) take this path. Any other ROI, and any ROI that fails to decode, goes through
+ImagejRoi one by one, so the output and the errors are the same as roi_to_geojson's.
+
+-- Batch callbacks:
+A batch callback takes a list of (file contents, file name) and returns, for each of them, what
+the single file callback would (a tuple or a list of tuples), or the exception it raised.
+
+-- Morphology:
+Given a features list, the converter also computes the shape features of every converted
+outline (see morphology.py) and appends them for each batch, as a dict of columns with the
+frame and id of the cells.
+'''
+
+# ImageJ ROI header, big-endian. Only the fields the fast path needs.
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype({
+    "names": ["magic", "version", "roitype", "top", "left", "bottom", "right", "n_coordinates",
+              "shape_roi_size", "subtype", "options"],
+    "formats": ["S4", ">i2", "u1", ">i2", ">i2", ">i2", ">i2", ">u2", ">i4", ">i2", ">i2"],
+    "offsets": [0, 4, 6, 8, 10, 12, 14, 16, 36, 48, 50],
+    "itemsize": HEADER_SIZE,
+})
+# roifile.ROI_TYPE POLYGON, FREEHAND and TRACED
+OUTLINE_ROI_TYPES = [0, 7, 8]
+SUB_PIXEL_RESOLUTION = 128
+# Coordinates are below 2 ** 16 + 2 ** 15 on the fast path.
+MAX_DIGITS = 6
+VERTEX_SEPARATOR = b", "
+# "[" x ", " y "]" ", "
+VERTEX_TEXT_WIDTH = 1 + MAX_DIGITS + 2 + MAX_DIGITS + 1 + len(VERTEX_SEPARATOR)
+
+
+class DecodedRois:
+    def __init__(self, decoded, bboxes, coords, bounds):
+        # Which buffers were decoded here; the others need ImagejRoi.
+        self.decoded = decoded
+        # [left, bottom, right, top] of each buffer, as in roi_to_geojson's bbox.
+        self.bboxes = bboxes
+        # Vertices of every decoded ROI, one after the other: coords[bounds[i]:bounds[i + 1]].
+        self.coords = coords
+        self.bounds = bounds
+
+    def ring(self, index) -> np.ndarray:
+        return self.coords[self.bounds[index]:self.bounds[index + 1]]
+
+
+def decode_outline_rois(buffers: List[bytes]) -> DecodedRois:
+    count = len(buffers)
+    lengths = np.fromiter((len(buffer) for buffer in buffers), dtype=np.int64, count=count)
+    starts = np.zeros(count, dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    data = np.frombuffer(b"".join(buffers), dtype=np.uint8)
+
+    decoded = lengths >= HEADER_SIZE
+    headers = np.zeros(count, dtype=HEADER_DTYPE)
+    if decoded.any():
+        header_bytes = data[starts[decoded, None] + np.arange(HEADER_SIZE)]
+        headers[decoded] = np.ascontiguousarray(header_bytes).view(HEADER_DTYPE)[:, 0]
+
+    top = headers["top"].astype(np.int64)
+    left = headers["left"].astype(np.int64)
+    bottom = headers["bottom"].astype(np.int64)
+    right = headers["right"].astype(np.int64)
+    n_coordinates = headers["n_coordinates"].astype(np.int64)
+    decoded &= (headers["magic"] == b"Iout") \
+        & np.isin(headers["roitype"], OUTLINE_ROI_TYPES) \
+        & (headers["subtype"] == 0) \
+        & (headers["shape_roi_size"] == 0) \
+        & ((headers["options"] & SUB_PIXEL_RESOLUTION) == 0) \
+        & (n_coordinates > 0) \
+        & (lengths >= HEADER_SIZE + 4 * n_coordinates) \
+        & (top >= 0) & (left >= 0) & (bottom > 0) & (right > 0)  # nothing for roifile to unwrap
+
+    counts = np.where(decoded, n_coordinates, 0)
+    bounds = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(counts, out=bounds[1:])
+    roi_of_vertex = np.repeat(np.arange(count), counts)
+    vertex = np.arange(bounds[-1]) - bounds[:-1][roi_of_vertex]
+    # x values follow the header, then the y values; big-endian int16 offsets from left/top,
+    # read unsigned as roifile unwraps negative values.
+    x_positions = starts[roi_of_vertex] + HEADER_SIZE + 2 * vertex
+    y_positions = x_positions + 2 * counts[roi_of_vertex]
+    coords = np.empty((bounds[-1], 2), dtype=np.int64)
+    coords[:, 0] = _read_uint16(data, x_positions) + left[roi_of_vertex]
+    coords[:, 1] = _read_uint16(data, y_positions) + top[roi_of_vertex]
+
+    bboxes = np.stack([left, bottom, right, top], axis=1)
+    return DecodedRois(decoded, bboxes, coords, bounds)
+
+
+def _read_uint16(data, positions):
+    return (data[positions].astype(np.int64) << 8) | data[positions + 1]
+
+
+# Serializes the decoded ROIs at indices; same JSON as encode_feature.
+def encode_decoded_features(rois: DecodedRois, indices, properties: list, encoding=GEOJSON):
+    if encoding == PACKED:
+        return _encode_packed(rois, indices, properties)
+    if encoding != GEOJSON:
+        raise ValueError(f"Unknown segmentation encoding {encoding}")
+
+    text, text_bounds = _vertex_text(rois.coords)
+    bounds = rois.bounds.tolist()
+    text_bounds = text_bounds.tolist()
+    bboxes = rois.bboxes.tolist()
+    features = []
+    for i, index in enumerate(indices):
+        start, end = text_bounds[bounds[index]], text_bounds[bounds[index + 1]]
+        # The ROI's vertices, then its first vertex again (without the separator) to close
+        # the loop.
+        first_end = text_bounds[bounds[index] + 1] - len(VERTEX_SEPARATOR)
+        left, bottom, right, top = bboxes[index]
+        features.append(b"".join([
+            f'{{"type": "Feature", "bbox": [{left}, {bottom}, {right}, {top}], '
+            '"geometry": {"type": "Polygon", "coordinates": [['.encode("utf-8"),
+            text[start:end], text[start:first_end],
+            f']]}}, "properties": {json.dumps(properties[i])}}}'.encode("utf-8"),
+        ]))
+    return features
+
+
+# "[x, y], " for every vertex, formatted at once: each vertex gets a row of
+# VERTEX_TEXT_WIDTH bytes, and the unused digit columns are masked out. Returns the text and
+# where each vertex's text starts (with one more entry for the end).
+def _vertex_text(coords: np.ndarray):
+    count = len(coords)
+    digits = np.empty((count, 2, MAX_DIGITS), dtype=np.uint8)
+    used = np.empty((count, 2, MAX_DIGITS), dtype=bool)
+    values = coords.astype(np.int32)
+    remaining = values.copy()
+    for column in range(MAX_DIGITS - 1, -1, -1):
+        remaining, digit = np.divmod(remaining, 10)
+        digits[:, :, column] = digit
+        # A number uses the digit columns from its leading digit on (at least the last one).
+        used[:, :, column] = values >= 10 ** (MAX_DIGITS - 1 - column)
+    used[:, :, -1] = True
+    digits += ord("0")
+
+    rows = np.empty((count, VERTEX_TEXT_WIDTH), dtype=np.uint8)
+    mask = np.ones((count, VERTEX_TEXT_WIDTH), dtype=bool)
+    x_columns = slice(1, 1 + MAX_DIGITS)
+    y_columns = slice(3 + MAX_DIGITS, 3 + 2 * MAX_DIGITS)
+    rows[:, 0] = ord("[")
+    rows[:, x_columns], mask[:, x_columns] = digits[:, 0], used[:, 0]
+    rows[:, 1 + MAX_DIGITS:3 + MAX_DIGITS] = np.frombuffer(b", ", dtype=np.uint8)
+    rows[:, y_columns], mask[:, y_columns] = digits[:, 1], used[:, 1]
+    rows[:, 3 + 2 * MAX_DIGITS:] = np.frombuffer(b"]" + VERTEX_SEPARATOR, dtype=np.uint8)
+
+    text_bounds = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(mask.sum(axis=1), out=text_bounds[1:])
+    return rows[mask].tobytes(), text_bounds
+
+
+# Packed features (see encoding.py), with the origins, offsets and widths of all ROIs computed
+# at once.
+def _encode_packed(rois: DecodedRois, indices, properties):
+    if len(indices) == 0:
+        return []
+    decoded = np.flatnonzero(rois.decoded)
+    starts = rois.bounds[decoded]
+    origins = np.zeros((len(rois.decoded), 2), dtype=np.int64)
+    origins[decoded] = np.minimum.reduceat(rois.coords, starts, axis=0)
+    roi_of_vertex = np.repeat(np.arange(len(rois.decoded)), np.diff(rois.bounds))
+    offsets = rois.coords - origins[roi_of_vertex]
+    extents = np.zeros(len(rois.decoded), dtype=np.int64)
+    extents[decoded] = np.maximum.reduceat(offsets.max(axis=1), starts)
+    offsets_uint8 = offsets.astype("u1")
+    offsets_uint16 = offsets.astype("<u2")
+
+    bounds = rois.bounds.tolist()
+    bboxes = rois.bboxes.tolist()
+    features = []
+    for i, index in enumerate(indices):
+        start, end = bounds[index], bounds[index + 1]
+        extent = extents[index]
+        if extent >= 2 ** 16:
+            features.append(encode_feature(rois.ring(index), properties[i], bboxes[index],
+                                           PACKED))
+            continue
+        dtype, packed_offsets = ("uint8", offsets_uint8) if extent < 2 ** 8 \
+            else ("uint16", offsets_uint16)
+        feature = {
+            "type": "Feature", "geometry": None, "bbox": bboxes[index],
+            "properties": properties[i],
+            "packed": {
+                "type": "Polygon",
+                "origin": origins[index].tolist(),
+                "dtype": dtype,
+                "coordinates": base64.b64encode(packed_offsets[start:end].tobytes()).decode(),
+            },
+        }
+        features.append(json.dumps(feature, separators=(",", ":")).encode("utf-8"))
+    return features
+
+
+# Returns a batch callback converting ROIs to cell features. name_parser maps a ROI's file name
+# to the feature's properties and the output file name, and may raise for names it cannot
+# parse.
+def roi_batch_converter(name_parser: Callable[[str], Tuple[dict, str]], lod_tolerances=(),
+                        encoding=GEOJSON, features: Optional[list] = None):
+
+    def convert(members: List[Tuple[bytes, str]]) -> list:
+        results = [None] * len(members)
+        parsed = [None] * len(members)
+        for index, (_, file_name) in enumerate(members):
+            try:
+                parsed[index] = name_parser(file_name)
+            except Exception as e:
+                results[index] = e
+
+        rois = decode_outline_rois([file_contents for file_contents, _ in members])
+        batch = [index for index in range(len(members))
+                 if parsed[index] is not None and rois.decoded[index]]
+        properties = [parsed[index][0] for index in batch]
+        # The full outlines, then each level of detail simplified from the previous one.
+        levels = [encode_decoded_features(rois, batch, properties, encoding)]
+        level_rois = rois
+        for tolerance in sorted(lod_tolerances):
+            coords, bounds = simplify_rings(level_rois.coords, level_rois.bounds, tolerance)
+            level_rois = DecodedRois(rois.decoded, rois.bboxes, coords, bounds)
+            levels.append(encode_decoded_features(level_rois, batch, properties, encoding))
+        for position, index in enumerate(batch):
+            file_name = parsed[index][1]
+            if not lod_tolerances:
+                results[index] = levels[0][position], file_name
+                continue
+            results[index] = [(levels[0][position], file_name)] + [
+                (features[position], f"{lod_folder(level)}/{file_name}")
+                for level, features in enumerate(levels[1:], start=1)
+            ]
+
+        fallback, fallback_rings = [], []
+        for index, (file_contents, _) in enumerate(members):
+            if parsed[index] is not None and not rois.decoded[index]:
+                try:
+                    results[index], ring = _convert_one(file_contents, *parsed[index],
+                                                        lod_tolerances, encoding)
+                except Exception as e:
+                    results[index] = e
+                    continue
+                fallback.append(index)
+                fallback_rings.append(ring)
+
+        if features is not None:
+            features.append(_batch_features(parsed, rois, batch, fallback, fallback_rings))
+        return results
+
+    return convert
+
+
+# The single file conversion, and the outline it read.
+def _convert_one(file_contents, properties, file_name, lod_tolerances, encoding):
+    roi = ImagejRoi.frombytes(file_contents)
+    ring = roi.coordinates()
+    bbox = [roi.left, roi.bottom, roi.right, roi.top]
+    output = encode_feature(ring, properties, bbox, encoding), file_name
+    if lod_tolerances:
+        output = [output] + level_of_detail_outputs(ring, properties, bbox, file_name,
+                                                    lod_tolerances, encoding)
+    return output, ring
+
+
+# Frame, id and shape features of the converted cells: the decoded ones (batch), then the ones
+# ImagejRoi read (fallback).
+def _batch_features(parsed, rois: DecodedRois, batch, fallback, fallback_rings) -> dict:
+    decoded = morphology_features(rois.coords, rois.bounds)
+    fallback_bounds = np.zeros(len(fallback_rings) + 1, dtype=np.int64)
+    np.cumsum([len(ring) for ring in fallback_rings], out=fallback_bounds[1:])
+    read = morphology_features(
+        np.concatenate([np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+                        for ring in fallback_rings] + [np.empty((0, 2))]),
+        fallback_bounds,
+    )
+    cells = [parsed[index][0] for index in batch + fallback]
+    columns = {"frame": [cell["frame"] for cell in cells], "id": [cell["id"] for cell in cells]}
+    for column, values in decoded.items():
+        columns[column] = np.concatenate([values[batch], read[column]])
+    return columns
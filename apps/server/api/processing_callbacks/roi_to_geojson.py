@@ -1,6 +1,10 @@
 from roifile import ImagejRoi
-from geojson import Feature, Polygon, dumps
-from typing import Tuple
+from geojson import Feature, dumps
+from functools import wraps
+from typing import List, Tuple, Union
+from .encoding import GEOJSON, encode_feature
+from .roi_batch import roi_batch_converter
+from .simplify import level_of_detail_outputs
 
 '''
 Author: Devin Lange
@@ -9,29 +13,59 @@ Description: Converts .roi files to geojson for use in Loon
 
 -- Writing Transformations:
 The callback must always have the file contents as bytes and the file namne (as a string). It will
-then return a tuple of the modified data (as bytes) and the new file name (if changed.)
+then return a tuple of the modified data (as bytes) and the new file name (if changed.) A
+callback writing several files returns a list of these tuples instead.
 '''
 
 
-def roi_to_geojson(file_contents: bytes, file_name: str) -> Tuple[bytes, str]:
+def roi_to_geojson(file_contents: bytes, file_name: str, lod_tolerances=(),
+                   encoding=GEOJSON) -> Union[Tuple[bytes, str], List[Tuple[bytes, str]]]:
     frame = parse_frame(file_name)
     cell_id = parse_id(file_name)
     roi = ImagejRoi.frombytes(file_contents)
-    outer_polygon_coords = roi.coordinates().tolist()
-    outer_polygon_coords.append(outer_polygon_coords[0])  # add beginning to end to close loop
-    feature = Feature(
-        geometry=Polygon([outer_polygon_coords]),
-        properties={"id": cell_id, 'frame': frame},
-        bbox=[roi.left, roi.bottom, roi.right, roi.top]
-    )
+    ring = roi.coordinates()
+    properties = {"id": cell_id, 'frame': frame}
+    bbox = [roi.left, roi.bottom, roi.right, roi.top]
 
-    data = feature_to_json(feature)
+    # Plain GeoJSON, or packed integer coordinates (see encoding.py)
+    data_bytes = encode_feature(ring, properties, bbox, encoding)
     if file_name.endswith('.roi'):
         file_name = file_name[:-4] + ".json"
 
-    data_bytes = data.encode('utf-8')
+    if not lod_tolerances:
+        return data_bytes, file_name
+    # Simplified copies for zoomed out views (see simplify.py)
+    return [(data_bytes, file_name)] + level_of_detail_outputs(
+        ring, properties, bbox, file_name, lod_tolerances, encoding
+    )
+
+
+# Returns roi_to_geojson writing levels of detail with the given tolerances (in pixels) and
+# the given encoding.
+def roi_to_geojson_callback(lod_tolerances=(), encoding=GEOJSON):
+
+    @wraps(roi_to_geojson)
+    def configured_roi_to_geojson(file_contents: bytes, file_name: str):
+        return roi_to_geojson(file_contents, file_name, lod_tolerances, encoding)
+
+    return configured_roi_to_geojson
+
+
+# Batch version of roi_to_geojson_callback (see roi_batch.py). Appends the cells' shape
+# features to the features list when one is given.
+def roi_to_geojson_batch_callback(lod_tolerances=(), encoding=GEOJSON, features=None):
+
+    def parse_name(file_name: str):
+        if file_name.endswith('.roi'):
+            new_file_name = file_name[:-4] + ".json"
+        else:
+            new_file_name = file_name
+        frame = parse_frame(file_name)
+        return {"id": parse_id(file_name), 'frame': frame}, new_file_name
 
-    return data_bytes, file_name
+    convert = roi_batch_converter(parse_name, lod_tolerances, encoding, features)
+    convert.__name__ = "roi_to_geojson_batch"
+    return convert
 
 
 def parse_frame(filename: str) -> int:
@@ -0,0 +1,180 @@
+import numpy as np
+from typing import List, Tuple
+from .encoding import GEOJSON, encode_feature
+
+'''
+Description: Levels of detail for cell segmentations.
+
+Each level is a copy of the cell's feature with its outline simplified (Douglas-Peucker) to the
+level's tolerance, in image pixels. Level n of cells/{frame}-{id}.json is written to
+cells/lod{n}/{frame}-{id}.json, and the segmentations folder gets a lod.json index listing the
+levels so the viewer can fetch coarser outlines when zoomed out.
+
+Simplification keeps the outline a valid polygon: a ring that would self-intersect or collapse
+below three vertices is replaced by the previous (finer) level's ring.
+'''
+
+LOD_INDEX_FILE_NAME = "lod.json"
+
+
+def lod_folder(level: int) -> str:
+    return f"lod{level}"
+
+
+# Index of the levels written for a segmentations folder. Level 0 is the full resolution.
+def lod_index(tolerances, cells_folder="cells") -> dict:
+    levels = [{"level": 0, "tolerance": 0, "folder": cells_folder}]
+    for level, tolerance in enumerate(sorted(tolerances), start=1):
+        levels.append({
+            "level": level,
+            "tolerance": tolerance,
+            "folder": f"{cells_folder}/{lod_folder(level)}",
+        })
+    return {"levels": levels}
+
+
+# Serialized features of each level of detail of one cell, named lod{n}/{file_name}.
+def level_of_detail_outputs(ring: np.ndarray, properties: dict, bbox: list, file_name: str,
+                            tolerances, encoding=GEOJSON) -> List[Tuple[bytes, str]]:
+    outputs = []
+    for level, tolerance in enumerate(sorted(tolerances), start=1):
+        ring = simplify_ring(ring, tolerance)
+        outputs.append((encode_feature(ring, properties, bbox, encoding),
+                        f"{lod_folder(level)}/{file_name}"))
+    return outputs
+
+
+# Simplifies an open ring (first vertex not repeated). Returns the ring unchanged when the
+# simplified one is not a simple polygon.
+def simplify_ring(ring: np.ndarray, tolerance: float) -> np.ndarray:
+    ring = np.asarray(ring)
+    coords, _ = simplify_rings(ring, np.array([0, len(ring)]), tolerance)
+    return coords
+
+
+# simplify_ring for many rings at once, ring i being coords[bounds[i]:bounds[i + 1]]. Every
+# ring's Douglas-Peucker splits are found together, one level of the recursion per pass.
+# Returns the simplified coords (a subset of the input vertices) and their bounds.
+def simplify_rings(coords: np.ndarray, bounds: np.ndarray, tolerance: float):
+    counts = np.diff(bounds)
+    ring_count = len(counts)
+    if tolerance <= 0 or not np.any(counts > 3):
+        return coords, bounds
+    points = np.asarray(coords, dtype=np.float64)
+    ring_of_point = np.repeat(np.arange(ring_count), counts)
+    starts = bounds[:-1]
+
+    # Split each ring at the vertex farthest from its first, so each half is an open polyline.
+    far = np.zeros(ring_count, dtype=np.int64)
+    nonempty = np.flatnonzero(counts > 0)
+    distances = ((points - points[starts[ring_of_point]]) ** 2).sum(axis=1)
+    far[nonempty] = _first_argmax(distances, starts[nonempty], counts[nonempty])
+    simplified = (counts > 3) & (far > 0)
+
+    # Closed rings: each ring followed by its first vertex again.
+    closed_counts = np.where(counts > 0, counts + 1, 0)
+    closed_bounds = _bounds(closed_counts)
+    ring_of_closed = np.repeat(np.arange(ring_count), closed_counts)
+    local = np.arange(closed_bounds[-1]) - closed_bounds[:-1][ring_of_closed]
+    closed = points[starts[ring_of_closed] + local % counts[ring_of_closed]]
+    closing = closed_bounds[nonempty + 1] - 1
+
+    keep = ~simplified[ring_of_closed]
+    keep[closed_bounds[nonempty]] = True
+    keep[closing] = True
+    keep[closed_bounds[nonempty] + far[nonempty]] = True
+    while True:
+        kept = np.flatnonzero(keep)
+        interior = np.flatnonzero(~keep)
+        if len(interior) == 0:
+            break
+        # Each interior vertex lies on the segment between the kept vertices around it.
+        segment = np.searchsorted(kept, interior) - 1
+        distances = _segment_distances(closed[interior], closed[kept[segment]],
+                                       closed[kept[segment + 1]])
+        segment_starts = np.flatnonzero(np.r_[True, segment[1:] != segment[:-1]])
+        farthest = segment_starts + _first_argmax(distances, segment_starts,
+                                                  np.diff(np.r_[segment_starts, len(segment)]))
+        farthest = farthest[distances[farthest] > tolerance]
+        if len(farthest) == 0:
+            break
+        keep[interior[farthest]] = True
+
+    keep_open = np.delete(keep, closing)
+    # Keep the original ring where simplification would break it.
+    new_counts = np.bincount(ring_of_point[keep_open], minlength=ring_count)
+    valid = is_simple_rings(coords[keep_open], _bounds(new_counts))
+    keep_open |= (simplified & ~valid)[ring_of_point]
+    new_counts = np.bincount(ring_of_point[keep_open], minlength=ring_count)
+    return coords[keep_open], _bounds(new_counts)
+
+
+def _bounds(counts):
+    bounds = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=bounds[1:])
+    return bounds
+
+
+# Offset of the first maximum of each group values[start:start + count].
+def _first_argmax(values, starts, counts):
+    maxima = np.maximum.reduceat(values, starts)
+    group = np.repeat(np.arange(len(starts)), counts)
+    at_max = np.flatnonzero(values == maxima[group])
+    _, first = np.unique(group[at_max], return_index=True)
+    return at_max[first] - starts
+
+
+# Distance of each point to the segment from the a to the b of the same row.
+def _segment_distances(points, a, b):
+    ab = b - a
+    length_sq = (ab ** 2).sum(axis=1)
+    t = np.clip(((points - a) * ab).sum(axis=1) / np.where(length_sq == 0, 1, length_sq), 0, 1)
+    projections = a + t[:, None] * ab
+    return np.sqrt(((points - projections) ** 2).sum(axis=1))
+
+
+# Whether each ring has at least three vertices and no two non-adjacent edges touching or
+# crossing. Rings with the same number of vertices are checked together.
+def is_simple_rings(coords: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    counts = np.diff(bounds)
+    simple = np.zeros(len(counts), dtype=bool)
+    for count in np.unique(counts[counts >= 3]):
+        rings = np.flatnonzero(counts == count)
+        i, j = np.triu_indices(count, k=2)
+        # The first and last edges share the ring's first vertex.
+        not_adjacent = ~((i == 0) & (j == count - 1))
+        i, j = i[not_adjacent], j[not_adjacent]
+        chunk = max(1, _MAX_EDGE_PAIRS // max(len(i), 1))
+        for chunk_start in range(0, len(rings), chunk):
+            chunk_rings = rings[chunk_start:chunk_start + chunk]
+            vertices = coords[bounds[chunk_rings][:, None] + np.arange(count)].astype(np.float64)
+            simple[chunk_rings] = ~_edges_intersect(vertices, np.roll(vertices, -1, axis=1), i, j)
+    return simple
+
+
+# Checks at most this many pairs of edges at once.
+_MAX_EDGE_PAIRS = 1_000_000
+
+
+def _edges_intersect(starts, ends, i, j):
+    p1, p2, q1, q2 = starts[:, i], ends[:, i], starts[:, j], ends[:, j]
+    d1 = _orientation(q1, q2, p1)
+    d2 = _orientation(q1, q2, p2)
+    d3 = _orientation(p1, p2, q1)
+    d4 = _orientation(p1, p2, q2)
+    crossing = (d1 * d2 < 0) & (d3 * d4 < 0)
+    touching = ((d1 == 0) & _on_segment(q1, q2, p1)) | ((d2 == 0) & _on_segment(q1, q2, p2)) | \
+        ((d3 == 0) & _on_segment(p1, p2, q1)) | ((d4 == 0) & _on_segment(p1, p2, q2))
+    return np.any(crossing | touching, axis=1)
+
+
+def _orientation(a, b, c):
+    return np.sign((b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) -
+                   (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0]))
+
+
+def _on_segment(a, b, c):
+    return (np.minimum(a[..., 0], b[..., 0]) <= c[..., 0]) & \
+        (c[..., 0] <= np.maximum(a[..., 0], b[..., 0])) & \
+        (np.minimum(a[..., 1], b[..., 1]) <= c[..., 1]) & \
+        (c[..., 1] <= np.maximum(a[..., 1], b[..., 1]))
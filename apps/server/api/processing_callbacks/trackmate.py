@@ -0,0 +1,153 @@
+from roifile import ImagejRoi
+from .encoding import GEOJSON, encode_feature
+from .roi_batch import roi_batch_converter
+from .simplify import level_of_detail_outputs
+import os
+import re
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+'''
+Description: Converts raw TrackMate exports (the "All Spots" CSV and the zip of IJ ROIs) to Loon
+data on the server. Server-side port of the docs website's convert_trackmate.py.
+
+-- TrackMate ROI names:
+ROIs are named {LABEL}-{index}.roi, where index is the zero-based position of the spot in its
+track ordered by frame ({LABEL}.roi when index is 0). The frame therefore comes from the spot
+table, through the index built by build_frame_index.
+'''
+
+# TrackMate spot tables have three more header rows (name, short name, units) under the
+# column names.
+TRACKMATE_HEADER_ROWS = 3
+
+# Types of the columns TrackMate always exports that are always integers (or text). The other
+# columns are inferred, as before: an explicit float type would write integer-valued columns
+# such as TRACK_ID, POSITION_Z or RADIUS as "0.0" instead of "0".
+TRACKMATE_DTYPES = {
+    "LABEL": "string",
+    "ID": "int64",
+    "FRAME": "int64",
+    "VISIBILITY": "int64",
+}
+
+# Column names from file
+FRAME = "FRAME"
+INPUT_LABEL = "LABEL"
+# Columns added for Loon
+LABEL = "LOC-LABEL"
+LOCATION = "location"
+LOON_TRACK = "loon_track"
+PARENT = "parent"
+
+
+# Reads a TrackMate spot table in one pass with Arrow's multithreaded CSV reader.
+def read_trackmate_table(file) -> pd.DataFrame:
+    table = pa_csv.read_csv(
+        file,
+        read_options=pa_csv.ReadOptions(skip_rows_after_names=TRACKMATE_HEADER_ROWS),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.type_for_alias(dtype)
+                          for name, dtype in TRACKMATE_DTYPES.items()}
+        ),
+    )
+    return table.to_pandas()
+
+
+# One-indexes and sorts the frames and adds the location, cell label, track and parent columns.
+def prepare_trackmate_table(df: pd.DataFrame, location) -> pd.DataFrame:
+    for column in [INPUT_LABEL, FRAME, "POSITION_X", "POSITION_Y"]:
+        if column not in df.columns:
+            raise ValueError(f"Required column '{column}' is missing from the TrackMate table.")
+
+    df[FRAME] = df[FRAME] + 1
+    df = df.sort_values(by=[FRAME], kind="mergesort")
+    df = df.rename(columns={"LOC": LOCATION})
+    if LOCATION not in df.columns:
+        df[LOCATION] = location
+    if LABEL not in df.columns:
+        df[LABEL] = df[LOCATION].astype(str) + "_" + df[INPUT_LABEL].astype(str)
+    # MANUAL_SPOT_COLOR is always empty
+    df = df.drop(columns=["MANUAL_SPOT_COLOR"], errors="ignore")
+
+    # Track id is the label without its branch suffix
+    df.insert(0, LOON_TRACK, df[LABEL].str.replace(r"\.[^.]*$", "", regex=True))
+    df.insert(1, PARENT, infer_parents(df[LABEL]))
+    return df
+
+
+# Parent of each label: a branch label drops its last character (and the '.' before it),
+# "Track_1.ab" -> "Track_1.a" -> "Track_1". Labels without a branch, or whose parent is not in
+# known_labels, are their own parent. Pass known_labels when labels is only part of the table.
+def infer_parents(labels: pd.Series, known_labels: set = None) -> pd.Series:
+    if known_labels is None:
+        known_labels = set(labels.dropna())
+    candidates = labels.str[:-1].str.rstrip(".")
+    is_branch = labels.str.contains(".", regex=False).fillna(False).astype(bool)
+    return labels.where(~(is_branch & candidates.isin(known_labels)), candidates)
+
+
+# Maps each TrackMate LABEL to its frames in ascending order.
+def build_frame_index(df: pd.DataFrame) -> dict:
+    track_frames = df[[INPUT_LABEL, FRAME]].sort_values(by=[INPUT_LABEL, FRAME], kind="mergesort")
+    return {
+        track_id: frames.to_numpy()
+        for track_id, frames in track_frames.groupby(INPUT_LABEL, sort=False)[FRAME]
+    }
+
+
+# Maps each TrackMate LABEL to the cell id Loon uses for it (the LOC-LABEL column).
+def build_cell_id_index(df: pd.DataFrame) -> dict:
+    return dict(zip(df[INPUT_LABEL], df[LABEL]))
+
+
+def parse_frame(file_name: str, frame_index: dict) -> int:
+    name_base = os.path.splitext(file_name)[0]
+    if "-" not in name_base:
+        name_base = name_base + "-0"
+    track_id, cell_index = name_base.rsplit("-", 1)
+    return int(frame_index[track_id][int(cell_index)])
+
+
+def parse_id(file_name: str, cell_id_index: dict) -> str:
+    track_id = re.sub(r'-\d+$', '', os.path.splitext(file_name)[0])
+    return cell_id_index[track_id]
+
+
+# Returns a processing callback converting one TrackMate ROI to a GeoJSON feature named
+# {frame}-{cell id}.json, the layout the viewer loads cells from, plus its levels of detail
+# when lod_tolerances is given (see simplify.py), serialized with the given encoding (see
+# encoding.py).
+def trackmate_roi_to_geojson_callback(frame_index: dict, cell_id_index: dict, lod_tolerances=(),
+                                      encoding=GEOJSON):
+
+    def trackmate_roi_to_geojson(file_contents: bytes, file_name: str):
+        frame = parse_frame(file_name, frame_index)
+        cell_id = parse_id(file_name, cell_id_index)
+        roi = ImagejRoi.frombytes(file_contents)
+        ring = roi.coordinates()
+        properties = {"id": cell_id, "frame": frame}
+        bbox = [roi.left, roi.bottom, roi.right, roi.top]
+        output = (encode_feature(ring, properties, bbox, encoding), f"{frame}-{cell_id}.json")
+        if not lod_tolerances:
+            return output
+        return [output] + level_of_detail_outputs(ring, properties, bbox, output[1],
+                                                  lod_tolerances, encoding)
+
+    return trackmate_roi_to_geojson
+
+
+# Batch version of trackmate_roi_to_geojson_callback (see roi_batch.py). Appends the cells'
+# shape features to the features list when one is given.
+def trackmate_roi_to_geojson_batch_callback(frame_index: dict, cell_id_index: dict,
+                                            lod_tolerances=(), encoding=GEOJSON, features=None):
+
+    def parse_name(file_name: str):
+        frame = parse_frame(file_name, frame_index)
+        cell_id = parse_id(file_name, cell_id_index)
+        return {"id": cell_id, "frame": frame}, f"{frame}-{cell_id}.json"
+
+    convert = roi_batch_converter(parse_name, lod_tolerances, encoding, features)
+    convert.__name__ = "trackmate_roi_to_geojson_batch"
+    return convert
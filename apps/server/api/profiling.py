@@ -0,0 +1,99 @@
+from django.conf import settings  # type: ignore
+from django.core.files.storage import default_storage  # type: ignore
+from django.core.files.base import ContentFile  # type: ignore
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import tempfile
+import time
+
+'''
+Opt-in profiling of ingest tasks. A profiled task runs Task.execute under cProfile, with a
+profiler per pipeline thread (see api/pipeline.py) merged into the same stats, and writes two
+artifacts next to the experiment's data:
+
+    <experiment>/profiles/<record_id>_<file_type>.prof  -- raw stats (snakeviz, pstats)
+    <experiment>/profiles/<record_id>_<file_type>.txt   -- stage breakdown + top functions
+
+Profiling is enabled per task (execute_task(..., profile=True)), per upload request (the
+`profile` flag on /api/process/), or for a sampled fraction of all tasks
+(TASK_PROFILE_SAMPLE_RATE).
+'''
+
+logger = logging.getLogger()
+
+TOP_FUNCTIONS = 50
+
+
+def should_profile(requested: bool) -> bool:
+    return requested or random.random() < settings.TASK_PROFILE_SAMPLE_RATE
+
+
+def profile_key(curr_task) -> str:
+    return f"{curr_task.experiment_name}/profiles/{curr_task.record_id}_{curr_task.file_type}"
+
+
+def _stats_text(stats: pstats.Stats, curr_task, total_seconds: float) -> str:
+    text = io.StringIO()
+    text.write(f"Task {curr_task.record_id} ({curr_task.file_type}): {total_seconds:.3f}s\n")
+    for stage_name, seconds in curr_task.stage_seconds.items():
+        text.write(f"  {stage_name}: {seconds:.3f}s\n")
+    text.write(f"  bytes written: {curr_task.bytes_written}\n")
+    text.write(f"  files written: {curr_task.files_written}\n\n")
+    stats.stream = text
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+    return text.getvalue()
+
+
+def _save_profile(stats: pstats.Stats, curr_task, total_seconds: float):
+    key = profile_key(curr_task)
+
+    # dump_stats only writes to a path, so go through a local temp file.
+    with tempfile.NamedTemporaryFile(suffix='.prof', delete=False) as temp_file:
+        temp_file_name = temp_file.name
+    try:
+        stats.dump_stats(temp_file_name)
+        with open(temp_file_name, 'rb') as prof_file:
+            prof_key = default_storage.save(f"{key}.prof", prof_file)
+    finally:
+        os.remove(temp_file_name)
+
+    text = _stats_text(stats, curr_task, total_seconds)
+    text_key = default_storage.save(f"{key}.txt", ContentFile(text.encode('utf-8')))
+    return prof_key, text_key
+
+
+# Runs the task under cProfile, stores the profile and adds its key and the per-stage
+# timing breakdown to the task result.
+def execute_profiled(curr_task, task_instance=None):
+    profiler = cProfile.Profile()
+    curr_task.thread_profilers = []
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        response_data = curr_task.execute(task_instance=task_instance)
+    finally:
+        profiler.disable()
+    total_seconds = time.perf_counter() - start
+
+    profile_data = {
+        "total_seconds": total_seconds,
+        "stage_seconds": curr_task.stage_seconds,
+    }
+    try:
+        stats = pstats.Stats(profiler)
+        if curr_task.thread_profilers:
+            stats.add(*curr_task.thread_profilers)
+        profile_data["key"], profile_data["summary_key"] = _save_profile(
+            stats, curr_task, total_seconds
+        )
+        logger.info(f"Saved profile for task {curr_task.record_id} to {profile_data['key']}")
+    except Exception as e:
+        logger.error(f"Failed to save profile for task {curr_task.record_id}: {e}")
+
+    if isinstance(response_data, dict):
+        response_data["profile"] = profile_data
+    return response_data
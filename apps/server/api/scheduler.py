@@ -0,0 +1,162 @@
+from collections import Counter
+from django.conf import settings  # type: ignore
+from django.db import transaction  # type: ignore
+from django.utils import timezone  # type: ignore
+from .models import LoonUpload, IngestQueueEntry
+from .tasks import dispatch_task, queue_for_upload
+import logging
+import uuid
+
+'''
+Ingestion scheduler. Uploads are not handed to Celery directly -- they are put in the
+IngestQueueEntry table and dispatched from there so that:
+
+- Each queue only has as many dispatched tasks as it has worker slots. When slots free up,
+  the experiment with the fewest running tasks on that queue goes next, so one lab's
+  upload cannot fill every slot until all of its zips finish.
+- The total size of the blobs being written to storage at once stays under
+  INGEST_MAX_BYTES_IN_FLIGHT, so concurrent ingests do not saturate MinIO.
+
+A task waiting for a Celery retry (another upload's output, a storage error backoff) gives its
+slot back while it waits (DEFERRED) and takes it again when it runs.
+
+schedule() runs when an upload is submitted and whenever a task finishes or is deferred (see
+signals.py).
+'''
+
+logger = logging.getLogger()
+
+ACTIVE_STATUSES = [IngestQueueEntry.Status.WAITING, IngestQueueEntry.Status.DISPATCHED,
+                   IngestQueueEntry.Status.DEFERRED]
+
+
+def _queue_slots(queue: str) -> int:
+    return settings.LOON_WORKER_QUEUES.get(queue, {}).get('concurrency', 1)
+
+
+def _blob_size(loon_upload: LoonUpload) -> int:
+    try:
+        return loon_upload.blob.size
+    except Exception as e:
+        logger.info(f"Could not get size of {loon_upload.blob.name}: {e}")
+        return 0
+
+
+# Adds the upload to the ingest queue and returns the Celery task id it will run under.
+# The task id is assigned up front so clients can poll it while the upload is still waiting.
+def submit(loon_upload: LoonUpload, profile: bool = False, allow_partial: bool = False) -> str:
+    task_id = str(uuid.uuid4())
+    entry = IngestQueueEntry.objects.create(
+        upload=loon_upload,
+        profile=profile,
+        allow_partial=allow_partial,
+        experiment_name=loon_upload.experiment_name,
+        queue=queue_for_upload(loon_upload),
+        task_id=task_id,
+        attempt_task_id=task_id,
+        size=_blob_size(loon_upload),
+    )
+    schedule()
+    return entry.task_id
+
+
+# Picks the waiting entries that can be dispatched now, fairest first.
+def _select_entries(active_entries):
+    dispatched = [e for e in active_entries if e.status == IngestQueueEntry.Status.DISPATCHED]
+    waiting = [e for e in active_entries if e.status == IngestQueueEntry.Status.WAITING]
+
+    bytes_in_flight = sum(e.size for e in dispatched)
+    running_per_queue = Counter(e.queue for e in dispatched)
+    running_per_experiment = Counter((e.queue, e.experiment_name) for e in dispatched)
+
+    selected = []
+    while waiting:
+        candidates = [e for e in waiting if running_per_queue[e.queue] < _queue_slots(e.queue)]
+        if not candidates:
+            break
+
+        # Fair share: the experiment with the fewest running tasks on the queue goes first,
+        # oldest upload first within an experiment.
+        entry = min(candidates, key=lambda e: (
+            running_per_experiment[(e.queue, e.experiment_name)], e.created_at, e.pk
+        ))
+
+        # Admission control. Always admit something when nothing is writing, otherwise a
+        # single blob larger than the cap could never run. An entry that does not fit holds
+        # back the rest of its queue (so it is not overtaken forever), but not other queues.
+        if bytes_in_flight and bytes_in_flight + entry.size > settings.INGEST_MAX_BYTES_IN_FLIGHT:
+            waiting = [e for e in waiting if e.queue != entry.queue]
+            continue
+
+        waiting.remove(entry)
+        selected.append(entry)
+        bytes_in_flight += entry.size
+        running_per_queue[entry.queue] += 1
+        running_per_experiment[(entry.queue, entry.experiment_name)] += 1
+
+    return selected
+
+
+def schedule():
+    with transaction.atomic():
+        # Locking the active entries serializes concurrent schedulers (web and workers).
+        active_entries = list(
+            IngestQueueEntry.objects.select_for_update()
+            .select_related('upload')
+            .filter(status__in=ACTIVE_STATUSES)
+            .order_by('created_at', 'pk')
+        )
+        selected = _select_entries(active_entries)
+        now = timezone.now()
+        for entry in selected:
+            entry.status = IngestQueueEntry.Status.DISPATCHED
+            entry.dispatched_at = now
+            entry.save(update_fields=['status', 'dispatched_at'])
+
+    for entry in selected:
+        try:
+            dispatch_task(entry.upload, task_id=entry.attempt_task_id, profile=entry.profile,
+                          allow_partial=entry.allow_partial)
+            logger.info(f"Dispatched {entry.attempt_task_id} ({entry.experiment_name}) "
+                        f"to {entry.queue}")
+        except Exception as e:
+            logger.error(f"Failed to dispatch {entry.attempt_task_id}: {e}")
+            IngestQueueEntry.objects.filter(pk=entry.pk).update(
+                status=IngestQueueEntry.Status.WAITING, dispatched_at=None
+            )
+
+
+# Frees the entry's slot and lets the next waiting uploads through. Takes the Celery id of
+# the attempt that finished.
+def task_finished(task_id: str):
+    updated = IngestQueueEntry.objects.filter(
+        attempt_task_id=task_id,
+        status__in=[IngestQueueEntry.Status.DISPATCHED, IngestQueueEntry.Status.DEFERRED],
+    ).update(status=IngestQueueEntry.Status.FINISHED, finished_at=timezone.now())
+    if updated:
+        schedule()
+
+
+# Frees the slot of a task that will be retried later.
+def task_deferred(task_id: str):
+    updated = IngestQueueEntry.objects.filter(
+        attempt_task_id=task_id, status=IngestQueueEntry.Status.DISPATCHED
+    ).update(status=IngestQueueEntry.Status.DEFERRED)
+    if updated:
+        schedule()
+
+
+# A deferred task runs again and takes a slot back. The queue may briefly have one more task
+# than slots; Celery queues it on the worker.
+def task_resumed(task_id: str):
+    IngestQueueEntry.objects.filter(
+        attempt_task_id=task_id, status=IngestQueueEntry.Status.DEFERRED
+    ).update(status=IngestQueueEntry.Status.DISPATCHED)
+
+
+# Celery id to poll for a task id handed out by submit().
+def attempt_task_id(task_id: str) -> str:
+    attempt = IngestQueueEntry.objects.filter(task_id=task_id).values_list(
+        'attempt_task_id', flat=True
+    ).first()
+    return attempt or task_id
@@ -1,3 +1,4 @@
+from django.conf import settings  # type: ignore
 from rest_framework import serializers  # type: ignore
 from .models import Experiment, LoonUpload, Location
 
@@ -16,6 +17,11 @@ class LoonUploadCreateSerializer(UploadCreateSerializer):
     file_name = serializers.CharField()
     location = serializers.CharField()
     experiment_name = serializers.CharField()
+    # Opt-in profiling of the ingest task (see api/profiling.py)
+    profile = serializers.BooleanField(required=False, default=False)
+    # Skip zip members that fail to convert instead of failing the upload (see api/tasks.py)
+    allow_partial = serializers.BooleanField(required=False,
+                                             default=settings.INGEST_ALLOW_PARTIAL)
 
 
 class HeaderTransformSerializer(serializers.Serializer):
@@ -54,6 +60,7 @@ class ExperimentCreateSerializer(serializers.Serializer):
     headers = serializers.CharField()
     number_of_locations = serializers.IntegerField()
     composite_tabular_data_file_name = serializers.CharField()
+    track_summary_file_name = serializers.CharField(required=False, default='')
 
 
 class LocationCreateSerializer(serializers.Serializer):
@@ -0,0 +1,49 @@
+from django.db.models.signals import post_save, post_delete  # type: ignore
+from django.dispatch import receiver  # type: ignore
+from celery.signals import task_postrun, task_prerun  # type: ignore
+from django.utils import timezone  # type: ignore
+from .models import Experiment, Location, IngestQueueEntry
+from .metrics import QUEUE_WAIT_SECONDS
+from .cache import invalidate_experiment_json
+from .scheduler import task_deferred, task_finished, task_resumed
+from .tasks import execute_task
+
+
+# Drop the cached experiment JSON whenever the experiment or one of its locations changes.
+@receiver([post_save, post_delete], sender=Experiment)
+def invalidate_experiment(sender, instance, **kwargs):
+    invalidate_experiment_json(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Location)
+def invalidate_location_experiment(sender, instance, **kwargs):
+    invalidate_experiment_json(instance.experiment_id)
+
+
+# Release the ingest scheduler slot once a task has finished, whether it succeeded or not,
+# and while a task waits to be retried.
+@task_postrun.connect(sender=execute_task)
+def release_ingest_slot(sender=None, task_id=None, state=None, **kwargs):
+    if state == 'RETRY':
+        task_deferred(task_id)
+    else:
+        task_finished(task_id)
+
+
+# A retried task takes its slot back when it runs again.
+@task_prerun.connect(sender=execute_task)
+def resume_ingest_slot(sender=None, task_id=None, task=None, **kwargs):
+    if task is not None and task.request.retries:
+        task_resumed(task_id)
+
+
+# Queue wait covers both time in the ingest scheduler and time in the Celery queue.
+@task_prerun.connect(sender=execute_task)
+def record_queue_wait(sender=None, task_id=None, task=None, **kwargs):
+    if task is not None and task.request.retries:
+        return
+    entry = IngestQueueEntry.objects.filter(attempt_task_id=task_id).first()
+    if entry is not None:
+        QUEUE_WAIT_SECONDS.labels(entry.queue).observe(
+            (timezone.now() - entry.created_at).total_seconds()
+        )
@@ -0,0 +1,245 @@
+from minio_storage.storage import MinioMediaStorage, MinioStorage  # type: ignore
+from minio.commonconfig import ComposeSource  # type: ignore
+from minio.error import S3Error, ServerError  # type: ignore
+from urllib3.exceptions import HTTPError  # type: ignore
+from django.conf import settings  # type: ignore
+from django.core.files.base import ContentFile  # type: ignore
+from django.core.files.storage import FileSystemStorage, default_storage  # type: ignore
+from .cache import cache_get, cache_set, presigned_url_key
+import datetime
+import io
+import logging
+import os
+import random
+import shutil
+import time
+import typing as T
+
+logger = logging.getLogger()
+
+
+# Media storage that re-uses presigned URLs until shortly before their signature expires,
+# instead of signing every object URL again on each request.
+class CachedMinioMediaStorage(MinioMediaStorage):
+
+    def url(self, name: str, *args, max_age: T.Optional[datetime.timedelta] = None) -> str:
+        if not self.presign_urls:
+            return super().url(name, *args, max_age=max_age)
+
+        if max_age is None:
+            max_age = datetime.timedelta(seconds=settings.MINIO_STORAGE_MEDIA_URL_EXPIRY)
+
+        # Expire the cache entry before the signature does so clients never get a dead URL.
+        timeout = int(max_age.total_seconds()) - settings.PRESIGNED_URL_CACHE_MARGIN
+        if timeout <= 0:
+            return super().url(name, *args, max_age=max_age)
+
+        key = presigned_url_key(self.bucket_name, name, max_age)
+        url = cache_get(key)
+        if url is None:
+            url = super().url(name, *args, max_age=max_age)
+            cache_set(key, url, timeout)
+        return url
+
+
+# Places an already uploaded object at target_name without streaming it through the worker.
+#  - Local filesystem: hardlink the temp upload (zero bytes moved). Falls back to a copy if the
+#    target is on another device.
+#  - MinIO: server-side copy (multipart copy for objects over 5 GiB).
+#  - Anything else: regular read + save.
+# With an offset, only the bytes from offset on are placed: a byte range copy on MinIO. A
+# hardlink cannot start mid-file, so locally the tail is copied by the kernel
+# (copy_file_range, which may share extents on filesystems that support it), strategy
+# "range_copy".
+# Returns the saved name and the strategy used.
+def promote(source_name: str, target_name: str, storage=default_storage,
+            offset: int = 0) -> T.Tuple[str, str]:
+    target_name = storage.get_available_name(target_name)
+
+    if isinstance(storage, FileSystemStorage):
+        source_path = storage.path(source_name)
+        target_path = storage.path(target_name)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if offset:
+            return target_name, _copy_range(source_path, target_path, offset)
+        try:
+            os.link(source_path, target_path)
+            return target_name, "hardlink"
+        except OSError as e:
+            logger.info(f"Could not hardlink {source_name} ({e}), copying instead.")
+            shutil.copyfile(source_path, target_path)
+            return target_name, "copy"
+
+    if isinstance(storage, MinioStorage):
+        storage.client.compose_object(
+            storage.bucket_name,
+            target_name,
+            [ComposeSource(storage.bucket_name, source_name, offset=offset or None)],
+        )
+        return target_name, "server_side_copy"
+
+    with storage.open(source_name, 'rb') as source_file:
+        source_file.seek(offset)
+        return storage.save(target_name, ContentFile(source_file.read())), "stream"
+
+
+# Copies source_path from offset on to target_path without reading it into Python. Returns
+# the strategy: "range_copy", or "copy" where the kernel cannot copy between the two files.
+def _copy_range(source_path: str, target_path: str, offset: int) -> str:
+    with open(source_path, 'rb') as source_file, open(target_path, 'wb') as target_file:
+        remaining = os.fstat(source_file.fileno()).st_size - offset
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(source_file.fileno(), target_file.fileno(),
+                                            remaining, offset)
+                if copied == 0:
+                    break
+                offset += copied
+                remaining -= copied
+            return "range_copy"
+        except (AttributeError, OSError) as e:
+            # Not Linux, or a filesystem pair copy_file_range does not support.
+            logger.info(f"Could not copy {source_path} in the kernel ({e}), copying instead.")
+            source_file.seek(offset)
+            shutil.copyfileobj(source_file, target_file)
+            return "copy"
+
+
+# Seekable, read-only file object over a MinIO/S3 object that fetches byte ranges on demand.
+# zipfile only seeks to the central directory and then to each member it reads, so a worker
+# reading a zip through this never downloads the parts of the archive it does not touch.
+# Reads smaller than read_ahead fetch read_ahead bytes and are served from that buffer.
+class RangeRequestFile(io.RawIOBase):
+
+    def __init__(self, client, bucket_name: str, object_name: str, size=None,
+                 read_ahead: int = 8 * 1024 ** 2):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.name = object_name
+        self.read_ahead = read_ahead
+        if size is None:
+            size = with_storage_retries(client.stat_object, bucket_name, object_name).size
+        self.size = size
+        self.bytes_fetched = 0
+        self._position = 0
+        self._buffer = b""
+        self._buffer_start = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def _get_range(self, start: int, length: int) -> bytes:
+        response = self.client.get_object(self.bucket_name, self.name, offset=start, length=length)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def _fetch(self, start: int, length: int) -> bytes:
+        data = with_storage_retries(self._get_range, start, length)
+        self.bytes_fetched += len(data)
+        return data
+
+    def read(self, size=-1):
+        if self._position >= self.size:
+            return b""
+        if size is None or size < 0:
+            size = self.size - self._position
+        end = min(self._position + size, self.size)
+
+        buffer_end = self._buffer_start + len(self._buffer)
+        if not (self._buffer_start <= self._position and end <= buffer_end):
+            length = min(max(end - self._position, self.read_ahead), self.size - self._position)
+            self._buffer = self._fetch(self._position, length)
+            self._buffer_start = self._position
+
+        offset = self._position - self._buffer_start
+        data = self._buffer[offset:offset + end - self._position]
+        self._position += len(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def readall(self):
+        return self.read()
+
+
+# Opens a stored object for random access: range requests on MinIO, a local file otherwise.
+def open_for_random_access(name: str, storage=default_storage):
+    if isinstance(storage, MinioStorage):
+        return RangeRequestFile(storage.client, storage.bucket_name, name,
+                                read_ahead=settings.RANGE_READ_AHEAD_BYTES)
+    return storage.open(name, 'rb')
+
+
+# S3 error codes that mean "try again later" rather than "this request is wrong".
+TRANSIENT_S3_CODES = {
+    'InternalError', 'RequestTimeout', 'ServiceUnavailable', 'SlowDown',
+    'XMinioServerNotInitialized',
+}
+
+
+# True for errors a retry may fix: dropped connections, timeouts, throttling and 5xx responses.
+# Follows the explicit cause chain, since django-minio-storage wraps client errors in
+# MinIOError. Not the implicit context: an error raised while handling a connection error is
+# not itself a connection error.
+def is_transient_storage_error(error: BaseException) -> bool:
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (ConnectionError, TimeoutError, HTTPError, ServerError)):
+            return True
+        if isinstance(error, S3Error) and error.code in TRANSIENT_S3_CODES:
+            return True
+        error = getattr(error, 'cause', None) or error.__cause__
+    return False
+
+
+# Exponential backoff with full jitter: a random delay in [0, min(cap, base * 2 ** attempt)].
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# Calls func, retrying transient storage errors with backoff. File-like arguments are
+# rewound before each retry so a partially consumed upload body is sent again in full.
+def with_storage_retries(func, *args, attempts=None, **kwargs):
+    if attempts is None:
+        attempts = settings.STORAGE_RETRY_ATTEMPTS
+    for attempt in range(attempts):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient_storage_error(e):
+                raise
+            delay = backoff_delay(attempt, settings.STORAGE_RETRY_BACKOFF,
+                                  settings.STORAGE_RETRY_BACKOFF_MAX)
+            logger.warning(f"Transient storage error in {func.__name__} ({e}), "
+                           f"retrying in {delay:.1f}s")
+            time.sleep(delay)
+            for arg in args:
+                if hasattr(arg, 'seek'):
+                    arg.seek(0)
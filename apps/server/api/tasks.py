@@ -1,15 +1,46 @@
 from abc import abstractmethod, ABC
+from contextlib import contextmanager
 import zipfile
 import logging
 from celery import shared_task  # type: ignore
 from .models import LoonUpload
 from django.core.files.storage import default_storage  # type: ignore
 from django.core.files.base import ContentFile  # type: ignore
+from django.conf import settings  # type: ignore
 import csv
 import io
-from .processing_callbacks.roi_to_geojson import roi_to_geojson
+import json
+import pandas as pd
+from .processing_callbacks.roi_to_geojson import roi_to_geojson_batch_callback
+from .processing_callbacks import morphology, simplify
+from .processing_callbacks import trackmate
+from .profiling import should_profile, execute_profiled
+from .storage import (
+    promote,
+    open_for_random_access,
+    is_transient_storage_error,
+    backoff_delay,
+    with_storage_retries,
+)
+from . import lifecycle
+from .pipeline import Pipeline, Stage
+from .metrics import (
+    ZIP_READ_SECONDS,
+    CALLBACK_SECONDS,
+    STORAGE_SAVE_SECONDS,
+    STORAGE_BYTES_WRITTEN,
+    TASK_SECONDS,
+    TASK_BYTES,
+    TASK_FILES,
+    TASKS_TOTAL,
+    STORAGE_PROMOTIONS,
+)
+import threading
+import time
 
 BAD_FILES = [".DS_Store", "__MACOSX"]
+# Failed members listed in a partial task result; the stored failure report has all of them.
+MAX_FAILURES_IN_RESULT = 100
 
 # Configure logging
 
@@ -64,6 +95,14 @@ class CallbackException(Exception):
         super().__init__(self.message)
 
 
+class DependencyNotReadyException(Exception):
+    """Raised when a task needs the output of another upload that has not been processed yet."""
+
+    def __init__(self, message="Waiting for another upload to be processed"):
+        self.message = message
+        super().__init__(self.message)
+
+
 class Task(ABC):
     def __str__(self):
         return f"\nFile name: {self.file_name}\nLocation: {self.location}\n" \
@@ -78,73 +117,245 @@ class Task(ABC):
             self.blob = kwargs["blob"]
             self.record_id = kwargs["record_id"]
             self.location_prefix = f"location_{self.location}"
+            self.file_type = kwargs.get("file_type", "")
+            # Totals written to storage, reported as metrics once the task finishes.
+            self.bytes_written = 0
+            self.files_written = 0
+            # Wall time per stage (read, callback, save), reported when the task is profiled.
+            # Summed over the pipeline threads running the stage.
+            self.stage_seconds = {"read": 0.0, "callback": 0.0, "save": 0.0}
+            # Guards the counters above, which are updated from the pipeline threads.
+            self.counter_lock = threading.Lock()
+            # Set by profiling.execute_profiled to also profile the pipeline threads.
+            self.thread_profilers = None
+            # Partial-failure mode: skip members that cannot be read or converted instead of
+            # failing the whole upload, and report them (see record_failure).
+            self.allow_partial = kwargs.get("allow_partial", False)
+            self.failures = []
         except KeyError as e:
             raise FailedToCreateTaskException(f"Failed to create task:{e.message}")
 
+    # Times a stage of the task into both its histogram and the per-task stage breakdown.
+    @contextmanager
+    def stage(self, stage_name, histogram=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if histogram is not None:
+                histogram.observe(elapsed)
+            with self.counter_lock:
+                self.stage_seconds[stage_name] += elapsed
+
+    # Saves a file to storage, recording save latency and the amount written. Transient
+    # storage errors are retried with backoff (storage.with_storage_retries).
+    def save_file(self, file_name, content, size):
+        with self.stage("save", STORAGE_SAVE_SECONDS):
+            saved_name = with_storage_retries(default_storage.save, file_name, content)
+        with self.counter_lock:
+            self.bytes_written += size
+            self.files_written += 1
+        STORAGE_BYTES_WRITTEN.labels(self.file_type).inc(size)
+        return saved_name
+
+    # Saves a file that a previous upload of the location may already have written.
+    # default_storage.save would otherwise pick a new, suffixed name and leave the old file
+    # in place.
+    def replace_file(self, file_name, content, size):
+        if default_storage.exists(file_name):
+            default_storage.delete(file_name)
+        return self.save_file(file_name, content, size)
+
+    # Moves the uploaded blob (from offset on) to file_name without rewriting it (see
+    # storage.promote).
+    def promote_file(self, file_name, offset=0):
+        with self.stage("save", STORAGE_SAVE_SECONDS):
+            saved_name, strategy = with_storage_retries(promote, self.blob.name, file_name,
+                                                        offset=offset)
+        with self.counter_lock:
+            self.files_written += 1
+        STORAGE_PROMOTIONS.labels(strategy).inc()
+        logger.info(f"Promoted {self.blob.name} to {saved_name} ({strategy})")
+        return saved_name
+
+    def record_failure(self, file_name, error):
+        logger.error(f"Skipping {file_name} in task {self.record_id}: {error}")
+        self.failures.append({"file": file_name, "error": f"{type(error).__name__}: {error}"})
+
+    # Stores every recorded failure next to the experiment's data and returns the key.
+    def save_failure_report(self):
+        report = {
+            "record_id": self.record_id,
+            "file_name": self.file_name,
+            "location": str(self.location),
+            "failures": self.failures,
+        }
+        key = f"{self.experiment_name}/failures/{self.record_id}_{self.file_type}.json"
+        return with_storage_retries(
+            default_storage.save, key, ContentFile(json.dumps(report).encode('utf-8'))
+        )
+
+    # Runs a pipeline step on one zip member. In partial mode a failing member is recorded and
+    # dropped; storage outages always propagate so execute_task can retry them.
+    def skip_or_raise(self, step, curr_file_name, *args):
+        try:
+            return step(*args)
+        except Exception as e:
+            if self.allow_partial and not is_transient_storage_error(e):
+                self.record_failure(curr_file_name, e)
+                return None
+            raise
+
+    # Deletes the temp upload. Only called once the task succeeded; orphaned uploads are
+    # expired by lifecycle.expire_temp_uploads.
     def cleanup_temp_files(self):
-        # os.remove(self.temp_file_path)
-        logger.info('Fake Cleaning')
-
-    # Generic unpacking of a zip file with callback for additional processing.
+        try:
+            default_storage.delete(self.blob.name)
+            logger.info(f"Deleted temp upload {self.blob.name}")
+        except Exception as e:
+            logger.error(f"Failed to delete temp upload {self.blob.name}: {e}")
+
+    # Generic unpacking of a zip file with callback for additional processing. Runs as a
+    # pipeline (see api/pipeline.py): zip members are read, passed through the callback and
+    # saved by separate stages, so storage reads and writes overlap with the callback.
+    # A batch_callback (see processing_callbacks/roi_batch.py) is used instead of callback
+    # when given, and receives the members ZIP_BATCH_SIZE at a time.
     def process_zip_file(self,
                          base_file_location="",
                          callback=None,
                          base_file_location_suffix="",
-                         task_instance=None
+                         task_instance=None,
+                         batch_callback=None
                          ):
         try:
             companion_ome = ""
-            with zipfile.ZipFile(self.blob, 'r') as zip_ref:
+            # Range reads: only the central directory and the members are fetched.
+            with open_for_random_access(self.blob.name) as blob_file, \
+                    zipfile.ZipFile(blob_file, 'r') as zip_ref:
                 zip_contents = zip_ref.namelist()
                 total = len(zip_contents)
-                for i, curr_file_name in enumerate(zip_contents):
-                    if not _badFileChecker(
-                        curr_file_name
-                    ):
+                progress = {"current": 0}
+                progress_lock = threading.Lock()
+
+                def read_member(curr_file_name):
+                    with self.stage("read", ZIP_READ_SECONDS):
+                        file_contents = zip_ref.read(curr_file_name)
+                    # Removes all prefixes to the file from the zip
+                    return file_contents, curr_file_name.split("/")[-1]
+
+                # Source stage: the zip is read from one thread, in archive order.
+                def read_members():
+                    nonlocal companion_ome
+                    for curr_file_name in zip_contents:
+                        if _badFileChecker(curr_file_name):
+                            continue
                         if curr_file_name.endswith('.companion.ome'):
                             companion_ome = curr_file_name
-                        file_contents = zip_ref.read(curr_file_name)
-                        if file_contents:
-                            # Removes all prefixes to the file from the zip
-                            corrected_curr_file_name = curr_file_name.split("/")[-1]
-                            if corrected_curr_file_name.endswith('.companion.ome'):
-                                companion_ome = corrected_curr_file_name
-
-                            if callback:
-                                try:
-                                    file_contents, corrected_curr_file_name = callback(
-                                        file_contents, corrected_curr_file_name
-                                    )
-                                except CallbackException as e:
-                                    return {
-                                        "process_zip_file_status": "FAILED",
-                                        "message": f"Failed at callback: {e.message}",
-                                    }
-
-                            file_location = f"{base_file_location}/{base_file_location_suffix}/" \
-                                            f"{corrected_curr_file_name}"
-                            # Create a ContentFile object with the file contents
-                            content_file = ContentFile(file_contents)
-
-                            # Set the size attribute explicitly (if possible)
-                            try:
-                                content_file.size = len(file_contents)
-                            except AttributeError:
-                                logger.info('Could not set file manually')
-                                pass  # If setting size manually is not possible
-
-                            default_storage.save(file_location, content_file)
-                            if task_instance:
-                                task_instance.update_state(
-                                    state='STARTED',
-                                    meta={
-                                        'metadata': {
-                                            'current': i, 'total': total
-                                        }
-                                    }
-                                )
+                        member = self.skip_or_raise(read_member, curr_file_name, curr_file_name)
+                        if member is None or not member[0]:
+                            continue
+                        if member[1].endswith('.companion.ome'):
+                            companion_ome = member[1]
+                        yield curr_file_name, member
+
+                def run_callback(curr_file_name, member):
+                    file_contents, corrected_curr_file_name = member
+                    with self.stage("callback", CALLBACK_SECONDS.labels(callback.__name__)):
+                        outputs = callback(file_contents, corrected_curr_file_name)
+                    # Callbacks writing several files return a list of (contents, name)
+                    return outputs if isinstance(outputs, list) else [outputs]
+
+                def transform(item):
+                    curr_file_name, member = item
+                    outputs = self.skip_or_raise(run_callback, curr_file_name, curr_file_name,
+                                                 member)
+                    return None if outputs is None else (curr_file_name, outputs)
+
+                # Sink stage: saves run on several threads since they wait on storage.
+                def save(item):
+                    _, outputs = item
+                    if callback is None and batch_callback is None:
+                        outputs = [outputs]
+                    for file_contents, corrected_curr_file_name in outputs:
+                        file_location = f"{base_file_location}/{base_file_location_suffix}/" \
+                                        f"{corrected_curr_file_name}"
+                        # Create a ContentFile object with the file contents
+                        content_file = ContentFile(file_contents)
+
+                        # Set the size attribute explicitly (if possible)
+                        try:
+                            content_file.size = len(file_contents)
+                        except AttributeError:
+                            logger.info('Could not set file manually')
+                            pass  # If setting size manually is not possible
+
+                        self.save_file(file_location, content_file, len(file_contents))
+                    with progress_lock:
+                        progress["current"] += 1
+                        current = progress["current"]
+                    if task_instance:
+                        task_instance.update_state(
+                            state='STARTED',
+                            meta={
+                                'metadata': {
+                                    'current': current, 'total': total
+                                }
+                            }
+                        )
+
+                def read_batches():
+                    batch = []
+                    for item in read_members():
+                        batch.append(item)
+                        if len(batch) >= settings.ZIP_BATCH_SIZE:
+                            yield batch
+                            batch = []
+                    if batch:
+                        yield batch
+
+                def transform_batch(batch):
+                    with self.stage("callback", CALLBACK_SECONDS.labels(batch_callback.__name__)):
+                        results = batch_callback([member for _, member in batch])
+                    converted = []
+                    for (curr_file_name, _), outputs in zip(batch, results):
+                        if isinstance(outputs, Exception):
+                            if not self.allow_partial:
+                                raise outputs
+                            self.record_failure(curr_file_name, outputs)
+                            continue
+                        converted.append(
+                            (curr_file_name, outputs if isinstance(outputs, list) else [outputs])
+                        )
+                    return converted or None
+
+                def save_batch(batch):
+                    for item in batch:
+                        save(item)
+
+                if batch_callback:
+                    source = read_batches()
+                    stages = [
+                        Stage("callback", transform_batch, settings.PIPELINE_CALLBACK_WORKERS),
+                        Stage("save", save_batch, settings.PIPELINE_SAVE_WORKERS),
+                    ]
+                else:
+                    source = read_members()
+                    stages = []
+                    if callback:
+                        stages.append(Stage("callback", transform,
+                                            settings.PIPELINE_CALLBACK_WORKERS))
+                    stages.append(Stage("save", save, settings.PIPELINE_SAVE_WORKERS))
+                try:
+                    Pipeline(source, stages, settings.PIPELINE_QUEUE_SIZE,
+                             profilers=self.thread_profilers).run()
+                except CallbackException as e:
+                    return {
+                        "process_zip_file_status": "FAILED",
+                        "message": f"Failed at callback: {e.message}",
+                    }
 
-            return {
+            response_data = {
                     "processed_zip_file_status": "SUCCESS",
                     "base_file_location": base_file_location,
                     "companion_ome": companion_ome,
@@ -153,12 +364,58 @@ class Task(ABC):
                         "current": total
                         }
                     }
+            if self.failures:
+                return self.partial_result(total, response_data)
+            return response_data
 
         except FileNotFoundError:
             return {"process_zip_file_status": "FAILED", "message": "Could not find file"}
 
+    # Writes the index of the segmentation levels of detail next to the cells folder once the
+    # zip was converted (see processing_callbacks/simplify.py).
+    def save_lod_index(self, data, base_file_location, tolerances):
+        if not tolerances or \
+                data.get("processed_zip_file_status") not in ("SUCCESS", "PARTIAL"):
+            return data
+        index = json.dumps(simplify.lod_index(tolerances)).encode('utf-8')
+        self.replace_file(f"{base_file_location}/{simplify.LOD_INDEX_FILE_NAME}",
+                          io.BytesIO(index), len(index))
+        return data
+
+    # Writes the shape features of the converted cells (the dicts a batch callback appended to
+    # features, see processing_callbacks/roi_batch.py) as the location's features table.
+    def save_morphology_table(self, data, base_file_location, features):
+        if not features or \
+                data.get("processed_zip_file_status") not in ("SUCCESS", "PARTIAL"):
+            return data
+        df = pd.concat([pd.DataFrame(batch) for batch in features], ignore_index=True)
+        output_bytes = df.to_parquet(index=False)
+        self.replace_file(f"{base_file_location}/{morphology.MORPHOLOGY_TABLE_NAME}",
+                          io.BytesIO(output_bytes), len(output_bytes))
+        return data
+
+    # Adds the failure report to a partial result. Fails the task when nothing could be read.
+    def partial_result(self, total, response_data):
+        if len(self.failures) >= total:
+            return {
+                "process_zip_file_status": "FAILED",
+                "message": f"All {total} files failed, first error: {self.failures[0]['error']}",
+            }
+        response_data["processed_zip_file_status"] = "PARTIAL"
+        response_data["failed_count"] = len(self.failures)
+        response_data["failures"] = self.failures[:MAX_FAILURES_IN_RESULT]
+        try:
+            response_data["failure_report"] = self.save_failure_report()
+        except Exception as e:
+            logger.error(f"Failed to save failure report for task {self.record_id}: {e}")
+        return response_data
+
     def process_csv_file(self, base_file_location="", skip_rows=0, delimiter=',', callback=None):
 
+        # Nothing to rewrite: only read the header and promote the upload in place.
+        if callback is None:
+            return self.promote_csv_file(base_file_location, skip_rows, delimiter)
+
         with self.blob.open('rb') as file:
             text_stream = io.TextIOWrapper(file, encoding='utf-8')
             csv_reader = csv.reader(text_stream, delimiter=delimiter)
@@ -166,12 +423,13 @@ class Task(ABC):
             remaining_rows = []
 
             # Skip first N rows
-            for idx, row in enumerate(csv_reader):
-                if idx < skip_rows:
-                    continue
-                if idx == skip_rows:
-                    column_names.append(row)
-                remaining_rows.append(row)
+            with self.stage("read"):
+                for idx, row in enumerate(csv_reader):
+                    if idx < skip_rows:
+                        continue
+                    if idx == skip_rows:
+                        column_names.append(row)
+                    remaining_rows.append(row)
 
             # Convert the remaining rows back to a CSV format
             output_stream = io.StringIO()
@@ -186,16 +444,17 @@ class Task(ABC):
             # Callback
             if callback:
                 try:
-                    output_bytes, file_name = callback(
-                        output_bytes, file_name
-                    )
+                    with self.stage("callback", CALLBACK_SECONDS.labels(callback.__name__)):
+                        output_bytes, file_name = callback(
+                            output_bytes, file_name
+                        )
                 except CallbackException as e:
                     return {
                         "process_zip_file_status": "FAILED",
                         "message": f"Failed at callback: {e.message}",
                     }
 
-            default_storage.save(file_name, io.BytesIO(output_bytes))
+            self.save_file(file_name, io.BytesIO(output_bytes), len(output_bytes))
 
             return {
                 "processed_csv_file": "SUCCESS",
@@ -203,6 +462,24 @@ class Task(ABC):
                 "base_file_location": base_file_location
             }
 
+    # The skipped rows are dropped by promoting the upload from the header line on, so the
+    # rest of the file is never read here. Skipped rows are single lines (title rows). With
+    # skipped rows the upload cannot be hardlinked; its tail is copied (see storage.promote).
+    def promote_csv_file(self, base_file_location="", skip_rows=0, delimiter=','):
+        with self.blob.open('rb') as file:
+            with self.stage("read"):
+                offset = sum(len(file.readline()) for _ in range(skip_rows))
+                header = file.readline().decode('utf-8')
+        column_names = next(csv.reader([header], delimiter=delimiter), [])
+
+        self.promote_file(f"{base_file_location}/{self.file_name}", offset)
+
+        return {
+            "processed_csv_file": "SUCCESS",
+            "headers": column_names,
+            "base_file_location": base_file_location
+        }
+
     # Declare abstract execute method
     @abstractmethod
     def execute(self, task_instance=None):
@@ -216,41 +493,56 @@ class Task(ABC):
     # Method to initialize correct task dependent on the workflow_code and the workflow_file_type.
     @staticmethod
     def create_task(workflow_code, workflow_file_type, **kwargs):
-        if workflow_code == "live_cyte":
-            if workflow_file_type == "segmentations":
-                logger.info("Got a segmentations task")
-                return LiveCyteSegmentationsTask(**kwargs)
-            elif workflow_file_type == "cell_images":
-                logger.info("Got a cell_images task")
-                return LiveCyteCellImagesTask(**kwargs)
-            elif workflow_file_type == "metadata":
-                logger.info("Got a metadata task")
-                return LiveCyteMetadataTask(**kwargs)
-            else:
-                raise FailedToCreateTaskException(
-                    f"Unknown task type {workflow_file_type} for workflow {workflow_code}"
-                )
+        if workflow_code not in TASK_REGISTRY:
+            raise FailedToCreateTaskException(f"Unknown workflow {workflow_code}")
+        task_class = TASK_REGISTRY[workflow_code].get(workflow_file_type)
+        if task_class is None:
+            raise FailedToCreateTaskException(
+                f"Unknown task type {workflow_file_type} for workflow {workflow_code}"
+            )
+        logger.info(f"Got a {workflow_code} {workflow_file_type} task")
+        return task_class(**kwargs)
 
 
+# Task class for each workflow code and file type, filled in by @register_task.
+TASK_REGISTRY = {}
+
+
+def register_task(workflow_code, *file_types):
+    def register(task_class):
+        for file_type in file_types:
+            TASK_REGISTRY.setdefault(workflow_code, {})[file_type] = task_class
+        return task_class
+    return register
+
+
+@register_task("live_cyte", "segmentations")
 class LiveCyteSegmentationsTask(Task):
     def execute(self, task_instance=None):
         logger.info(f"Executing task: {self.record_id}")
         base_file_location = f"{self.experiment_name}/" \
                              f"location_{self.location}/" \
                              "segmentations"
+        tolerances = settings.SEGMENTATION_LOD_TOLERANCES
+        features = [] if settings.SEGMENTATION_MORPHOLOGY else None
         data = self.process_zip_file(
             base_file_location=base_file_location,
-            callback=roi_to_geojson,
+            batch_callback=roi_to_geojson_batch_callback(tolerances,
+                                                         settings.SEGMENTATION_ENCODING,
+                                                         features),
             base_file_location_suffix="cells",
             task_instance=task_instance
             )
-        return data
+        data = self.save_morphology_table(data, base_file_location, features)
+        return self.save_lod_index(data, base_file_location, tolerances)
 
     def cleanup(self):
         logger.info(f"Cleaning up task: {self.record_id}")
         self.cleanup_temp_files()
 
 
+@register_task("live_cyte", "cell_images")
+@register_task("trackmate", "cell_images")
 class LiveCyteCellImagesTask(Task):
     def execute(self, task_instance=None):
         logger.info(f"Executing task: {self.record_id}")
@@ -269,6 +561,7 @@ class LiveCyteCellImagesTask(Task):
         self.cleanup_temp_files()
 
 
+@register_task("live_cyte", "metadata")
 class LiveCyteMetadataTask(Task):
     def execute(self, task_instance=None):
         logger.info(f"Executing task: {self.record_id}")
@@ -284,8 +577,108 @@ class LiveCyteMetadataTask(Task):
         self.cleanup_temp_files()
 
 
-@shared_task(bind=True)
-def execute_task(self, record_id):
+# Converts the raw TrackMate "All Spots" table: skips the extra header rows, one-indexes and
+# sorts the frames and adds the location, LOC-LABEL, loon_track and parent columns.
+@register_task("trackmate", "metadata")
+class TrackMateMetadataTask(Task):
+    def execute(self, task_instance=None):
+        logger.info(f"Executing task: {self.record_id}")
+        base_file_location = f"{self.experiment_name}/" \
+            f"location_{self.location}"
+
+        with self.blob.open('rb') as file:
+            with self.stage("read"):
+                df = trackmate.read_trackmate_table(file)
+        with self.stage("callback", CALLBACK_SECONDS.labels("prepare_trackmate_table")):
+            df = trackmate.prepare_trackmate_table(df, int(self.location))
+            output_bytes = df.to_csv(index=False).encode('utf-8')
+
+        self.save_file(trackmate_table_name(self.experiment_name, self.location, self.file_name),
+                       io.BytesIO(output_bytes), len(output_bytes))
+
+        return {
+            "processed_csv_file": "SUCCESS",
+            "headers": list(df.columns),
+            "base_file_location": base_file_location
+        }
+
+    def cleanup(self):
+        logger.info(f"Cleaning up task: {self.record_id}")
+        self.cleanup_temp_files()
+
+
+# Converts the zip of TrackMate ROIs. ROI names only carry the spot's position in its track,
+# so the frames come from the location's converted metadata table; until that exists the
+# task raises DependencyNotReadyException and execute_task retries it later.
+@register_task("trackmate", "segmentations")
+class TrackMateSegmentationsTask(Task):
+    def execute(self, task_instance=None):
+        logger.info(f"Executing task: {self.record_id}")
+        base_file_location = f"{self.experiment_name}/" \
+                             f"location_{self.location}/" \
+                             "segmentations"
+
+        table_name = find_trackmate_table(self.experiment_name, self.location)
+        with self.stage("read"):
+            with default_storage.open(table_name, 'rb') as file:
+                df = pd.read_csv(file, usecols=[trackmate.INPUT_LABEL, trackmate.FRAME,
+                                                trackmate.LABEL])
+            features = [] if settings.SEGMENTATION_MORPHOLOGY else None
+            batch_callback = trackmate.trackmate_roi_to_geojson_batch_callback(
+                trackmate.build_frame_index(df), trackmate.build_cell_id_index(df),
+                settings.SEGMENTATION_LOD_TOLERANCES, settings.SEGMENTATION_ENCODING, features
+            )
+        del df
+
+        data = self.process_zip_file(
+            base_file_location=base_file_location,
+            batch_callback=batch_callback,
+            base_file_location_suffix="cells",
+            task_instance=task_instance
+            )
+        data = self.save_morphology_table(data, base_file_location, features)
+        return self.save_lod_index(data, base_file_location, settings.SEGMENTATION_LOD_TOLERANCES)
+
+    def cleanup(self):
+        logger.info(f"Cleaning up task: {self.record_id}")
+        self.cleanup_temp_files()
+
+
+def trackmate_table_name(experiment_name, location, file_name) -> str:
+    return f"{experiment_name}/location_{location}/{file_name}"
+
+
+# Returns the converted TrackMate table of the location, or raises DependencyNotReadyException
+# while its metadata upload has not been processed.
+def find_trackmate_table(experiment_name, location) -> str:
+    metadata_upload = LoonUpload.objects.filter(
+        experiment_name=experiment_name,
+        location=location,
+        workflow_code=LoonUpload.WorkflowType.TRACKMATE,
+        file_type=LoonUpload.FileType.METADATA,
+    ).order_by('-id').first()
+    if metadata_upload is not None:
+        table_name = trackmate_table_name(experiment_name, location, metadata_upload.file_name)
+        if default_storage.exists(table_name):
+            return table_name
+    raise DependencyNotReadyException(
+        f"TrackMate table for {experiment_name} location {location} is not processed yet"
+    )
+
+
+# Task results report failure through a "*_status" entry rather than by raising.
+def _task_status(response_data) -> str:
+    if isinstance(response_data, dict) and "FAILED" in response_data.values():
+        return "failed"
+    if isinstance(response_data, dict) and "PARTIAL" in response_data.values():
+        return "partial"
+    return "succeeded"
+
+
+# Transient storage errors that outlast the per-call retries (storage.with_storage_retries)
+# retry the whole task with exponential backoff, up to TASK_MAX_RETRIES times.
+@shared_task(bind=True, max_retries=settings.TASK_MAX_RETRIES)
+def execute_task(self, record_id, profile=False, allow_partial=False, dependency_polls=0):
     # Get entry from our SQL Table
     loonUpload: LoonUpload = LoonUpload.objects.get(id=record_id)
     # Create a task for this entry
@@ -296,11 +689,83 @@ def execute_task(self, record_id):
         location=loonUpload.location,
         experiment_name=loonUpload.experiment_name,
         blob=loonUpload.blob,
-        record_id=record_id
+        record_id=record_id,
+        file_type=loonUpload.file_type,
+        allow_partial=allow_partial
     )
     # Execute the task
-    response_data = curr_task.execute(task_instance=self)
-    # Perform cleanup
-    curr_task.cleanup()
+    start = time.perf_counter()
+    try:
+        if should_profile(profile):
+            response_data = execute_profiled(curr_task, task_instance=self)
+        else:
+            response_data = curr_task.execute(task_instance=self)
+    except DependencyNotReadyException as e:
+        if dependency_polls >= settings.DEPENDENCY_MAX_POLLS:
+            raise
+        logger.info(f"Task {record_id}: {e.message}, checking again in "
+                    f"{settings.DEPENDENCY_POLL_SECONDS}s")
+        # Polls are counted separately so they do not use up the storage error retries.
+        # (max_retries=None would mean the task's own max_retries, not unlimited.)
+        raise self.retry(exc=e, countdown=settings.DEPENDENCY_POLL_SECONDS,
+                         max_retries=settings.DEPENDENCY_MAX_POLLS + settings.TASK_MAX_RETRIES,
+                         kwargs={**self.request.kwargs, "dependency_polls": dependency_polls + 1})
+    except Exception as e:
+        if not is_transient_storage_error(e):
+            raise
+        TASKS_TOTAL.labels(loonUpload.file_type, "retried").inc()
+        storage_retries = self.request.retries - dependency_polls
+        countdown = backoff_delay(storage_retries, settings.TASK_RETRY_BACKOFF,
+                                  settings.TASK_RETRY_BACKOFF_MAX)
+        logger.warning(f"Task {record_id} hit a storage error ({e}), retrying in {countdown:.0f}s")
+        # Raises the original error once max_retries is exhausted.
+        raise self.retry(exc=e, countdown=countdown,
+                         max_retries=settings.TASK_MAX_RETRIES + dependency_polls)
+    TASK_SECONDS.labels(loonUpload.file_type).observe(time.perf_counter() - start)
+    TASK_BYTES.labels(loonUpload.file_type).observe(curr_task.bytes_written)
+    TASK_FILES.labels(loonUpload.file_type).observe(curr_task.files_written)
+    TASKS_TOTAL.labels(loonUpload.file_type, _task_status(response_data)).inc()
+    # Perform cleanup. Failed uploads are kept so they can be retried until they expire;
+    # re-running a partial upload would skip the same members, so it is cleaned up too.
+    if _task_status(response_data) in ("succeeded", "partial"):
+        curr_task.cleanup()
 
     return response_data
+
+
+# Uploads routed to another queue than their file type's, by (workflow code, file type).
+# TrackMate spot tables are converted with pandas, which is CPU bound and holds the GIL, so
+# they run on the prefork default queue instead of holding up the small LiveCyte metadata
+# uploads on the metadata queue's threads.
+QUEUE_OVERRIDES = {
+    (LoonUpload.WorkflowType.TRACKMATE, LoonUpload.FileType.METADATA):
+        settings.CELERY_TASK_DEFAULT_QUEUE,
+}
+
+
+# Returns the queue an upload's task is routed to (see settings.LOON_WORKER_QUEUES).
+def queue_for_upload(loon_upload: LoonUpload) -> str:
+    queue = QUEUE_OVERRIDES.get((loon_upload.workflow_code, loon_upload.file_type),
+                                loon_upload.file_type)
+    if queue in settings.LOON_WORKER_QUEUES:
+        return queue
+    return settings.CELERY_TASK_DEFAULT_QUEUE
+
+
+def dispatch_task(loon_upload: LoonUpload, task_id=None, profile=False, allow_partial=False):
+    return execute_task.apply_async(
+        (loon_upload.pk,),
+        {"profile": profile, "allow_partial": allow_partial},
+        queue=queue_for_upload(loon_upload),
+        task_id=task_id
+    )
+
+
+@shared_task
+def expire_temp_uploads():
+    return lifecycle.expire_temp_uploads()
+
+
+@shared_task
+def report_storage_usage():
+    return lifecycle.report_storage_usage()
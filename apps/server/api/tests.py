@@ -1,3 +1,738 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone
+from django.conf import settings  # type: ignore
+from django.core.files.base import ContentFile  # type: ignore
+from django.core.files.storage import FileSystemStorage, default_storage  # type: ignore
+from django.test import SimpleTestCase, TestCase, override_settings  # type: ignore
+from roifile import ImagejRoi  # type: ignore
+from unittest import mock
+from .models import Experiment, IngestQueueEntry, Location, LoonUpload
+from . import lifecycle
+from .monitor import check_dispatched_tasks, processing_monitor
+from .pipeline import Pipeline, Stage
+from .processing_callbacks import morphology, trackmate
+from .processing_callbacks.encoding import ENCODINGS, PACKED, unpack_ring
+from .processing_callbacks.roi_to_geojson import roi_to_geojson_batch_callback, \
+    roi_to_geojson_callback
+from .processing_callbacks.trackmate import trackmate_roi_to_geojson_batch_callback, \
+    trackmate_roi_to_geojson_callback
+from .scheduler import _select_entries, task_deferred, task_resumed
+from .storage import RangeRequestFile, backoff_delay, is_transient_storage_error, promote, \
+    with_storage_retries
+from .tasks import DependencyNotReadyException, LiveCyteMetadataTask, execute_task, \
+    queue_for_upload
+from .track_summary import TRACK_SUMMARY_COLUMNS, create_track_summary_file, summarize_tracks
+from .views import _join_morphology
+import cProfile
+import io
+import json
+import os
+import numpy as np
+import pandas as pd
+import pstats
+import shutil
+import tempfile
+import zipfile
+from celery_app import worker_argv
 
-# Create your tests here.
+WAITING = IngestQueueEntry.Status.WAITING
+DISPATCHED = IngestQueueEntry.Status.DISPATCHED
+DEFERRED = IngestQueueEntry.Status.DEFERRED
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def queue_entry(pk, queue, experiment_name, size=0, status=WAITING):
+    return IngestQueueEntry(pk=pk, queue=queue, experiment_name=experiment_name, size=size,
+                            status=status, created_at=START + timedelta(seconds=pk))
+
+
+@override_settings(
+    LOON_WORKER_QUEUES={"segmentations": {"concurrency": 2}, "metadata": {"concurrency": 2}},
+    INGEST_MAX_BYTES_IN_FLIGHT=100,
+)
+class SelectEntriesTests(SimpleTestCase):
+    def test_fills_free_slots_of_each_queue(self):
+        entries = [queue_entry(i, "segmentations", "a") for i in range(3)] + \
+            [queue_entry(3, "metadata", "a")]
+        selected = _select_entries(entries)
+        self.assertEqual([e.pk for e in selected], [0, 3, 1])
+
+    def test_experiment_with_fewest_running_tasks_goes_first(self):
+        entries = [
+            queue_entry(0, "segmentations", "a", status=DISPATCHED),
+            queue_entry(1, "segmentations", "a"),
+            queue_entry(2, "segmentations", "a"),
+            queue_entry(3, "segmentations", "b"),
+        ]
+        self.assertEqual([e.pk for e in _select_entries(entries)], [3])
+
+    def test_byte_cap_holds_back_only_the_queue_that_does_not_fit(self):
+        entries = [
+            queue_entry(0, "segmentations", "a", size=60, status=DISPATCHED),
+            queue_entry(1, "segmentations", "a", size=50),
+            queue_entry(2, "segmentations", "a", size=10),
+            queue_entry(3, "metadata", "b", size=10),
+        ]
+        # 1 does not fit; 2 waits behind it, the metadata upload is admitted.
+        self.assertEqual([e.pk for e in _select_entries(entries)], [3])
+
+    def test_oversize_blob_runs_alone(self):
+        oversize = queue_entry(0, "segmentations", "a", size=500)
+        self.assertEqual(_select_entries([oversize]), [oversize])
+
+        entries = [queue_entry(0, "segmentations", "a", size=10, status=DISPATCHED),
+                   queue_entry(1, "segmentations", "b", size=500)]
+        self.assertEqual(_select_entries(entries), [])
+
+
+class QueueRoutingTests(SimpleTestCase):
+    def test_trackmate_tables_do_not_run_on_the_metadata_threads(self):
+        def queue(workflow_code, file_type):
+            return queue_for_upload(LoonUpload(workflow_code=workflow_code, file_type=file_type))
+
+        self.assertEqual(queue("live_cyte", "metadata"), "metadata")
+        self.assertEqual(queue("trackmate", "metadata"), settings.CELERY_TASK_DEFAULT_QUEUE)
+        self.assertEqual(queue("trackmate", "segmentations"), "segmentations")
+
+
+# Points default_storage at a scratch directory for each test.
+class StorageTestCase(SimpleTestCase):
+    def setUp(self):
+        self.storage_root = tempfile.mkdtemp(prefix="loon-test-")
+        self.previous_storage = default_storage._wrapped
+        default_storage._wrapped = FileSystemStorage(location=self.storage_root)
+
+    def tearDown(self):
+        default_storage._wrapped = self.previous_storage
+        shutil.rmtree(self.storage_root, ignore_errors=True)
+
+    def task(self, task_class, contents: bytes, file_name: str, **kwargs):
+        blob_name = default_storage.save(f"temp/{file_name}", ContentFile(contents))
+        return task_class(file_name=file_name, location=0, experiment_name="experiment",
+                          blob=LoonUpload(blob=blob_name).blob, record_id=0, **kwargs)
+
+
+class LodIndexTests(StorageTestCase):
+    def test_reupload_replaces_the_index(self):
+        data = {"processed_zip_file_status": "SUCCESS"}
+        task = self.task(LiveCyteMetadataTask, b"", "segmentations.zip")
+        task.save_lod_index(data, "experiment/location_0/segmentations", [1.0])
+        task.save_lod_index(data, "experiment/location_0/segmentations", [0.5, 2.0])
+
+        _, files = default_storage.listdir("experiment/location_0/segmentations")
+        self.assertEqual(files, ["lod.json"])
+        with default_storage.open("experiment/location_0/segmentations/lod.json") as file:
+            levels = json.load(file)["levels"]
+        self.assertEqual([level["tolerance"] for level in levels], [0, 0.5, 2.0])
+
+
+class PromoteTests(StorageTestCase):
+    def test_whole_upload_is_hardlinked_and_a_tail_copied_in_the_kernel(self):
+        source = default_storage.save("temp/table.csv", ContentFile(b"title\r\na,b\r\n1,2"))
+        self.assertEqual(promote(source, "experiment/whole.csv"),
+                         ("experiment/whole.csv", "hardlink"))
+        self.assertEqual(promote(source, "experiment/tail.csv", offset=7),
+                         ("experiment/tail.csv", "range_copy"))
+        with default_storage.open("experiment/tail.csv", "rb") as file:
+            self.assertEqual(file.read(), b"a,b\r\n1,2")
+
+
+class MetadataTaskTests(StorageTestCase):
+    def test_title_row_is_dropped_without_rewriting_the_table(self):
+        table = b"Frame,Tracking ID\r\n1,\"a,b\"\r\n2,3"
+        task = self.task(LiveCyteMetadataTask, b"LiveCyte export\r\n" + table, "metadata.csv")
+        data = task.execute()
+
+        self.assertEqual(data["headers"], ["Frame", "Tracking ID"])
+        with default_storage.open("experiment/location_0/metadata.csv", "rb") as file:
+            self.assertEqual(file.read(), table)
+
+
+@override_settings(
+    LOON_WORKER_QUEUES={"segmentations": {"pool": "prefork"}, "metadata": {"pool": "threads"}},
+    STUCK_TASK_DEADLINE=3600, LOST_TASK_GRACE_PERIOD=60, MAX_TASK_REQUEUES=3,
+)
+@mock.patch("api.monitor.schedule")
+@mock.patch("api.monitor.app")
+class CheckDispatchedTasksTests(TestCase):
+    def dispatched(self, queue, state, minutes_ago):
+        self.states[f"attempt-{queue}"] = state
+        upload = LoonUpload.objects.create(workflow_code="live_cyte", file_type=queue,
+                                           file_name="f", location="0",
+                                           experiment_name="e", blob="temp/f")
+        return IngestQueueEntry.objects.create(
+            upload=upload, experiment_name="e", queue=queue, task_id=queue,
+            attempt_task_id=f"attempt-{queue}", status=DISPATCHED,
+            dispatched_at=START - timedelta(minutes=minutes_ago),
+        )
+
+    def check(self, **kwargs):
+        result = mock.Mock(side_effect=lambda task_id: mock.Mock(state=self.states[task_id]))
+        with mock.patch("api.monitor.AsyncResult", result):
+            check_dispatched_tasks(now=START, **kwargs)
+
+    def requeued(self, entry):
+        entry.refresh_from_db()
+        return entry.status == WAITING
+
+    def setUp(self):
+        self.states = {}
+
+    def test_started_task_is_lost_only_when_its_queue_replied(self, app, schedule):
+        entry = self.dispatched("segmentations", "STARTED", minutes_ago=5)
+        self.check(active={}, replied_queues={"metadata"})
+        self.assertFalse(self.requeued(entry))
+
+        self.check(active={}, replied_queues={"segmentations"})
+        self.assertTrue(self.requeued(entry))
+        self.assertEqual(entry.requeues, 1)
+        self.assertNotEqual(entry.attempt_task_id, "attempt-segmentations")
+
+    def test_reserved_task_is_not_lost(self, app, schedule):
+        entry = self.dispatched("segmentations", "PENDING", minutes_ago=120)
+        self.check(active={}, known={"attempt-segmentations": {}},
+                   replied_queues={"segmentations"})
+        self.assertFalse(self.requeued(entry))
+
+    def test_pending_task_is_requeued_after_the_deadline(self, app, schedule):
+        entry = self.dispatched("segmentations", "PENDING", minutes_ago=30)
+        self.check(active=None)
+        self.assertFalse(self.requeued(entry))
+
+        entry.dispatched_at = START - timedelta(minutes=90)
+        entry.save()
+        self.check(active=None)
+        self.assertTrue(self.requeued(entry))
+
+    def test_overdue_task_on_threads_pool_is_not_requeued(self, app, schedule):
+        entry = self.dispatched("metadata", "STARTED", minutes_ago=120)
+        started = (START - timedelta(minutes=120)).timestamp()
+        self.check(active={"attempt-metadata": {"time_start": started}},
+                   replied_queues={"metadata"})
+        self.assertFalse(self.requeued(entry))
+
+
+@override_settings(MONITOR_INTERVAL=0)
+class ProcessingMonitorTests(SimpleTestCase):
+    @mock.patch("api.monitor.check_dispatched_tasks")
+    @mock.patch("api.monitor.app")
+    def test_failed_sample_does_not_stop_the_monitor(self, app, check):
+        app.control.inspect.return_value.active.side_effect = ConnectionError("broker down")
+        with self.assertLogs(level="ERROR"):
+            processing_monitor()
+        check.assert_not_called()
+
+
+# A local-memory cache standing in for Redis.
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                        "LOCATION": "loon-test"},
+            "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                      "LOCATION": "loon-test-local"}},
+    EXPERIMENT_JSON_CACHE_ENABLED=True,
+)
+class ExperimentJsonCacheTests(TestCase):
+    def test_edited_location_shows_in_the_experiment_json(self):
+        experiment = Experiment.objects.create(
+            name="e", headers="a|b", header_time="t", header_frame="f", header_id="i",
+            header_parent="p", header_mass="m", header_x="x", header_y="y",
+            number_of_locations=1,
+        )
+        location = Location.objects.create(experiment=experiment, name="0", tags={})
+        self.assertEqual(experiment.to_json()["locationMetadataList"][0]["tags"], {})
+
+        location.tags = {"drug": "a"}
+        location.save()
+        self.assertEqual(Experiment.objects.get(pk=experiment.pk).to_json()
+                         ["locationMetadataList"][0]["tags"], {"drug": "a"})
+
+    @override_settings(EXPERIMENT_JSON_CACHE_ENABLED=False)
+    @mock.patch("api.cache._primary_cache")
+    def test_not_cached_without_a_shared_cache(self, primary_cache):
+        experiment = Experiment(name="e", headers="", number_of_locations=0)
+        experiment.save()
+        experiment.to_json()
+        primary_cache.return_value.get.assert_not_called()
+        primary_cache.return_value.set.assert_not_called()
+
+
+class StorageRetryTests(SimpleTestCase):
+    def test_transient_errors_follow_the_explicit_cause(self):
+        from minio_storage.errors import MinIOError  # type: ignore
+        self.assertTrue(is_transient_storage_error(ConnectionResetError()))
+        self.assertTrue(is_transient_storage_error(MinIOError("save", TimeoutError())))
+        try:
+            raise OSError("save failed") from ConnectionError()
+        except OSError as e:
+            self.assertTrue(is_transient_storage_error(e))
+
+    def test_error_raised_while_handling_a_transient_error_is_not_transient(self):
+        try:
+            try:
+                raise ConnectionError()
+            except ConnectionError:
+                raise KeyError("name")
+        except KeyError as e:
+            self.assertFalse(is_transient_storage_error(e))
+
+    def test_backoff_is_capped(self):
+        for attempt in range(10):
+            self.assertLessEqual(backoff_delay(attempt, 0.5, 4.0), min(4.0, 0.5 * 2 ** attempt))
+
+    @override_settings(STORAGE_RETRY_BACKOFF=0, STORAGE_RETRY_BACKOFF_MAX=0)
+    def test_retries_transient_errors_and_rewinds_file_arguments(self):
+        reads = []
+
+        def save(name, content):
+            reads.append(content.read())
+            if len(reads) < 3:
+                raise ConnectionError()
+            return name
+
+        content = ContentFile(b"cells")
+        self.assertEqual(with_storage_retries(save, "name", content, attempts=3), "name")
+        self.assertEqual(reads, [b"cells"] * 3)
+
+    @override_settings(STORAGE_RETRY_BACKOFF=0, STORAGE_RETRY_BACKOFF_MAX=0)
+    def test_gives_up_after_the_last_attempt_and_on_other_errors(self):
+        calls = []
+
+        def failing_save(error):
+            calls.append(error)
+            raise error()
+
+        with self.assertRaises(ConnectionError):
+            with_storage_retries(failing_save, ConnectionError, attempts=2)
+        self.assertEqual(len(calls), 2)
+
+        calls.clear()
+        with self.assertRaises(ValueError):
+            with_storage_retries(failing_save, ValueError, attempts=5)
+        self.assertEqual(len(calls), 1)
+
+
+# Stands in for an upload whose dependency shows up after `polls` checks.
+class WaitingTask:
+    def __init__(self, polls):
+        self.polls = polls
+        self.calls = 0
+        self.bytes_written = 0
+        self.files_written = 0
+
+    def execute(self, task_instance=None):
+        self.calls += 1
+        if self.calls <= self.polls:
+            raise DependencyNotReadyException()
+        return {}
+
+    def cleanup(self):
+        pass
+
+
+@override_settings(DEPENDENCY_MAX_POLLS=5, DEPENDENCY_POLL_SECONDS=0, TASK_MAX_RETRIES=3)
+@mock.patch("api.scheduler.schedule")
+class DependencyPollingTests(TestCase):
+    def setUp(self):
+        self.upload = LoonUpload.objects.create(workflow_code="live_cyte",
+                                                file_type="segmentations", file_name="f",
+                                                location="0", experiment_name="e",
+                                                blob="temp/f")
+
+    def run_task(self, polls):
+        waiting = WaitingTask(polls)
+        with mock.patch("api.tasks.Task.create_task", return_value=waiting):
+            result = execute_task.apply(args=[self.upload.id])
+        return result, waiting
+
+    def test_polls_past_the_storage_retry_limit(self, schedule):
+        result, waiting = self.run_task(polls=4)
+        self.assertTrue(result.successful())
+        self.assertEqual(waiting.calls, 5)
+
+    def test_gives_up_after_the_last_poll(self, schedule):
+        result, waiting = self.run_task(polls=10)
+        self.assertIsInstance(result.result, DependencyNotReadyException)
+        self.assertEqual(waiting.calls, 6)
+
+    def test_deferred_task_gives_its_slot_back(self, schedule):
+        entry = IngestQueueEntry.objects.create(
+            upload=self.upload, experiment_name="e", queue="segmentations", task_id="t",
+            attempt_task_id="attempt", status=DISPATCHED, size=10,
+        )
+        task_deferred("attempt")
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, DEFERRED)
+        schedule.assert_called_once()
+        # Not counted against the bytes in flight, so an oversize upload may run.
+        oversize = queue_entry(1, "segmentations", "e", size=500)
+        self.assertEqual(_select_entries([entry, oversize]), [oversize])
+        task_resumed("attempt")
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, DISPATCHED)
+
+
+def double(item):
+    return item * 2
+
+
+class PipelineTests(SimpleTestCase):
+    def test_profiles_the_stage_threads(self):
+        saved = []
+        profilers = []
+        profiler = cProfile.Profile()
+        profiler.enable()
+        Pipeline(range(4), [Stage("callback", double, 2), Stage("save", saved.append)],
+                 profilers=profilers).run()
+        profiler.disable()
+
+        self.assertEqual(sorted(saved), [0, 2, 4, 6])
+        stats = pstats.Stats(profiler)
+        if profilers:
+            stats.add(*profilers)
+        self.assertIn("double", [name for _, _, name in stats.stats])
+
+
+def roi_bytes(points):
+    return ImagejRoi.frompoints(points).tobytes()
+
+
+SQUARE = [[10, 10], [14, 10], [14, 14], [10, 14]]
+# Wider than 256 pixels, so packed as uint16.
+WIDE = [[0, 0], [300, 5], [290, 40], [150, 20], [5, 30]]
+# Subpixel coordinates: not decoded by the batch path, converted through ImagejRoi.
+SUBPIXEL = [[1.5, 2.0], [8.25, 2.0], [8.0, 9.5]]
+
+
+# Runs a single file callback over the members the way the batch callbacks report them.
+def convert_each(callback, members):
+    results = []
+    for file_contents, file_name in members:
+        try:
+            results.append(callback(file_contents, file_name))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class RoiBatchTests(SimpleTestCase):
+    def assertSameOutputs(self, batch_results, single_results):
+        self.assertEqual(len(batch_results), len(single_results))
+        for batch_result, single_result in zip(batch_results, single_results):
+            if isinstance(single_result, Exception):
+                self.assertIs(type(batch_result), type(single_result))
+            else:
+                self.assertEqual(batch_result, single_result)
+
+    def test_livecyte_batch_matches_single_file_conversion(self):
+        members = [
+            (roi_bytes(SQUARE), "1-1.roi"),
+            (roi_bytes(WIDE), "1-2.roi"),
+            (roi_bytes(SUBPIXEL), "2-1.roi"),
+            (b"not a roi", "2-2.roi"),
+            (roi_bytes(SQUARE), "unnamed.roi"),
+        ]
+        for encoding in ENCODINGS:
+            for lod_tolerances in [(), (1.0, 3.0)]:
+                with self.subTest(encoding=encoding, lod_tolerances=lod_tolerances):
+                    self.assertSameOutputs(
+                        roi_to_geojson_batch_callback(lod_tolerances, encoding)(members),
+                        convert_each(roi_to_geojson_callback(lod_tolerances, encoding), members),
+                    )
+
+    def test_trackmate_batch_matches_single_file_conversion(self):
+        frame_index = {"ID1": np.array([3, 5])}
+        cell_id_index = {"ID1": "0-ID1"}
+        members = [(roi_bytes(SQUARE), "ID1.roi"), (roi_bytes(WIDE), "ID1-1.roi"),
+                   (roi_bytes(SQUARE), "ID2.roi")]
+        for encoding in ENCODINGS:
+            for lod_tolerances in [(), (1.0,)]:
+                with self.subTest(encoding=encoding, lod_tolerances=lod_tolerances):
+                    self.assertSameOutputs(
+                        trackmate_roi_to_geojson_batch_callback(
+                            frame_index, cell_id_index, lod_tolerances, encoding)(members),
+                        convert_each(trackmate_roi_to_geojson_callback(
+                            frame_index, cell_id_index, lod_tolerances, encoding), members),
+                    )
+
+    def test_packed_outline_round_trips(self):
+        [(data, _)] = roi_to_geojson_batch_callback(encoding=PACKED)(
+            [(roi_bytes(WIDE), "1-1.roi")]
+        )
+        packed = json.loads(data)["packed"]
+        self.assertEqual(packed["dtype"], "uint16")
+        self.assertEqual(unpack_ring(packed).tolist(), WIDE)
+
+
+class MorphologyTests(StorageTestCase):
+    def test_features_of_known_shapes(self):
+        rectangle = [[0, 0], [4, 0], [4, 2], [0, 2]]
+        angles = np.linspace(0, 2 * np.pi, 360, endpoint=False)
+        circle = np.stack([10 + 5 * np.cos(angles), 10 + 5 * np.sin(angles)], axis=1)
+        # An L: a 2x2 square with one corner cut out of its hull.
+        l_shape = [[0, 0], [2, 0], [2, 1], [1, 1], [1, 2], [0, 2]]
+        coords = np.concatenate([rectangle, circle, l_shape]).astype(np.float64)
+        features = morphology.morphology_features(coords, np.array([0, 4, 364, 370]))
+
+        np.testing.assert_allclose(features[morphology.AREA][[0, 2]], [8, 3])
+        np.testing.assert_allclose(features[morphology.PERIMETER][[0, 2]], [12, 8])
+        np.testing.assert_allclose(features[morphology.CENTROID_X][:2], [2, 10], atol=1e-9)
+        np.testing.assert_allclose(features[morphology.CENTROID_Y][:2], [1, 10], atol=1e-9)
+        self.assertAlmostEqual(features[morphology.AREA][1], np.pi * 25, delta=0.01)
+        self.assertAlmostEqual(features[morphology.ECCENTRICITY][1], 0, places=6)
+        # Semi-axes 2 and 1: sqrt(1 - 1 / 4).
+        self.assertAlmostEqual(features[morphology.ECCENTRICITY][0], np.sqrt(0.75))
+        np.testing.assert_allclose(features[morphology.SOLIDITY], [1, 1, 3 / 3.5], rtol=1e-3)
+
+    def test_reupload_replaces_the_features_table(self):
+        data = {"processed_zip_file_status": "SUCCESS"}
+        folder = "experiment/location_0/segmentations"
+        task = self.task(LiveCyteMetadataTask, b"", "segmentations.zip")
+        task.save_morphology_table(data, folder, [{"frame": [1], "id": ["1"]}])
+        task.save_morphology_table(data, folder, [{"frame": [2], "id": ["1"]}])
+
+        _, files = default_storage.listdir(folder)
+        self.assertEqual(files, [morphology.MORPHOLOGY_TABLE_NAME])
+        with default_storage.open(f"{folder}/{morphology.MORPHOLOGY_TABLE_NAME}") as file:
+            self.assertEqual(pd.read_parquet(file)["frame"].tolist(), [2])
+
+    def test_join_by_frame_and_id(self):
+        table_name = default_storage.save(
+            f"experiment/location_0/segmentations/{morphology.MORPHOLOGY_TABLE_NAME}",
+            ContentFile(pd.DataFrame({"frame": [1, 1], "id": ["7", "8"],
+                                      morphology.AREA: [10.0, 20.0]}).to_parquet(index=False))
+        )
+        cells = pd.DataFrame({"Frame": [1, 1, 2], "Tracking ID": [8.0, 9.0, 7.0]})
+
+        joined = _join_morphology(cells.copy(), table_name, [morphology.AREA],
+                                  {"frame": '"Frame"', "id": '"Tracking ID"'})
+        np.testing.assert_array_equal(joined[morphology.AREA], [20, np.nan, np.nan])
+
+        # Without the id header (or its column) there is nothing to join on.
+        for header_transforms in [{"frame": "Frame"}, {"frame": "Frame", "id": "Lineage"}]:
+            joined = _join_morphology(cells.copy(), table_name, [morphology.AREA],
+                                      header_transforms)
+            self.assertTrue(joined[morphology.AREA].isna().all())
+
+
+# Track 1 divides into 2 and 3 after time 2; 2 divides into 4 after time 5.
+LINEAGE = pd.DataFrame({
+    "location": ["0"] * 10,
+    "Tracking ID": [1, 1, 1, 2, 2, 2, 3, 3, 4, 4],
+    "Parent ID": [None, None, None, 1, 1, 1, 1, 1, 2, 2],
+    "Time (h)": [0, 1, 2, 3, 4, 5, 3, 4, 6, 7],
+    "X": [0, 3, 3, 0, 0, 0, 0, 0, 0, 0],
+    "Y": [0, 4, 4, 0, 0, 0, 0, 0, 0, 0],
+    "Mass": [1, 2, 3, 1, 1, 1, 1, 1, 1, 1],
+})
+LINEAGE_HEADERS = {"id": "Tracking ID", "parent": "Parent ID", "time": "Time (h)", "x": "X",
+                   "y": "Y", "mass": "Mass"}
+
+
+class TrackSummaryTests(StorageTestCase):
+    def test_summarizes_a_lineage(self):
+        summary = summarize_tracks(LINEAGE, LINEAGE_HEADERS).set_index("id")
+
+        self.assertEqual(list(summary.index), ["1", "2", "3", "4"])
+        self.assertEqual(summary["cell_count"].tolist(), [3, 3, 2, 2])
+        self.assertEqual(summary["children"].tolist(), [2, 1, 0, 0])
+        first = summary.loc["1"]
+        self.assertEqual((first["duration"], first["path_length"], first["displacement"]),
+                         (2, 5, 5))
+        self.assertEqual((first["mean_speed"], first["mass_growth_rate"]), (2.5, 1))
+        # Only track 2 starts and ends at a division: from its parent's last cell (2) to its
+        # own (5).
+        np.testing.assert_array_equal(summary["division_time"], [np.nan, 3, np.nan, np.nan])
+
+    def test_missing_columns(self):
+        summary = summarize_tracks(LINEAGE, {"id": "Tracking ID"})
+        self.assertEqual(len(summary), 4)
+        self.assertTrue(summary[["duration", "mass_growth_rate", "division_time"]]
+                        .isna().all(axis=None))
+
+        for headers in [{}, {"id": "Lineage ID"}]:
+            summary = summarize_tracks(LINEAGE, headers)
+            self.assertEqual(list(summary.columns), TRACK_SUMMARY_COLUMNS)
+            self.assertEqual(len(summary), 0)
+
+    def test_failure_does_not_stop_the_experiment(self):
+        self.assertEqual(create_track_summary_file("experiment", "missing.parquet", {}), "")
+
+        default_storage.save("experiment/composite.parquet",
+                             ContentFile(LINEAGE.to_parquet(index=False)))
+        headers = {key: f'"{column}"' for key, column in LINEAGE_HEADERS.items()}
+        self.assertEqual(
+            create_track_summary_file("experiment", "experiment/composite.parquet", headers),
+            "experiment/track_summary.parquet",
+        )
+
+
+TRACKMATE_UNITS = b"""Label,Spot ID,Track ID,Quality,X,Y,Z,T,Frame,Radius,Visibility
+Label,Spot ID,Track ID,Quality,X,Y,Z,T,Frame,R,Visibility
+,,,(quality),(pixel),(pixel),(pixel),(frame),,(pixel),
+"""
+TRACKMATE_HEADER = b"LABEL,ID,TRACK_ID,QUALITY,POSITION_X,POSITION_Y,POSITION_Z,POSITION_T," \
+    b"FRAME,RADIUS,VISIBILITY\n"
+
+
+class TrackMateTableTests(SimpleTestCase):
+    # What the table was before it was parsed in one pass: read, drop the header rows, write
+    # and read again so the types are inferred.
+    def baseline(self, data: bytes) -> pd.DataFrame:
+        df = pd.read_csv(io.BytesIO(data)).drop([0, 1, 2])
+        return pd.read_csv(io.StringIO(df.to_csv(index=False)))
+
+    def test_matches_the_baseline_output(self):
+        tables = [
+            # Integer-valued columns stay integers.
+            b"ID1,1,0,1,10.5,20.25,0,0,0,5,1\nID2,2,0,3,11.5,21.25,0,1,1,5,1\n",
+            # A spot without a track makes TRACK_ID a float column.
+            b"ID1,1,0,1.5,10.5,20.25,0.0,0.0,0,5.0,1\nID3,3,,2.0,40.0,50.0,0.0,0.0,0,5.0,1\n",
+        ]
+        for rows in tables:
+            data = TRACKMATE_HEADER + TRACKMATE_UNITS + rows
+            with self.subTest(rows=rows):
+                self.assertEqual(
+                    trackmate.read_trackmate_table(io.BytesIO(data)).to_csv(index=False),
+                    self.baseline(data).to_csv(index=False),
+                )
+
+
+# StorageTestCase for tests that also use the database.
+class StorageDbTestCase(StorageTestCase, TestCase):
+    pass
+
+
+@override_settings(TEMP_UPLOAD_TTL_HOURS=1)
+class LifecycleTests(StorageDbTestCase):
+    def save(self, name, contents=b"cells", hours_ago=0):
+        name = default_storage.save(name, ContentFile(contents))
+        if hours_ago:
+            modified = (datetime.now(timezone.utc) - timedelta(hours=hours_ago)).timestamp()
+            os.utime(default_storage.path(name), (modified, modified))
+        return name
+
+    def test_expires_old_temp_uploads_that_are_not_queued(self):
+        old = self.save("temp/a/old.zip", hours_ago=2)
+        queued = self.save("temp/b/queued.zip", hours_ago=2)
+        recent = self.save("temp/c/recent.zip")
+        kept = self.save("experiment/location_0/metadata.csv", hours_ago=2)
+        upload = LoonUpload.objects.create(workflow_code="live_cyte", file_type="segmentations",
+                                           file_name="queued.zip", location="0",
+                                           experiment_name="e", blob=queued)
+        IngestQueueEntry.objects.create(upload=upload, experiment_name="e",
+                                        queue="segmentations", task_id="t", status=DEFERRED)
+
+        self.assertEqual(lifecycle.expire_temp_uploads(), 1)
+        self.assertFalse(default_storage.exists(old))
+        self.assertFalse(os.path.exists(default_storage.path("temp/a")))
+        for name in [queued, recent, kept]:
+            self.assertTrue(default_storage.exists(name))
+
+    @mock.patch("api.lifecycle.DELETE_BATCH_SIZE", 2)
+    def test_deletes_in_batches(self):
+        names = [self.save(f"temp/{i}/upload.zip") for i in range(5)]
+        self.assertEqual(lifecycle.delete_objects(names), 5)
+        self.assertEqual(default_storage.listdir("temp"), ([], []))
+
+    def test_usage_by_experiment(self):
+        self.save("experiment/location_0/metadata.csv", b"abc")
+        self.save("experiment.json", b"{}")
+        self.save("temp/a/upload.zip", b"z")
+        self.assertEqual(lifecycle.report_storage_usage(), {
+            "experiment": {"bytes": 5, "objects": 2},
+            "temp": {"bytes": 1, "objects": 1},
+        })
+
+    def test_unsupported_storage_is_skipped(self):
+        storage = mock.Mock()
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(lifecycle.expire_temp_uploads(storage), 0)
+            self.assertEqual(lifecycle.report_storage_usage(storage), {})
+        storage.delete.assert_not_called()
+
+
+# Serves get_object byte ranges from memory, like the MinIO client.
+class FakeObjectClient:
+    class Response(io.BytesIO):
+        def release_conn(self):
+            pass
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.requests = []
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0):
+        self.requests.append((offset, length))
+        return self.Response(self.data[offset:offset + length])
+
+
+class RangeRequestFileTests(SimpleTestCase):
+    def open(self, data: bytes, read_ahead=1024):
+        client = FakeObjectClient(data)
+        return RangeRequestFile(client, "bucket", "upload.zip", size=len(data),
+                                read_ahead=read_ahead), client
+
+    def test_reads_one_zip_member_without_the_rest_of_the_archive(self):
+        members = {f"cells/{i}.roi": os.urandom(64 * 1024) for i in range(8)}
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zip_file:
+            for name, contents in members.items():
+                zip_file.writestr(name, contents)
+        data = archive.getvalue()
+
+        file, _ = self.open(data, read_ahead=4096)
+        with zipfile.ZipFile(file) as zip_file:
+            self.assertEqual(zip_file.namelist(), list(members))
+            self.assertEqual(zip_file.read("cells/5.roi"), members["cells/5.roi"])
+        self.assertLess(file.bytes_fetched, len(data) / 4)
+
+    def test_seek_and_read_ahead(self):
+        data = bytes(range(256)) * 16
+        file, client = self.open(data, read_ahead=1024)
+
+        self.assertEqual(file.seek(-10, io.SEEK_END), len(data) - 10)
+        self.assertEqual(file.read(), data[-10:])
+        self.assertEqual(file.read(), b"")
+
+        file.seek(100)
+        self.assertEqual(file.read(10), data[100:110])
+        file.seek(5, io.SEEK_CUR)
+        buffer = bytearray(20)
+        self.assertEqual(file.readinto(buffer), 20)
+        self.assertEqual(bytes(buffer), data[115:135])
+        # The second and third reads are served from the read-ahead of the first.
+        self.assertEqual(client.requests, [(len(data) - 10, 10), (100, 1024)])
+
+        # A read larger than the read-ahead fetches exactly what it needs.
+        file.seek(2000)
+        self.assertEqual(file.read(1500), data[2000:3500])
+        self.assertEqual(client.requests[-1], (2000, 1500))
+        with self.assertRaises(ValueError):
+            file.seek(-1)
+
+
+@override_settings(
+    LOON_WORKER_QUEUES={
+        "segmentations": {"concurrency": 3, "prefetch_multiplier": 1, "pool": "prefork"},
+        "metadata": {"concurrency": 2, "prefetch_multiplier": 4, "pool": "threads"},
+        "celery": {"concurrency": 1, "prefetch_multiplier": 1, "pool": "prefork"},
+    },
+    CELERY_TASK_DEFAULT_QUEUE="celery", CELERY_RUN_BEAT=True,
+)
+class WorkerArgvTests(SimpleTestCase):
+    def option(self, argv, name):
+        return argv[argv.index(name) + 1]
+
+    def test_each_queue_gets_its_own_pool_settings(self):
+        for queue_name, concurrency, prefetch, pool in [("segmentations", "3", "1", "prefork"),
+                                                         ("metadata", "2", "4", "threads")]:
+            argv = worker_argv(queue_name)
+            self.assertEqual(self.option(argv, "--queues"), queue_name)
+            self.assertEqual(self.option(argv, "--concurrency"), concurrency)
+            self.assertEqual(self.option(argv, "--prefetch-multiplier"), prefetch)
+            self.assertEqual(self.option(argv, "--pool"), pool)
+            self.assertNotIn("--beat", argv)
+
+    def test_beat_runs_on_the_default_queue_only(self):
+        self.assertIn("--beat", worker_argv("celery"))
+        with self.settings(CELERY_RUN_BEAT=False):
+            self.assertNotIn("--beat", worker_argv("celery"))
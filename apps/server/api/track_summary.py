@@ -0,0 +1,149 @@
+from django.core.files.base import ContentFile  # type: ignore
+from django.core.files.storage import default_storage  # type: ignore
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+'''
+Per-track summary of an experiment's composite table, written next to it as
+TRACK_SUMMARY_FILE_NAME when the experiment is finished. One row per track (the cells of a
+location with the same id), ordered by time:
+
+- start_time, end_time, duration and cell_count
+- displacement between the first and last position, path_length along every position, and
+  mean_speed (path_length / duration)
+- mass_growth_rate: least squares slope of the mass over time
+- children (tracks whose parent is this track) and division_time, the time from the parent's
+  division (its last cell) to this track's division. Only tracks that both start and end at a
+  division get one.
+
+Times, positions and masses are in the units of the table. Metrics whose column is missing
+are NaN; without an id column there are no tracks.
+'''
+
+logger = logging.getLogger()
+
+TRACK_SUMMARY_FILE_NAME = "track_summary.parquet"
+# Header transforms the track summary reads.
+TRACK_SUMMARY_HEADERS = ["id", "parent", "time", "x", "y", "mass"]
+TRACK_SUMMARY_COLUMNS = [
+    "location", "id", "start_time", "end_time", "duration", "cell_count", "displacement",
+    "path_length", "mean_speed", "mass_growth_rate", "children", "division_time",
+]
+
+
+# Whole numbers (12, 12.0, "12") compare as "12", anything else by its text.
+def id_key(values: pd.Series) -> pd.Series:
+    numbers = pd.to_numeric(values, errors='coerce')
+    whole = np.isfinite(numbers) & (numbers == np.floor(numbers))
+    keys = values.astype(str)
+    keys[whole] = numbers[whole].astype('int64').astype(str)
+    return keys
+
+
+# Summarizes the composite table and stores the summary. Returns its name, or '' when it could
+# not be written -- the experiment is still finished without one.
+def create_track_summary_file(experiment_name: str, composite_tabular_data_file_name: str,
+                              header_transforms: dict) -> str:
+    track_summary_file_name = f"{experiment_name}/{TRACK_SUMMARY_FILE_NAME}"
+    try:
+        headers = {key: (value or '').strip('"') for key, value in header_transforms.items()}
+
+        # Only the columns the summary uses.
+        with default_storage.open(composite_tabular_data_file_name, 'rb') as composite_file:
+            parquet_file = pq.ParquetFile(composite_file)
+            wanted = ["location"] + [headers.get(key) for key in TRACK_SUMMARY_HEADERS]
+            columns = [name for name in parquet_file.schema_arrow.names if name in wanted]
+            df = parquet_file.read(columns=columns).to_pandas()
+        summary = summarize_tracks(df, headers)
+
+        if default_storage.exists(track_summary_file_name):
+            default_storage.delete(track_summary_file_name)
+        default_storage.save(track_summary_file_name,
+                             ContentFile(summary.to_parquet(index=False)))
+    except Exception as e:
+        logger.error(f"Failed to write the track summary of {experiment_name}: {e}")
+        return ''
+    return track_summary_file_name
+
+
+def summarize_tracks(df: pd.DataFrame, headers: dict) -> pd.DataFrame:
+    id_column = headers.get('id')
+    if id_column not in df.columns:
+        return pd.DataFrame(columns=TRACK_SUMMARY_COLUMNS)
+
+    def numeric(key):
+        column = headers.get(key)
+        if column in df.columns:
+            return pd.to_numeric(df[column], errors='coerce').astype('float64').to_numpy()
+        return np.full(len(df), np.nan)
+
+    location = df["location"].astype(str).to_numpy()
+    track = id_key(df[id_column]).to_numpy()
+    time = numeric('time')
+    order = np.lexsort((time, track, location))
+    cells = pd.DataFrame({
+        "location": location[order],
+        "id": track[order],
+        "time": time[order],
+        "x": numeric('x')[order],
+        "y": numeric('y')[order],
+        "mass": numeric('mass')[order],
+    })
+    same_track = (cells["location"].to_numpy()[1:] == cells["location"].to_numpy()[:-1]) & \
+        (cells["id"].to_numpy()[1:] == cells["id"].to_numpy()[:-1])
+    steps = np.hypot(np.diff(cells["x"].to_numpy()), np.diff(cells["y"].to_numpy()))
+    cells["step"] = np.r_[0.0, np.where(same_track, steps, 0.0)]
+
+    # Mass against time, centered on each track's mean, for the slope.
+    valid = cells[["time", "mass"]].notna().all(axis=1)
+    fit = cells[["time", "mass"]].where(valid)
+    groups = [cells["location"], cells["id"]]
+    fit = fit - fit.groupby(groups).transform("mean")
+    cells["time_mass"] = fit["time"] * fit["mass"]
+    cells["time_time"] = fit["time"] ** 2
+
+    tracks = cells.groupby(["location", "id"], sort=False).agg(
+        start_time=("time", "first"),
+        end_time=("time", "last"),
+        cell_count=("time", "size"),
+        start_x=("x", "first"),
+        start_y=("y", "first"),
+        end_x=("x", "last"),
+        end_y=("y", "last"),
+        path_length=("step", "sum"),
+        time_mass=("time_mass", "sum"),
+        time_time=("time_time", "sum"),
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tracks["duration"] = tracks["end_time"] - tracks["start_time"]
+        tracks["displacement"] = np.hypot(tracks["end_x"] - tracks["start_x"],
+                                          tracks["end_y"] - tracks["start_y"])
+        tracks["mean_speed"] = (tracks["path_length"] / tracks["duration"]) \
+            .where(tracks["duration"] > 0)
+        tracks["mass_growth_rate"] = (tracks["time_mass"] / tracks["time_time"]) \
+            .where(tracks["time_time"] > 0)
+
+    # Division: another track of the same location names this one as its parent. The cell
+    # cycle runs from the parent's last cell to this track's last cell; the first cell of a
+    # track is already one sampling interval after the division.
+    parent_column = headers.get('parent')
+    tracks["children"] = 0
+    tracks["division_time"] = np.nan
+    if parent_column in df.columns:
+        parents = pd.DataFrame({"location": location, "id": track,
+                                "parent": id_key(df[parent_column]).to_numpy()})
+        parents = parents.drop_duplicates(["location", "id"]).set_index(["location", "id"])
+        children = parents.groupby(["location", "parent"]).size()
+        children.index = children.index.set_names(["location", "id"])
+        tracks["children"] = children.reindex(tracks.index, fill_value=0).to_numpy()
+        parent_keys = pd.MultiIndex.from_arrays([
+            tracks.index.get_level_values("location"),
+            parents["parent"].reindex(tracks.index).to_numpy(),
+        ])
+        parent_end = tracks["end_time"].reindex(parent_keys).to_numpy()
+        tracks["division_time"] = (tracks["end_time"] - parent_end) \
+            .where(tracks["children"] > 0)
+
+    return tracks.reset_index()[TRACK_SUMMARY_COLUMNS]
@@ -1,13 +1,15 @@
-from rest_framework.views import APIView  # type: ignore
+from adrf.views import APIView  # type: ignore
 from rest_framework.response import Response  # type: ignore
 from rest_framework import serializers, status  # type: ignore
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
+from asgiref.sync import sync_to_async  # type: ignore
+import asyncio
 import json
 from django.core.files.storage import default_storage  # type: ignore
-from .tasks import (
-    FailedToCreateTaskException,
-    execute_task
-)
+from .tasks import FailedToCreateTaskException
+from .processing_callbacks import morphology
+from .track_summary import create_track_summary_file, id_key
+from .scheduler import submit, attempt_task_id
 from celery.result import AsyncResult  # type: ignore
 from django.core import signing  # type: ignore
 from .serializers import (
@@ -16,11 +18,17 @@ from .serializers import (
     LocationCreateSerializer
 )
 from .models import LoonUpload, Location, Experiment
+from .metrics import render_metrics
+from django.http import HttpResponse  # type: ignore
 from django.core.files.base import ContentFile  # type: ignore
+import logging
 import tempfile
 import os
+import numpy as np
 import pandas as pd
 
+logger = logging.getLogger()
+
 
 def field_value_object_key(serializer: serializers.Serializer) -> Optional[str]:
     try:
@@ -36,8 +44,9 @@ def field_value_object_key(serializer: serializers.Serializer) -> Optional[str]:
 def create_composite_tabular_data_file(
         experiment_name: str,
         experiment_settings: list,
-        location_tags: dict
-        ) -> str:
+        location_tags: dict,
+        header_transforms: Optional[dict] = None
+        ) -> Tuple[str, list]:
 
     composite_tabular_data_file_name = f"{experiment_name}/composite_tabular_data.parquet"
 
@@ -49,6 +58,13 @@ def create_composite_tabular_data_file(
 
     tag_key_list = list(set(tag_key_list))
 
+    # Shape features computed at segmentation ingest (see processing_callbacks/morphology.py).
+    # Every location gets the feature columns when any has them, as all the appended parts
+    # must have the same columns.
+    feature_tables = _morphology_table_names(experiment_settings, header_transforms)
+    feature_columns = morphology.FEATURE_COLUMNS if any(feature_tables) else []
+    added_columns: list = []
+
     with tempfile.NamedTemporaryFile(mode='w+', newline='', delete=False) as temp_file:
         temp_file_name = temp_file.name
         for idx, entry in enumerate(experiment_settings):
@@ -70,6 +86,13 @@ def create_composite_tabular_data_file(
 
                 # Add current data_frame to data_frames list
 
+            if feature_columns:
+                if idx == 0:
+                    # Columns the lab's table already has are kept as they are.
+                    added_columns = [column for column in feature_columns
+                                     if column not in df.columns]
+                df = _join_morphology(df, feature_tables[idx], added_columns, header_transforms)
+
             if idx == 0:
                 # Write the first DataFrame
                 df.to_parquet(temp_file_name, index=False, engine='fastparquet')
@@ -84,7 +107,80 @@ def create_composite_tabular_data_file(
     # Clean up the temp file from local disk
     os.remove(temp_file_name)
 
-    return composite_tabular_data_file_name
+    return composite_tabular_data_file_name, added_columns
+
+
+# The features table of each location, or None where ingest did not write one. Without the
+# frame and id headers there is nothing to join on.
+def _morphology_table_names(experiment_settings: list, header_transforms: Optional[dict]):
+    if not header_transforms:
+        return [None] * len(experiment_settings)
+    names = []
+    for entry in experiment_settings:
+        folder = entry.get('segmentationsFolder')
+        name = f"{folder}/{morphology.MORPHOLOGY_TABLE_NAME}" if folder else None
+        names.append(name if name and default_storage.exists(name) else None)
+    return names
+
+
+# Left join of a location's features table on frame and id. Cells without features, and every
+# cell of a location without a table, get NaN.
+def _join_morphology(df: pd.DataFrame, table_name: Optional[str], columns: list,
+                     header_transforms: dict) -> pd.DataFrame:
+    if not columns:
+        return df
+    features = None
+    if table_name is not None:
+        with default_storage.open(table_name, 'rb') as table_file:
+            features = pd.read_parquet(table_file, columns=["frame", "id"] + columns)
+    frame_column = (header_transforms.get('frame') or '').strip('"')
+    id_column = (header_transforms.get('id') or '').strip('"')
+    if features is None or frame_column not in df.columns or id_column not in df.columns:
+        for column in columns:
+            df[column] = np.nan
+        return df
+
+    # Ids are strings in ROI file names and usually numbers in the table.
+    keys = pd.MultiIndex.from_arrays([_frame_key(features["frame"]), id_key(features["id"])])
+    unique = ~keys.duplicated(keep="last")
+    features, keys = features[unique], keys[unique]
+    positions = keys.get_indexer(
+        pd.MultiIndex.from_arrays([_frame_key(df[frame_column]), id_key(df[id_column])])
+    )
+    found = positions >= 0
+    for column in columns:
+        values = np.full(len(df), np.nan)
+        values[found] = features[column].to_numpy(dtype=np.float64)[positions[found]]
+        df[column] = values
+    return df
+
+
+def _frame_key(values: pd.Series) -> pd.Series:
+    return pd.to_numeric(values, errors='coerce').astype('float64')
+
+
+def _get_task_state(task_id: str):
+    result = AsyncResult(attempt_task_id(task_id))
+    return result.state, result.info
+
+
+# Replaces the experiment index file with one listing every experiment.
+def _save_index_file(index_file_name: str, index_file_bytes: bytes):
+    if default_storage.exists(index_file_name):
+        default_storage.delete(index_file_name)
+
+    default_storage.save(index_file_name, ContentFile(index_file_bytes))
+
+
+def _read_index_file(index_file_name: str) -> str:
+    with default_storage.open(index_file_name, 'r') as file:
+        return file.read()
+
+
+# Prometheus scrape endpoint for the web process.
+def metrics_view(request):
+    data, content_type = render_metrics()
+    return HttpResponse(data, content_type=content_type)
 
 
 InvalidFieldValueResponse = Response(
@@ -95,7 +191,7 @@ InvalidFieldValueResponse = Response(
 
 # Called on each individual upload
 class ProcessDataView(APIView):
-    def post(self, request):
+    async def post(self, request):
         serializer = LoonUploadCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
@@ -104,7 +200,7 @@ class ProcessDataView(APIView):
         if object_key is None:
             return InvalidFieldValueResponse
 
-        loonUpload: LoonUpload = LoonUpload.objects.create(
+        loonUpload: LoonUpload = await LoonUpload.objects.acreate(
             workflow_code=serializer.validated_data['workflow_code'],
             file_type=serializer.validated_data['file_type'],
             file_name=serializer.validated_data['file_name'],
@@ -114,10 +210,13 @@ class ProcessDataView(APIView):
         )
 
         try:
-            # Send task to celery worker
-            task_result = execute_task.delay(loonUpload.pk)
-
-            task_id = task_result.id
+            # Add the upload to the ingest queue. The scheduler hands it to the celery queue
+            # for its file type once the experiment's fair share and storage capacity allow.
+            task_id = await sync_to_async(submit)(
+                loonUpload,
+                profile=serializer.validated_data['profile'],
+                allow_partial=serializer.validated_data['allow_partial'],
+            )
 
             # Return success
             return Response({"status": "SUCCESS",
@@ -128,8 +227,9 @@ class ProcessDataView(APIView):
             # If failed to create task, return failure message.
             return Response({"status": "FAILED", "message": e.message})
 
-    def get(self, request, task_id):
-        result = AsyncResult(task_id)
+    async def get(self, request, task_id):
+        # Both the state and the info are fetched from the result backend.
+        state, info = await sync_to_async(_get_task_state, thread_sensitive=False)(task_id)
 
         '''
         Celery response:
@@ -140,26 +240,30 @@ class ProcessDataView(APIView):
         response_data = {
             "task_id": task_id,
         }
-        if result.state == 'PENDING':
+        if state == 'PENDING':
             response_data['status'] = 'QUEUED'
-        elif result.state == 'STARTED':
+        elif state == 'STARTED':
             response_data['status'] = 'RUNNING'
-        elif result.state == 'FAILURE':
+        elif state == 'RETRY':
+            # Waiting out the backoff after a storage error, then it runs again.
+            response_data['status'] = 'QUEUED'
+            response_data['message'] = 'Retrying after a storage error'
+        elif state == 'FAILURE':
             response_data['status'] = 'FAILED'
-        elif result.state == 'SUCCESS':
+        elif state == 'SUCCESS':
             response_data['status'] = 'SUCCEEDED'
         else:
             response_data['status'] = 'ERROR'
             response_data['message'] = 'Unable to retrieve status'
 
-        response_data['data'] = result.info
+        response_data['data'] = info
 
         return Response(response_data)
 
 
 # Called once all processing steps have finished and all data has been uploaded.
 class FinishExperimentView(APIView):
-    def post(self, request):
+    async def post(self, request):
         data = request.data
         experiment_settings = json.loads(data.get('experimentSettings'))
         experiment_headers = json.loads(data.get('experimentHeaders'))
@@ -168,24 +272,30 @@ class FinishExperimentView(APIView):
 
         experiment_name = data.get('experimentName')
 
-        composite_tabular_data_file_name = create_composite_tabular_data_file(
-            experiment_name, experiment_settings, location_tags
-            )
+        # Reads every location's CSV and writes the composite -- run off the event loop.
+        composite_tabular_data_file_name, feature_columns = await sync_to_async(
+            create_composite_tabular_data_file, thread_sensitive=False
+            )(experiment_name, experiment_settings, location_tags, experiment_header_transforms)
+        experiment_headers = experiment_headers + feature_columns
+        track_summary_file_name = await sync_to_async(
+            create_track_summary_file, thread_sensitive=False
+            )(experiment_name, composite_tabular_data_file_name, experiment_header_transforms)
 
         experiment_data = {
             "name": experiment_name,
             "headers": "|".join(experiment_headers),
             "number_of_locations": len(experiment_settings),
             "composite_tabular_data_file_name": composite_tabular_data_file_name,
+            "track_summary_file_name": track_summary_file_name,
             "header_transforms": experiment_header_transforms
         }
 
         experiment_serializer = ExperimentCreateSerializer(data=experiment_data)
         if not experiment_serializer.is_valid():
-            print(experiment_serializer.errors, flush=True)
+            logger.warning(f"Invalid experiment {experiment_name}: {experiment_serializer.errors}")
         experiment_serializer.is_valid(raise_exception=True)
 
-        experiment_instance = experiment_serializer.save()
+        experiment_instance = await sync_to_async(experiment_serializer.save)()
 
         # Create individual Location table entries
         for i in range(len(experiment_settings)):
@@ -198,22 +308,21 @@ class FinishExperimentView(APIView):
             }
             location_serializer = LocationCreateSerializer(data=location_data)
             if not location_serializer.is_valid():
-                print(location_serializer.errors, flush=True)
+                logger.warning(f"Invalid location {i} of {experiment_name}: "
+                               f"{location_serializer.errors}")
 
             location_serializer.is_valid(raise_exception=True)
 
-            Location.objects.create(
+            await Location.objects.acreate(
                 experiment=experiment_instance,
                 **location_data
             )
 
-        json_data = experiment_instance.to_json()
+        json_data = await sync_to_async(experiment_instance.to_json)()
         json_string = json.dumps(json_data, indent=4)
         json_bytes = json_string.encode('utf-8')
 
-        default_storage.save(f'{experiment_instance.name}.json', ContentFile(json_bytes))
-
-        experiment_names = [name + '.json' for name in
+        experiment_names = [name + '.json' async for name in
                             Experiment.objects.values_list('name', flat=True)]
 
         index_file = {"experiments": experiment_names}
@@ -222,16 +331,21 @@ class FinishExperimentView(APIView):
 
         index_file_name = 'aa_index.json'
 
-        if default_storage.exists(index_file_name):
-            default_storage.delete(index_file_name)
-
-        default_storage.save(index_file_name, ContentFile(json_index_file_bytes))
+        # The experiment file and the index file are independent, so write them concurrently.
+        await asyncio.gather(
+            sync_to_async(default_storage.save, thread_sensitive=False)(
+                f'{experiment_instance.name}.json', ContentFile(json_bytes)
+            ),
+            sync_to_async(_save_index_file, thread_sensitive=False)(
+                index_file_name, json_index_file_bytes
+            ),
+        )
 
         return Response({'status': 'SUCCESS'})
 
 
 class VerifyExperimentNameView(APIView):
-    def get(self, request, experiment_name):
+    async def get(self, request, experiment_name):
 
         '''
         Leaving both checks in here. I do not think checking 'aa_index.json' is necessary
@@ -246,10 +360,15 @@ class VerifyExperimentNameView(APIView):
 
         experiment_name = strip_json(experiment_name)
 
-        # Checks aa_index.json file
-        with default_storage.open('aa_index.json', 'r') as file:
-            content = file.read()
+        # The index file, the bucket listing and the experiment table are independent
+        # lookups, so issue them concurrently.
+        content, (subdirs, files), exists = await asyncio.gather(
+            sync_to_async(_read_index_file, thread_sensitive=False)('aa_index.json'),
+            sync_to_async(default_storage.listdir, thread_sensitive=False)(''),
+            Experiment.objects.filter(name=experiment_name).aexists(),
+        )
 
+        # Checks aa_index.json file
         experiment_list = json.loads(content)['experiments']
 
         experiment_list_stripped = [strip_json(element) for element in experiment_list]
@@ -258,13 +377,10 @@ class VerifyExperimentNameView(APIView):
             return Response({'status': 'FAILED'})
 
         # Checks directories
-        subdirs, files = default_storage.listdir('')
-
         if experiment_name in subdirs:
             return Response({'status': 'FAILED'})
 
         # Checks experiment table
-        exists = Experiment.objects.filter(name=experiment_name).exists()
         if exists:
             return Response({'status': 'FAILED'})
 
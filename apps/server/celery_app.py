@@ -1,5 +1,10 @@
 from __future__ import absolute_import, unicode_literals
 import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
 from celery import Celery
 
 # Set the default Django settings module for the 'celery' program.
@@ -13,3 +18,77 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
+
+
+# Builds the worker command line for one queue using its settings.LOON_WORKER_QUEUES entry.
+def worker_argv(queue_name):
+    from django.conf import settings  # type: ignore
+    queue_settings = settings.LOON_WORKER_QUEUES[queue_name]
+    beat = []
+    if settings.CELERY_RUN_BEAT and queue_name == settings.CELERY_TASK_DEFAULT_QUEUE:
+        # Periodic jobs (CELERY_BEAT_SCHEDULE) run on the default queue's worker.
+        beat = ["--beat", "--schedule", os.path.join(tempfile.gettempdir(), "celerybeat-schedule")]
+    return [
+        "worker",
+        "--loglevel", "info",
+        "--without-heartbeat",
+        "--queues", queue_name,
+        "--hostname", f"{queue_name}@%h",
+        "--concurrency", str(queue_settings['concurrency']),
+        "--prefetch-multiplier", str(queue_settings['prefetch_multiplier']),
+        "--pool", queue_settings['pool'],
+        *beat,
+    ]
+
+
+# Serves the metrics of every worker process started by this launcher. Must run before
+# prometheus_client is imported anywhere in this process, and before the workers start.
+def start_metrics_exporter(port):
+    metrics_dir = os.environ.setdefault(
+        'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'loon-worker-metrics')
+    )
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+    from prometheus_client import CollectorRegistry, multiprocess, start_http_server  # type: ignore
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(port, registry=registry)
+
+
+# Starts one worker process per queue (all configured queues if none are given) and waits
+# for them. Usage: python celery_app.py [queue_name ...]
+def run_workers(queue_names):
+    from django.conf import settings  # type: ignore
+    queue_names = queue_names or list(settings.LOON_WORKER_QUEUES.keys())
+
+    # Worker pool processes write their metrics to a shared directory, served from here.
+    start_metrics_exporter(settings.METRICS_WORKER_PORT)
+    workers = [
+        subprocess.Popen([sys.executable, "-m", "celery", "--app", "celery_app",
+                          *worker_argv(queue_name)])
+        for queue_name in queue_names
+    ]
+
+    def stop_workers(signum, frame):
+        for worker in workers:
+            worker.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+
+    # If one worker exits, stop the rest so the container restarts as a unit.
+    exit_code = 0
+    while workers:
+        pid, status = os.wait()
+        exited = [worker for worker in workers if worker.pid == pid]
+        if not exited:
+            continue
+        workers.remove(exited[0])
+        exit_code = exit_code or os.waitstatus_to_exitcode(status)
+        stop_workers(signal.SIGTERM, None)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    run_workers(sys.argv[1:])
@@ -66,6 +66,9 @@ if MINIO_ENABLED is True:
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # uvicorn does not serve static files (runserver did): admin and DRF assets come from
+    # STATIC_ROOT, filled by collectstatic in the server entrypoint.
+    "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -73,6 +76,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "api.middleware.ViewMetricsMiddleware",
 ]
 
 ROOT_URLCONF = "server.urls"
@@ -146,6 +150,8 @@ CORS_ALLOW_ALL_ORIGINS = True
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
 STATIC_URL = "static/"
+STATIC_ROOT = env('STATIC_ROOT',
+                  default=str(Path(__file__).resolve().parent.parent / "staticfiles"))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -157,9 +163,137 @@ CELERY_BROKER_URL = env('CELERY_BROKER_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND', default='redis://localhost:6379/0')
 CELERY_TASK_TRACK_STARTED = True
 
+# Ingest tasks are routed to one queue per LoonUpload.file_type so a large cell_images copy
+# cannot starve segmentation conversions or small metadata tasks. celery_app.py starts a
+# separate worker for every queue below, each with its own pool settings. I/O-bound queues
+# use threads, CPU-bound queues use prefork. Exceptions are listed in tasks.QUEUE_OVERRIDES
+# (TrackMate spot tables are converted on the default queue).
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+LOON_WORKER_QUEUES = {
+    'cell_images': {
+        'concurrency': env.int('CELERY_CELL_IMAGES_CONCURRENCY', default=8),
+        'prefetch_multiplier': env.int('CELERY_CELL_IMAGES_PREFETCH_MULTIPLIER', default=1),
+        'pool': env('CELERY_CELL_IMAGES_POOL', default='threads'),
+    },
+    'segmentations': {
+        'concurrency': env.int('CELERY_SEGMENTATIONS_CONCURRENCY', default=4),
+        'prefetch_multiplier': env.int('CELERY_SEGMENTATIONS_PREFETCH_MULTIPLIER', default=1),
+        'pool': env('CELERY_SEGMENTATIONS_POOL', default='prefork'),
+    },
+    'metadata': {
+        'concurrency': env.int('CELERY_METADATA_CONCURRENCY', default=2),
+        'prefetch_multiplier': env.int('CELERY_METADATA_PREFETCH_MULTIPLIER', default=4),
+        'pool': env('CELERY_METADATA_POOL', default='threads'),
+    },
+    # Anything without a dedicated queue.
+    CELERY_TASK_DEFAULT_QUEUE: {
+        'concurrency': env.int('CELERY_DEFAULT_CONCURRENCY', default=2),
+        'prefetch_multiplier': env.int('CELERY_DEFAULT_PREFETCH_MULTIPLIER', default=1),
+        'pool': env('CELERY_DEFAULT_POOL', default='prefork'),
+    },
+}
+
+# Storage lifecycle (api/lifecycle.py). Temp uploads not ingested within the TTL are deleted.
+TEMP_UPLOAD_TTL_HOURS = env.int('TEMP_UPLOAD_TTL_HOURS', default=72)
+# Beat runs embedded in the default queue's worker (see celery_app.py).
+CELERY_RUN_BEAT = env.bool('CELERY_RUN_BEAT', default=True)
+CELERY_BEAT_SCHEDULE = {
+    'expire-temp-uploads': {
+        'task': 'api.tasks.expire_temp_uploads',
+        'schedule': env.int('TEMP_UPLOAD_EXPIRY_INTERVAL', default=60 * 60),
+    },
+    'report-storage-usage': {
+        'task': 'api.tasks.report_storage_usage',
+        'schedule': env.int('STORAGE_USAGE_REPORT_INTERVAL', default=6 * 60 * 60),
+    },
+}
+
+# Ingestion scheduler (api/scheduler.py). Caps the total size of uploads being written to
+# storage at once so concurrent experiment uploads cannot saturate MinIO.
+INGEST_MAX_BYTES_IN_FLIGHT = env.int('INGEST_MAX_BYTES_IN_FLIGHT', default=10 * 1024 ** 3)
+
+# Ingest pipeline (api/pipeline.py): threads running the callback and the storage saves of
+# each zip task, and the number of items buffered between stages.
+PIPELINE_CALLBACK_WORKERS = env.int('PIPELINE_CALLBACK_WORKERS', default=2)
+PIPELINE_SAVE_WORKERS = env.int('PIPELINE_SAVE_WORKERS', default=4)
+PIPELINE_QUEUE_SIZE = env.int('PIPELINE_QUEUE_SIZE', default=16)
+# Zip members per call of a batch callback (segmentation ROIs are decoded in batches).
+ZIP_BATCH_SIZE = env.int('ZIP_BATCH_SIZE', default=256)
+
+# Segmentation levels of detail (api/processing_callbacks/simplify.py): outline simplification
+# tolerances in image pixels, one simplified copy of every cell per tolerance. Empty to disable.
+SEGMENTATION_LOD_TOLERANCES = env.list('SEGMENTATION_LOD_TOLERANCES', cast=float,
+                                       default=[2.0, 8.0])
+# How cell outlines are serialized: "geojson", or "packed" integer offsets from each cell's
+# bounding box (see api/processing_callbacks/encoding.py; the viewer reads both).
+SEGMENTATION_ENCODING = env('SEGMENTATION_ENCODING', default='geojson')
+# Whether segmentation ingest writes the per-cell shape features table that the composite
+# table joins (see api/processing_callbacks/morphology.py).
+SEGMENTATION_MORPHOLOGY = env.bool('SEGMENTATION_MORPHOLOGY', default=True)
+
+# Retries of transient storage errors (api/storage.py). Each storage call is retried in place
+# first; if that is not enough the whole ingest task is retried by Celery. Both use
+# exponential backoff with jitter; backoff values are in seconds.
+STORAGE_RETRY_ATTEMPTS = env.int('STORAGE_RETRY_ATTEMPTS', default=5)
+STORAGE_RETRY_BACKOFF = env.float('STORAGE_RETRY_BACKOFF', default=0.5)
+STORAGE_RETRY_BACKOFF_MAX = env.float('STORAGE_RETRY_BACKOFF_MAX', default=30.0)
+TASK_MAX_RETRIES = env.int('TASK_MAX_RETRIES', default=3)
+TASK_RETRY_BACKOFF = env.float('TASK_RETRY_BACKOFF', default=60.0)
+TASK_RETRY_BACKOFF_MAX = env.float('TASK_RETRY_BACKOFF_MAX', default=900.0)
+
+# Tasks that need another upload's output first (TrackMate segmentations need the location's
+# table) check again every DEPENDENCY_POLL_SECONDS, at most DEPENDENCY_MAX_POLLS times.
+DEPENDENCY_POLL_SECONDS = env.int('DEPENDENCY_POLL_SECONDS', default=30)
+DEPENDENCY_MAX_POLLS = env.int('DEPENDENCY_MAX_POLLS', default=240)
+
+# Default for the allow_partial upload flag: skip zip members that fail to convert and
+# return a failure report instead of failing the whole upload.
+INGEST_ALLOW_PARTIAL = env.bool('INGEST_ALLOW_PARTIAL', default=False)
+
+# Fraction of ingest tasks profiled even when not requested (api/profiling.py).
+TASK_PROFILE_SAMPLE_RATE = env.float('TASK_PROFILE_SAMPLE_RATE', default=0.0)
+
+# Port of the worker-side Prometheus exporter started by celery_app.py.
+METRICS_WORKER_PORT = env.int('METRICS_WORKER_PORT', default=9808)
+
+# Processing monitor (api/monitor.py, `manage.py processing_monitor`).
+METRICS_MONITOR_PORT = env.int('METRICS_MONITOR_PORT', default=9809)
+MONITOR_INTERVAL = env.int('MONITOR_INTERVAL', default=30)
+MONITOR_INSPECT_TIMEOUT = env.float('MONITOR_INSPECT_TIMEOUT', default=2.0)
+# A task STARTED for longer than this is considered stuck and requeued.
+STUCK_TASK_DEADLINE = env.int('STUCK_TASK_DEADLINE', default=6 * 60 * 60)
+# A STARTED task no worker reports as active is considered lost after this long.
+LOST_TASK_GRACE_PERIOD = env.int('LOST_TASK_GRACE_PERIOD', default=5 * 60)
+MAX_TASK_REQUEUES = env.int('MAX_TASK_REQUEUES', default=2)
+
+# Cache
+# Uses the Redis instance already deployed for Celery. Falls back to local memory if
+# no Redis URL is configured (or, per call, if Redis cannot be reached).
+CACHE_REDIS_URL = env('CACHE_REDIS_URL', default=CELERY_RESULT_BACKEND)
+LOCAL_CACHE = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "loon-local",
+}
+CACHES = {
+    "default": LOCAL_CACHE,
+    "local": LOCAL_CACHE,
+}
+if CACHE_REDIS_URL.startswith('redis'):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": CACHE_REDIS_URL,
+        "KEY_PREFIX": "loon",
+    }
+# Serialized experiment JSON is invalidated by model signals. That only reaches other processes
+# through a shared cache, so it is cached only when Redis is configured, and never in the
+# local-memory fallback. The timeout bounds how long a missed invalidation can last.
+EXPERIMENT_JSON_CACHE_ENABLED = env.bool('EXPERIMENT_JSON_CACHE_ENABLED',
+                                         default=CACHE_REDIS_URL.startswith('redis'))
+EXPERIMENT_JSON_CACHE_TIMEOUT = env.int('EXPERIMENT_JSON_CACHE_TIMEOUT', default=5 * 60)
+
 # Minio Storage
 if MINIO_ENABLED is True:
-    DEFAULT_FILE_STORAGE = "minio_storage.storage.MinioMediaStorage"
+    DEFAULT_FILE_STORAGE = "api.storage.CachedMinioMediaStorage"
     STATICFILES_STORAGE = "minio_storage.storage.MinioStaticStorage"
     MINIO_STORAGE_ENDPOINT = env('MINIO_STORAGE_ENDPOINT', default='localhost:9000')
     MINIO_STORAGE_USE_HTTPS = False
@@ -168,6 +302,12 @@ if MINIO_ENABLED is True:
     MINIO_STORAGE_MEDIA_BUCKET_NAME = env('MINIO_STORAGE_MEDIA_BUCKET_NAME', default='data')
     MINIO_STORAGE_STATIC_BUCKET_NAME = env('MINIO_STORAGE_STATIC_BUCKET_NAME', default='static')
     MINIO_STORAGE_MEDIA_USE_PRESIGNED = True
+    # Presigned URL lifetime (seconds) and how long before expiry a cached URL is dropped.
+    MINIO_STORAGE_MEDIA_URL_EXPIRY = env.int('MINIO_STORAGE_MEDIA_URL_EXPIRY',
+                                             default=7 * 24 * 60 * 60)
+    PRESIGNED_URL_CACHE_MARGIN = env.int('PRESIGNED_URL_CACHE_MARGIN', default=60 * 60)
+    # Read-ahead buffer of the range-request file used to read zip uploads in place.
+    RANGE_READ_AHEAD_BYTES = env.int('RANGE_READ_AHEAD_BYTES', default=8 * 1024 ** 2)
     MINIO_STORAGE_AUTO_CREATE_MEDIA_BUCKET = True
     MINIO_STORAGE_MEDIA_URL = SITE_PREFIX + env('MINIO_STORAGE_MEDIA_URL')
     MINIO_STORAGE_STATIC_URL = SITE_PREFIX + env('MINIO_STORAGE_STATIC_URL')
@@ -17,7 +17,12 @@ Including another URLconf
 
 from django.contrib import admin  # type: ignore
 from django.urls import path, include  # type: ignore
-from api.views import FinishExperimentView, ProcessDataView, VerifyExperimentNameView
+from api.views import (
+    FinishExperimentView,
+    ProcessDataView,
+    VerifyExperimentNameView,
+    metrics_view
+)
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -28,5 +33,6 @@ urlpatterns = [
     path('api/verifyExperimentName/<str:experiment_name>',
          VerifyExperimentNameView.as_view(),
          name="verify-experiment-name"
-         )
+         ),
+    path("metrics", metrics_view, name="metrics")
 ]
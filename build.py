@@ -487,7 +487,7 @@ if __name__ == "__main__":
             if buildConfig.local:
                 services = ["db", "client", "server", "data", "celery", "redis", "duckdb"]
             else:
-                services = ["db", "client", "server", "minio", "celery", "redis", "duckdb"]
+                services = ["db", "client", "server", "minio", "celery", "monitor", "redis", "duckdb"]
 
             # Get current time and create unique logs path
             timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")